@@ -1,26 +1,47 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import JSONResponse, HTMLResponse, Response
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
+from fastapi.responses import JSONResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-import cv2
-import numpy as np
-import supervision as sv
-from roboflow import Roboflow
 from io import BytesIO
 import os
 import uvicorn
 import base64
 import uuid
-from typing import Optional
-import sqlite3
+import json
+import zipfile
+import tempfile
+import shutil
+import asyncio
+import binascii
+import math
+from typing import List, Optional
 from datetime import datetime, timedelta 
-
-def init_db():
-    """Initialize the SQLite database and create tables if they don't exist"""
-    conn = sqlite3.connect('meter_readings.db')
-    cursor = conn.cursor()
-    
-    # Create meter readings table
+from inference import get_backend
+from batching import MicroBatcher, BATCH_MAX_SIZE
+from pipeline import (
+    ImagePipelineError, PIPELINE_EXECUTOR, PIPELINE_WORKERS, decode_image, predict_and_decode_batch, render_result,
+    discard_original, render_stored, render_upload, run_in_executor, run_pipeline, save_original, warm_up
+)
+from decoder import reading_quality
+from result_cache import ResultCache, cache_key, content_hasher
+from jobs import JobQueue, JOB_DATABASE, JOB_POLL_INTERVAL_SECONDS, create_jobs_table
+from database import get_pool, get_writer
+from migrations import migrate
+from image_responses import image_file_response
+from image_store import image_store, media_type
+from uploads import MAX_BATCH_UPLOAD_BYTES, MAX_UPLOAD_BYTES, UploadLimitMiddleware, read_upload
+from metrics import ServerTimingMiddleware, metrics_response, observe_stages, timed
+from tariff import as_units, compute_bill, compute_bills
+from compression import CompressionMiddleware
+from pages import HISTORY_PAGE, UPLOAD_PAGE, render_bill_page, render_bill_section, render_view_page
+from starlette.concurrency import run_in_threadpool
+
+# SQLite database for readings, shared through a connection pool and a group-commit writer
+DATABASE_NAME = "meter_readings.db"
+db_pool = get_pool(DATABASE_NAME)
+db_writer = get_writer(DATABASE_NAME)
+
+def create_reading_tables(cursor):
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS meter_readings (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -32,8 +53,6 @@ def init_db():
         processed_image_path TEXT NOT NULL
     )
     ''')
-    
-    # Create consumption records table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS consumption_records (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -45,49 +64,112 @@ def init_db():
         FOREIGN KEY (previous_reading_id) REFERENCES meter_readings (id)
     )
     ''')
-    
-    conn.commit()
-    conn.close()
+    # Indexes for /view lookups by image and for the date-ordered /history listing
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_meter_readings_image ON meter_readings (image_id, reading_type)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_meter_readings_date ON meter_readings (reading_type, reading_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_consumption_current ON consumption_records (current_reading_id)")
+
+def add_detections_column(cursor):
+    # Databases from before detections were persisted, and still without a schema_version, may have it already
+    columns = {row["name"] for row in cursor.execute("PRAGMA table_info(meter_readings)")}
+    if "detections" not in columns:
+        cursor.execute("ALTER TABLE meter_readings ADD COLUMN detections TEXT")
+
+# Schema history of the readings database; append new versions, never edit applied ones.
+# Version 1 uses IF NOT EXISTS so databases created before migrations adopt it as their baseline.
+MIGRATIONS = [
+    (1, "meter_readings and consumption_records", create_reading_tables),
+    (2, "meter_readings.detections", add_detections_column),
+    (3, "prediction_jobs", create_jobs_table),
+]
 
-def save_meter_reading(image_id, reading_value, reading_type, original_path, processed_path):
-    """Save a meter reading to the database"""
-    conn = sqlite3.connect('meter_readings.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    INSERT INTO meter_readings 
-    (image_id, reading_value, reading_type, reading_date, original_image_path, processed_image_path)
-    VALUES (?, ?, ?, ?, ?, ?)
-    ''', (image_id, reading_value, reading_type, datetime.now(), original_path, processed_path))
+def init_db():
+    """Apply any pending schema migrations to the SQLite database"""
+    # A JOB_DATABASE of its own gets the same schema history, so its jobs table is migrated too
+    for database in dict.fromkeys([DATABASE_NAME, JOB_DATABASE]):
+        applied = migrate(database, MIGRATIONS)
+        if applied:
+            print(f"Migrated {database} to schema version {applied[-1]}")
+
+# The save_* helpers run inside a db_writer transaction: call them through
+# db_writer.run() so concurrent requests share one commit.
+def save_meter_reading(cursor, image_id, reading_value, reading_type, original_path, processed_path, detections=None):
+    """Save a meter reading, with the detections its result image is rendered from, to the database"""
+    with timed("sqlite_insert_reading"):
+        cursor.execute('''
+        INSERT INTO meter_readings 
+        (image_id, reading_value, reading_type, reading_date, original_image_path, processed_image_path, detections)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            image_id, reading_value, reading_type, datetime.now(), original_path, processed_path,
+            json.dumps(detections) if detections is not None else None
+        ))
     
     # Get the ID of the inserted reading
-    reading_id = cursor.lastrowid
-    
-    conn.commit()
-    conn.close()
-    
-    return reading_id
+    return cursor.lastrowid
 
-def save_consumption_record(current_reading_id, previous_reading_id, consumption_value):
+def save_consumption_record(cursor, current_reading_id, previous_reading_id, consumption_value):
     """Save a consumption record to the database"""
-    conn = sqlite3.connect('meter_readings.db')
-    cursor = conn.cursor()
+    with timed("sqlite_insert_consumption"):
+        cursor.execute('''
+        INSERT INTO consumption_records 
+        (current_reading_id, previous_reading_id, consumption_value, calculation_date)
+        VALUES (?, ?, ?, ?)
+        ''', (current_reading_id, previous_reading_id, consumption_value, datetime.now()))
     
-    cursor.execute('''
-    INSERT INTO consumption_records 
-    (current_reading_id, previous_reading_id, consumption_value, calculation_date)
-    VALUES (?, ?, ?, ?)
-    ''', (current_reading_id, previous_reading_id, consumption_value, datetime.now()))
-    
-    consumption_id = cursor.lastrowid
-    
-    conn.commit()
-    conn.close()
-    
-    return consumption_id
+    return cursor.lastrowid
+
+def save_prediction_results(cursor, results):
+    """
+    Save the readings and consumption records of one or more predictions.
+    Each result is a dict with image_id, meter_reading, detections, previous_meter_reading and consumption.
+    """
+    for result in results:
+        image_id = result["image_id"]
+        current_reading_id = save_meter_reading(
+            cursor, image_id, result["meter_reading"], "current",
+            image_store.path(image_id, "current"), image_store.path(image_id, "current", processed=True),
+            result["detections"]
+        )
+        if result["previous_meter_reading"] is None:
+            continue
+        
+        # No image files for a manually entered previous reading - using string "None" instead of None
+        previous_reading_id = save_meter_reading(
+            cursor, image_id, result["previous_meter_reading"], "previous", "None", "None"
+        )
+        if isinstance(result["consumption"], float):
+            save_consumption_record(cursor, current_reading_id, previous_reading_id, result["consumption"])
+
+def update_image_paths(cursor, changes):
+    """Point readings at images the store moved, or at "None" for evicted ones"""
+    for image_id, old_path, new_path in changes:
+        for column in ("original_image_path", "processed_image_path"):
+            cursor.execute(f'''
+            UPDATE meter_readings SET {column} = ?
+            WHERE image_id = ? AND {column} = ?
+            ''', (new_path or "None", image_id, old_path))
+    
+    # A result image that was never rendered can't be once its original has left the store
+    for image_id, old_path, new_path in changes:
+        if old_path.endswith("_result.jpg") or (new_path and new_path.startswith(image_store.root + os.sep)):
+            continue
+        cursor.execute('''
+        UPDATE meter_readings SET processed_image_path = 'None'
+        WHERE image_id = ? AND processed_image_path = ?
+        ''', (image_id, os.path.splitext(old_path)[0] + "_result.jpg"))
 
 app = FastAPI()
 
+# Largest /bills/compute request body; a million consumption values is about 20 MB of JSON
+MAX_BILLS_REQUEST_BYTES = int(os.environ.get("MAX_BILLS_REQUEST_BYTES", str(128 * 1024 * 1024)))
+
+# Refuse oversized uploads before they are buffered; added first so 413s still get CORS headers
+app.add_middleware(
+    UploadLimitMiddleware,
+    limits={"/predict/batch": MAX_BATCH_UPLOAD_BYTES, "/bills/compute": MAX_BILLS_REQUEST_BYTES}
+)
+
 # Add CORS middleware to allow frontend access
 app.add_middleware(
     CORSMiddleware,
@@ -97,143 +179,198 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create a directory to store temporary images
-os.makedirs("temp_images", exist_ok=True)
+# Compress HTML and JSON responses; inside ServerTimingMiddleware so compression shows in the total
+app.add_middleware(CompressionMiddleware)
+
+# Per-stage timings in a Server-Timing header; added last so it is outermost and its total covers the whole request
+app.add_middleware(ServerTimingMiddleware)
 
-# Serve static files
-app.mount("/images", StaticFiles(directory="temp_images"), name="images")
 # Mount static files directory
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Initialize Roboflow with API key
-rf = Roboflow(api_key="q9HVBUN26Y1xU5uFjRWl")
-project = rf.workspace().project("electricity-meter-reading")
-model = project.version(2).model
+# Keep a verbatim copy of each uploaded original next to its result image
+PERSIST_ORIGINALS = os.environ.get("PERSIST_ORIGINALS", "1") == "1"
+
+# Load the configured inference backend (roboflow, onnx or fake) once at import; under gunicorn
+# with preload_app (gunicorn.conf.py) that is once in the master, shared by the forked workers
+backend = get_backend()
+
+# Run one synthetic prediction in each worker at startup, so the first request doesn't pay for
+# cold model state. /ready answers 503 until it has succeeded; failures are retried.
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "1") == "1"
+WARMUP_RETRY_SECONDS = float(os.environ.get("WARMUP_RETRY_SECONDS", "10"))
+warmup = {"done": not WARMUP_ON_STARTUP, "error": None}
+_warmup_retry = None
+
+# Group concurrent predictions into batches when BATCH_MAX_SIZE > 1, decoding each batch in one go.
+# Batches run in the pipeline executor, so inference stays within PIPELINE_WORKERS.
+batcher = MicroBatcher(predict_and_decode_batch, run=run_in_executor) if BATCH_MAX_SIZE > 1 else None
+
+# Results of previous uploads, keyed by image content and model version
+result_cache = ResultCache()
+
+# Bulk prediction settings
+BATCH_PREDICT_CONCURRENCY = int(os.environ.get("BATCH_PREDICT_CONCURRENCY", "4"))
+BATCH_DB_CHUNK_SIZE = int(os.environ.get("BATCH_DB_CHUNK_SIZE", "50"))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# Queue for /predict?async_mode=true, drained by workers started with the app
+job_queue = JobQueue()
 
 @app.get("/")
 async def health_check():
     return {"status": "healthy"}
 
-async def process_meter_image(image_content, image_id, image_type):
+@app.get("/ready")
+async def readiness_check():
     """
-    Process a meter image with Roboflow model and return the reading
+    Readiness for load balancers: 200 once this worker has warmed up the model, 503 until then
     """
-    # Read image
-    np_img = np.frombuffer(image_content, np.uint8)
-    img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
-    
-    if img is None:
-        raise HTTPException(status_code=400, detail=f"Invalid {image_type} image format")
-
-    # Define file paths
-    temp_path = f"temp_images/{image_id}_{image_type}.jpg"
-    result_path = f"temp_images/{image_id}_{image_type}_result.jpg"
-    
-    # Save temp image
-    cv2.imwrite(temp_path, img)
+    if not warmup["done"]:
+        return JSONResponse(status_code=503, content={"status": "warming up", "error": warmup["error"]})
+    return {"status": "ready", "model_version": backend.model_version}
 
+async def warm_up_pipeline():
+    """Run warm_up() where requests will run it, in every worker of a process pool; returns whether it succeeded"""
+    runs = PIPELINE_WORKERS if PIPELINE_EXECUTOR == "process" else 1
     try:
-        # Run prediction using Roboflow model
-        result = model.predict(temp_path, confidence=40, overlap=30).json()["predictions"]
+        with timed("warmup"):
+            await asyncio.gather(*(run_in_executor(warm_up) for _ in range(runs)))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Prediction failed for {image_type} image: {str(e)}")
-
-    # Extract bounding box info
-    detections_data = []
-    for i, pred in enumerate(result):
-        x = pred['x']
-        y = pred['y']
-        w = pred['width']
-        h = pred['height']
-        confidence = pred['confidence']
-        class_label = pred['class']
-
-        x1 = x - w / 2
-        y1 = y - h / 2
-        x2 = x + w / 2
-        y2 = y + h / 2
-
-        detections_data.append((x1, class_label, [x1, y1, x2, y2], confidence, i))
-
-    # Sort detections by x1 coordinate (left to right)
-    detections_data.sort(key=lambda x: x[0])
-
-    # Extract sorted values
-    labels = [d[1] for d in detections_data]
-    boxes = np.array([d[2] for d in detections_data]) if detections_data else np.empty((0, 4))
-    confidence_scores = np.array([d[3] for d in detections_data]) if detections_data else np.empty(0)
-    class_ids = np.array([d[4] for d in detections_data]) if detections_data else np.empty(0)
-
-    # Create Supervision Detections object
-    detections = sv.Detections(
-        xyxy=boxes,
-        confidence=confidence_scores,
-        class_id=class_ids
-    )
-
-    # Convert sorted labels to a single integer meter reading
-    meter_reading = "".join(labels)
+        warmup["error"] = str(e)
+        print(f"Warm-up failed: {e}")
+        return False
+    warmup.update(done=True, error=None)
+    return True
 
-    # Annotate image
-    label_annotator = sv.LabelAnnotator()
-    bounding_box_annotator = sv.BoxAnnotator()
-    annotated_image = bounding_box_annotator.annotate(scene=img.copy(), detections=detections)
-    annotated_image = label_annotator.annotate(scene=annotated_image, detections=detections, labels=labels)
+async def retry_warm_up():
+    while not await warm_up_pipeline():
+        await asyncio.sleep(WARMUP_RETRY_SECONDS)
 
-    # Resize final image
-    new_width = 600
-    new_height = 300
-    resized_image = cv2.resize(annotated_image, (new_width, new_height))
+async def process_meter_image(image_content, image_id, image_type, render=False):
+    """
+    Process a meter image with the inference backend and return the reading and detections.
+    The CPU-bound work runs in the pipeline executor; the event loop only awaits it.
+    The annotated result image is only rendered now when render is set.
+    """
+    # The original is written alongside inference, which works on the in-memory image,
+    # and removed again if the upload can't be decoded or predicted
+    saved = save_original(image_content, image_id, image_type) if PERSIST_ORIGINALS else None
 
-    # Save the processed image
-    cv2.imwrite(result_path, resized_image)
+    try:
+        # With batching, decode in the executor and share a batched inference call.
+        # Worker processes keep their own backend, so the process executor always runs the whole pipeline.
+        if not batcher or PIPELINE_EXECUTOR == "process":
+            result = await run_in_executor(run_pipeline, image_content, image_id, image_type, render)
+            observe_stages(result.pop("timings"))
+        else:
+            with timed("decode"):
+                img, scale = await run_in_executor(decode_image, image_content, image_type)
+            try:
+                # Run prediction and decoding for the whole batch; the time includes waiting for the batch to fill
+                with timed("inference"):
+                    decoded = await batcher.submit((img, scale))
+            except Exception as e:
+                raise ImagePipelineError(500, f"Prediction failed for {image_type} image: {str(e)}")
+
+            meter_reading, detections = decoded["meter_reading"], decoded["detections"]
+            processed_image = None
+            if render:
+                timings = {}
+                processed_image = await run_in_executor(
+                    render_result, img, detections, image_id, image_type, scale, timings
+                )
+                observe_stages(timings)
+            result = {"meter_reading": meter_reading, "detections": detections, "processed_image": processed_image}
+    except ImagePipelineError as e:
+        if saved:
+            await discard_original(saved, image_id, image_type)
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    if saved and not render:
+        # The result image will be rendered from the stored original, so it must be on disk first
+        await saved
+    return result
+
+async def cached_meter_image(image_content, content_key, image_id, image_type, render=False):
+    """
+    Return the cached reading for an identical earlier upload, saving the original under the new image_id.
+    Returns None on a miss.
+    """
+    with timed("cache_lookup"):
+        entry = await result_cache.get(content_key)
+    if entry is None:
+        return None
 
-    # Convert image to base64 for direct embedding
-    _, img_encoded = cv2.imencode('.jpg', resized_image)
-    img_base64 = base64.b64encode(img_encoded).decode("utf-8")
+    saved = save_original(image_content, image_id, image_type) if PERSIST_ORIGINALS else None
 
-    # Generate URLs
-    image_url = f"/images/{image_id}_{image_type}.jpg"
-    result_url = f"/images/{image_id}_{image_type}_result.jpg"
+    processed_image = None
+    if render:
+        try:
+            processed_image, timings = await run_in_executor(
+                render_upload, image_content, entry["detections"], image_id, image_type
+            )
+            observe_stages(timings)
+        except ImagePipelineError as e:
+            if saved:
+                await discard_original(saved, image_id, image_type)
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+    elif saved:
+        await saved
+
+    return {"meter_reading": entry["meter_reading"], "detections": entry["detections"], "processed_image": processed_image}
+
+async def cache_meter_result(content_key, result):
+    """Store a fresh process_meter_image result for later identical uploads"""
+    await result_cache.put(
+        content_key,
+        result["meter_reading"],
+        result["detections"]
+    )
 
-    return {
-        "meter_reading": meter_reading,
-        "processed_image_base64": img_base64,
-        "original_image_url": image_url,
-        "processed_image_url": result_url,
-    }
+async def predict_meter_image(image_content, image_id, image_type="current", render=False, content_key=None):
+    """
+    Return the reading, detections, per-digit confidences, validity flag and image URLs for an uploaded image,
+    from the result cache when possible.
+    processed_image holds the annotated JPEG bytes when render is set and None otherwise;
+    the result image URL renders it on first request either way.
+    content_key is the upload's cache_key() when it was already hashed while reading.
+    """
+    content_key = content_key or cache_key(image_content, backend.model_version)
+    result = await cached_meter_image(image_content, content_key, image_id, image_type, render)
+    if result is None:
+        result = await process_meter_image(image_content, image_id, image_type, render)
+        await cache_meter_result(content_key, result)
+
+    result.update(reading_quality(result["meter_reading"], result["detections"]))
+    result["original_image_url"] = image_store.url(image_id, image_type)
+    result["processed_image_url"] = f"/image/{image_id}/{image_type}"
+    return result
+
+def calculate_consumption(current_reading, previous_reading):
+    """Consumption between two readings, or an explanation when they are not numeric"""
+    try:
+        return float(current_reading) - float(previous_reading)
+    except (ValueError, TypeError):
+        # Handle case where readings are not numeric
+        return "Could not calculate (non-numeric readings)"
 
-@app.post("/predict")
-async def predict(
-    current_image: UploadFile = File(...),
-    previous_meter_reading: Optional[float] = Form(None)
-):
+async def run_prediction(current_contents, previous_meter_reading=None, image_id=None, response_mode="full", content_key=None):
     """
-    Process meter image and return detected reading
+    Predict the reading for an uploaded image, save it with the optional previous reading
+    and return the /predict response body with the annotated JPEG bytes.
+    Only the "full" response mode embeds the image in the body as base64. The "urls" mode leaves
+    rendering to the first request for the result image, so the processed image bytes are None.
     """
     # Generate a unique ID for this image set
-    image_id = str(uuid.uuid4())
-    
-    # Create temp directory if it doesn't exist
-    os.makedirs("temp_images", exist_ok=True)
-    
-    # Process current meter image
-    current_contents = await current_image.read()
-    current_result = await process_meter_image(current_contents, image_id, "current")
+    image_id = image_id or str(uuid.uuid4())
     
-    # Save current reading to database
-    current_reading_id = save_meter_reading(
-        image_id, 
-        current_result["meter_reading"], 
-        "current",
-        f"temp_images/{image_id}_current.jpg",
-        f"temp_images/{image_id}_current_result.jpg"
-    )
+    # Process current meter image; without a stored original the result image can't be rendered later
+    render = response_mode != "urls" or not PERSIST_ORIGINALS
+    current_result = await predict_meter_image(current_contents, image_id, render=render, content_key=content_key)
     
     # Process previous meter reading if provided as a direct value
     previous_result = None
-    previous_reading_id = None
-
     if previous_meter_reading is not None:
         # Create result dictionary with the manually entered reading
         previous_result = {
@@ -242,71 +379,530 @@ async def predict(
             "original_image_url": None,
             "processed_image_url": None
         }
-        
-        # Save previous reading to database
-        previous_reading_id = save_meter_reading(
-            image_id, 
-            previous_result["meter_reading"], 
-            "previous",
-            "None",  # No image file path - using string "None" instead of None
-            "None"   # No result image path - using string "None" instead of None
-        )
     
     # Calculate consumption if both readings are available
     consumption = None
     if previous_result:
-        try:
-            current_reading = float(current_result["meter_reading"])
-            previous_reading = float(previous_result["meter_reading"])
-            consumption = current_reading - previous_reading
-            
-            # Save consumption record to database
-            if current_reading_id and previous_reading_id:
-                save_consumption_record(current_reading_id, previous_reading_id, consumption)
-                
-        except (ValueError, TypeError):
-            # Handle case where readings are not numeric
-            consumption = "Could not calculate (non-numeric readings)"
+        consumption = calculate_consumption(current_result["meter_reading"], previous_result["meter_reading"])
     
-    return JSONResponse(content={
-        "current": {
+    # Save the readings and consumption record in one write
+    with timed("sqlite_commit"):
+        await db_writer.run(save_prediction_results, [{
+            "image_id": image_id,
             "meter_reading": current_result["meter_reading"],
-            "processed_image_base64": current_result["processed_image_base64"],
-            "original_image_url": current_result["original_image_url"],
-            "processed_image_url": current_result["processed_image_url"],
-        },
+            "detections": current_result["detections"],
+            "previous_meter_reading": previous_meter_reading,
+            "consumption": consumption,
+        }])
+    
+    current = {
+        "meter_reading": current_result["meter_reading"],
+        "digit_confidences": current_result["digit_confidences"],
+        "valid": current_result["valid"],
+        "original_image_url": current_result["original_image_url"],
+        "processed_image_url": current_result["processed_image_url"],
+    }
+    if response_mode == "full":
+        current["processed_image_base64"] = base64.b64encode(current_result["processed_image"]).decode("utf-8")
+    elif previous_result:
+        del previous_result["processed_image_base64"]
+    
+    return {
+        "current": current,
         "previous": previous_result if previous_result else None,
         "consumption": consumption,
         "image_id": image_id
-    })
+    }, current_result["processed_image"]
 
-@app.get("/image/{image_id}/{image_type}")
-async def get_image(image_id: str, image_type: str, processed: bool = True):
+async def run_prediction_job(current_contents, previous_meter_reading):
+    """
+    Job queue handler: the "urls" /predict response body. The job's result is stored in the
+    jobs table, so it links to the annotated image rather than embedding it.
+    """
+    body, _ = await run_prediction(current_contents, previous_meter_reading, response_mode="urls")
+    return body
+
+def multipart_response(body, processed_image, image_id):
+    """multipart/mixed response: the JSON body, then the annotated JPEG as a binary part"""
+    boundary = uuid.uuid4().hex
+    content = b"".join([
+        f"--{boundary}\r\n".encode("ascii"),
+        b'Content-Type: application/json\r\nContent-Disposition: form-data; name="result"\r\n\r\n',
+        json.dumps(body).encode("utf-8"),
+        f"\r\n--{boundary}\r\n".encode("ascii"),
+        b"Content-Type: image/jpeg\r\n",
+        f'Content-Disposition: form-data; name="processed_image"; filename="{image_id}_current_result.jpg"\r\n\r\n'.encode("ascii"),
+        processed_image,
+        f"\r\n--{boundary}--\r\n".encode("ascii"),
+    ])
+    return Response(content=content, media_type=f"multipart/mixed; boundary={boundary}")
+
+@app.post("/predict")
+async def predict(
+    request: Request,
+    current_image: UploadFile = File(...),
+    previous_meter_reading: Optional[float] = Form(None),
+    async_mode: bool = False,
+    response_mode: Optional[str] = None
+):
+    """
+    Process meter image and return detected reading.
+    response_mode picks the response shape:
+      full      - JSON with the annotated image inline as base64 (default)
+      urls      - JSON with image URLs only
+      multipart - multipart/mixed with the JSON (URLs only) and the annotated JPEG as a binary part
+    Without response_mode, an Accept header asking for multipart/mixed selects multipart.
+    With ?async_mode=true the upload is queued instead and a 202 with the job id is returned;
+    poll /jobs/{job_id} or stream /jobs/{job_id}/events for the result.
+    Uploads over MAX_UPLOAD_BYTES are refused with 413.
+    """
+    if response_mode is None:
+        response_mode = "multipart" if "multipart/mixed" in request.headers.get("accept", "") else "full"
+    if response_mode not in ("full", "urls", "multipart"):
+        raise HTTPException(status_code=400, detail="response_mode must be one of full, urls, multipart")
+    
+    # Read in chunks from the spooled upload, hashing for the result cache on the way
+    hasher = content_hasher(backend.model_version)
+    with timed("upload_read"):
+        current_contents = await read_upload(current_image, MAX_UPLOAD_BYTES, hasher)
+    
+    if async_mode:
+        job_id = await job_queue.enqueue(current_contents, previous_meter_reading)
+        return JSONResponse(status_code=202, content={
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/jobs/{job_id}",
+            "events_url": f"/jobs/{job_id}/events"
+        })
+    
+    body, processed_image = await run_prediction(
+        current_contents, previous_meter_reading, response_mode=response_mode, content_key=hasher.hexdigest()
+    )
+    if response_mode == "multipart":
+        return multipart_response(body, processed_image, body["image_id"])
+    return JSONResponse(content=body)
+
+@app.on_event("startup")
+async def start_job_workers():
+    global _warmup_retry
+    # A single read when the schema is current; concurrent workers wait for one to migrate
+    init_db()
+    # Warm up before taking traffic; if the model host is unreachable, keep retrying in the background
+    if WARMUP_ON_STARTUP and not await warm_up_pipeline():
+        _warmup_retry = asyncio.get_running_loop().create_task(retry_warm_up())
+    job_queue.start(run_prediction_job)
+    image_store.start_sweeper(on_change=lambda changes: db_writer.run(update_image_paths, changes))
+    result_cache.start_sweeper()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    if _warmup_retry is not None:
+        _warmup_retry.cancel()
+        await asyncio.gather(_warmup_retry, return_exceptions=True)
+    await job_queue.stop()
+    await image_store.stop_sweeper()
+    await result_cache.stop_sweeper()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Status of a queued prediction; result holds the /predict response once status is done
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-sent events stream with a status event on every change, ending with the finished job
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        status = None
+        while True:
+            job = await job_queue.get(job_id)
+            if job["status"] != status:
+                status = job["status"]
+                yield f"event: status\ndata: {json.dumps(job)}\n\n"
+            if status in ("done", "failed"):
+                return
+            # Woken early when this process finishes the job; otherwise re-check periodically
+            await job_queue.wait(job_id, JOB_POLL_INTERVAL_SECONDS)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+async def stream_batch_predictions(sources, previous_readings, cleanup=None):
+    """
+    Run every (filename, read_contents) source through the prediction pipeline concurrently
+    and yield one NDJSON line per image as it finishes. Database rows are written in one
+    transaction per BATCH_DB_CHUNK_SIZE results.
+    """
+    semaphore = asyncio.Semaphore(BATCH_PREDICT_CONCURRENCY)
+
+    async def run_one(filename, read_contents):
+        async with semaphore:
+            image_id = str(uuid.uuid4())
+            try:
+                contents = read_contents()
+            except HTTPException as e:
+                return {"filename": filename, "status_code": e.status_code, "error": e.detail}, None
+            except (zipfile.BadZipFile, RuntimeError, OSError) as e:
+                # Bad CRC, encrypted or unsupported member: fail this image, not the whole stream
+                return {"filename": filename, "status_code": 400, "error": f"Could not read archive member: {e}"}, None
+            try:
+                result = await predict_meter_image(contents, image_id, render=not PERSIST_ORIGINALS)
+            except HTTPException as e:
+                return {"filename": filename, "status_code": e.status_code, "error": e.detail}, None
+
+        previous_meter_reading = previous_readings.get(filename)
+        consumption = None
+        if previous_meter_reading is not None:
+            consumption = calculate_consumption(result["meter_reading"], previous_meter_reading)
+
+        line = {
+            "filename": filename,
+            "status_code": 200,
+            "image_id": image_id,
+            "current": {
+                "meter_reading": result["meter_reading"],
+                "digit_confidences": result["digit_confidences"],
+                "valid": result["valid"],
+                "original_image_url": result["original_image_url"],
+                "processed_image_url": result["processed_image_url"],
+            },
+            "previous": {"meter_reading": previous_meter_reading} if previous_meter_reading is not None else None,
+            "consumption": consumption,
+        }
+        row = {
+            "image_id": image_id,
+            "meter_reading": result["meter_reading"],
+            "detections": result["detections"],
+            "previous_meter_reading": previous_meter_reading,
+            "consumption": consumption,
+        }
+        return line, row
+
+    tasks = [asyncio.ensure_future(run_one(filename, read_contents)) for filename, read_contents in sources]
+    pending_rows = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            line, row = await next_done
+            if row:
+                pending_rows.append(row)
+            if len(pending_rows) >= BATCH_DB_CHUNK_SIZE:
+                chunk, pending_rows = pending_rows, []
+                try:
+                    await db_writer.run(save_prediction_results, chunk)
+                except Exception as e:
+                    # The lines already went out, so carry on streaming the rest
+                    print(f"Saving {len(chunk)} batch results failed: {e}")
+            yield json.dumps(line) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Keep whatever finished, even if the client went away mid-stream
+        if pending_rows:
+            def report(future, count=len(pending_rows)):
+                if future.exception():
+                    print(f"Saving {count} batch results failed: {future.exception()}")
+            db_writer.submit(save_prediction_results, pending_rows).add_done_callback(report)
+        if cleanup:
+            cleanup()
+
+def is_finite_number(value):
+    """True for an int or float JSON value other than NaN and the infinities"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+@app.post("/predict/batch")
+async def predict_batch(
+    images: List[UploadFile] = File([]),
+    archive: Optional[UploadFile] = File(None),
+    previous_readings: Optional[str] = Form(None)
+):
+    """
+    Process many meter images in one request, given as a multipart list of files and/or a zip archive.
+    previous_readings is an optional JSON object mapping file names to previous meter readings.
+    Streams one NDJSON line per image as it finishes, in completion order.
+    Each image may be up to MAX_UPLOAD_BYTES and the whole request up to MAX_BATCH_UPLOAD_BYTES.
+    """
+    try:
+        previous_readings = json.loads(previous_readings) if previous_readings else {}
+        if not isinstance(previous_readings, dict):
+            raise ValueError
+    except ValueError:
+        raise HTTPException(status_code=400, detail="previous_readings must be a JSON object of file name to reading")
+    # Rows are saved after their lines are streamed, so a bad value must be refused now
+    for filename, reading in previous_readings.items():
+        if reading is not None and not is_finite_number(reading):
+            raise HTTPException(
+                status_code=400,
+                detail=f"previous_readings[{filename!r}] must be a finite number or null"
+            )
+    
+    # Upload files are closed once this handler returns, so read them before streaming
+    sources = []
+    for image in images:
+        contents = await read_upload(image, MAX_UPLOAD_BYTES)
+        sources.append((image.filename, lambda contents=contents: contents))
+    
+    cleanup = None
+    if archive is not None:
+        # Keep a private copy of the archive and read members lazily while streaming
+        archive_copy = tempfile.TemporaryFile()
+        shutil.copyfileobj(archive.file, archive_copy)
+        try:
+            zip_file = zipfile.ZipFile(archive_copy)
+        except zipfile.BadZipFile:
+            archive_copy.close()
+            raise HTTPException(status_code=400, detail="archive is not a valid zip file")
+        
+        def read_member(info):
+            # file_size is the uncompressed size, and zipfile never inflates past it
+            if info.file_size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit")
+            return zip_file.read(info)
+        
+        for info in zip_file.infolist():
+            if info.filename.lower().endswith(IMAGE_EXTENSIONS) and not info.filename.startswith("__MACOSX/"):
+                sources.append((info.filename, lambda info=info: read_member(info)))
+        
+        def cleanup():
+            zip_file.close()
+            archive_copy.close()
+    
+    if not sources:
+        if cleanup:
+            cleanup()
+        raise HTTPException(status_code=400, detail="No images provided")
+    
+    return StreamingResponse(
+        stream_batch_predictions(sources, previous_readings, cleanup),
+        media_type="application/x-ndjson"
+    )
+
+def parse_bill_units(body):
+    """Consumption values from a /bills/compute body"""
+    try:
+        values = json.loads(body)["units"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail='Body must be a JSON object like {"units": [120, 347.5]}')
+    try:
+        return as_units(values)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def price_bills(body):
+    with timed("bill_parse"):
+        units = parse_bill_units(body)
+    with timed("bill_compute"):
+        bills = compute_bills(units)
+    with timed("bill_encode"):
+        return json.dumps({"count": len(units), **{name: values.tolist() for name, values in bills.items()}})
+
+@app.post("/bills/compute")
+async def bills_compute(request: Request):
+    """
+    Price many consumption values in one call.
+    Takes {"units": [...]} and returns energy_charges, cc_subsidy, net_current_charges,
+    new_subsidy and final_bill_amount lists in the same order.
+    """
+    body = await request.body()
+    # Parsing and encoding a large batch is CPU-bound, so keep it off the event loop
+    return Response(content=await run_in_threadpool(price_bills, body), media_type="application/json")
+
+@app.get("/batching/stats")
+async def batching_stats():
+    """
+    Micro-batching counters, including the average batch fill ratio
+    """
+    if not batcher:
+        return {"enabled": False}
+    return {"enabled": True, **batcher.stats()}
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Stage timing histograms in the Prometheus text format
+    """
+    return metrics_response()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Result cache hit/miss counters and memory usage
+    """
+    return result_cache.stats()
+
+# Result images being rendered on demand, so concurrent requests share one render
+_renders = {}
+
+def load_detections(image_id, image_type):
+    """Persisted detections for an image, or None for readings saved without them"""
+    with db_pool.connection() as conn:
+        row = conn.execute('''
+        SELECT detections FROM meter_readings
+        WHERE image_id = ? AND reading_type = ? AND detections IS NOT NULL
+        LIMIT 1
+        ''', (image_id, image_type)).fetchone()
+    return json.loads(row["detections"]) if row else None
+
+async def render_processed_image(image_id, image_type):
+    with timed("load_detections"):
+        detections = load_detections(image_id, image_type)
+    if detections is None:
+        return None
+    try:
+        file_path, timings = await run_in_executor(render_stored, image_id, image_type, detections)
+        observe_stages(timings)
+        return file_path
+    except Exception as e:
+        print(f"Rendering result image for {image_id} failed: {e}")
+        return None
+
+async def processed_image_path(image_id, image_type):
+    """
+    Path of the annotated result image, rendering it from the stored original and
+    persisted detections the first time it is asked for. None if it can't be produced.
+    """
+    file_path = image_store.resolve(image_id, image_type, processed=True)
+    if file_path is not None:
+        return file_path
+
+    key = (image_id, image_type)
+    render = _renders.get(key)
+    if render is None:
+        render = asyncio.ensure_future(render_processed_image(image_id, image_type))
+        _renders[key] = render
+        render.add_done_callback(lambda _: _renders.pop(key, None))
+    # Shielded so a client disconnecting doesn't cancel a render others are waiting on
+    return await asyncio.shield(render)
+
+@app.api_route("/image/{image_id}/{image_type}", methods=["GET", "HEAD"])
+async def get_image(request: Request, image_id: str, image_type: str, processed: bool = True):
     """
     Get the processed or original image by its ID and type (current/previous)
-    Set processed=false to get the original image
+    Set processed=false to get the original image.
+    The file is streamed with ETag/Last-Modified validators, Range support and immutable caching.
+    Processed images are rendered on first request.
     """
-    filename = f"{image_id}_{image_type}_result.jpg" if processed else f"{image_id}_{image_type}.jpg"
-    file_path = f"temp_images/{filename}"
+    if processed:
+        file_path = await processed_image_path(image_id, image_type)
+    else:
+        file_path = image_store.resolve(image_id, image_type)
     
-    if not os.path.exists(file_path):
+    try:
+        if file_path is None:
+            raise FileNotFoundError(image_id)
+        return image_file_response(request, file_path, media_type(file_path))
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Image not found")
-        
-    with open(file_path, "rb") as f:
-        image_data = f.read()
-    
-    return Response(content=image_data, media_type="image/jpeg")
+
+@app.api_route("/images/{url_path:path}", methods=["GET", "HEAD"])
+async def get_stored_image(request: Request, url_path: str):
+    """
+    Stored images at the URLs image_store.url() hands out, looked up by image id and type
+    rather than served as static files, so they survive the store compacting originals to WebP
+    """
+    file_path = image_store.resolve_url(url_path)
+    try:
+        if file_path is None:
+            raise FileNotFoundError(url_path)
+        return image_file_response(request, file_path, media_type(file_path))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+def encode_history_cursor(reading_date, reading_id):
+    return base64.urlsafe_b64encode(f"{reading_date}|{reading_id}".encode("utf-8")).decode("ascii")
+
+def decode_history_cursor(cursor):
+    try:
+        reading_date, reading_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return reading_date, int(reading_id)
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_history_date(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO date (YYYY-MM-DD)")
+
+@app.get("/history")
+async def reading_history(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    """
+    Current meter readings, newest first, with their consumption and previous reading.
+    Pages are keyset-paginated: pass next_cursor from one response as cursor for the next.
+    start_date and end_date (inclusive) filter on the reading date.
+    """
+    limit = max(1, min(limit, 500))
+    conditions = ["mr.reading_type = 'current'"]
+    params = []
+    
+    if start_date:
+        conditions.append("mr.reading_date >= ?")
+        params.append(parse_history_date(start_date, "start_date"))
+    if end_date:
+        conditions.append("mr.reading_date < ?")
+        params.append(parse_history_date(end_date, "end_date") + timedelta(days=1))
+    if cursor:
+        # Seek past the last row of the previous page instead of scanning with OFFSET
+        conditions.append("(mr.reading_date, mr.id) < (?, ?)")
+        params.extend(decode_history_cursor(cursor))
+    
+    with db_pool.connection() as conn:
+        rows = conn.execute(f'''
+        SELECT mr.id, mr.image_id, mr.reading_value, mr.reading_date,
+               cr.consumption_value, prev.reading_value AS previous_reading_value
+        FROM meter_readings mr
+        LEFT JOIN consumption_records cr ON cr.current_reading_id = mr.id
+        LEFT JOIN meter_readings prev ON prev.id = cr.previous_reading_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY mr.reading_date DESC, mr.id DESC
+        LIMIT ?
+        ''', (*params, limit + 1)).fetchall()
+    
+    items = [{
+        "id": row["id"],
+        "image_id": row["image_id"],
+        "reading_value": row["reading_value"],
+        "reading_date": row["reading_date"],
+        "previous_reading_value": row["previous_reading_value"],
+        "consumption_value": row["consumption_value"],
+        "view_url": f"/view/{row['image_id']}",
+    } for row in rows[:limit]]
+    
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_history_cursor(last["reading_date"], last["id"])
+    
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/history-page", response_class=HTMLResponse)
+async def history_page(request: Request):
+    """
+    HTML page listing past readings, loading pages from /history; pre-rendered at startup
+    """
+    return HISTORY_PAGE.response(request)
 
 @app.get("/view/{image_id}", response_class=HTMLResponse)
 async def view_result(image_id: str):
     """
     Returns an HTML page displaying the original and processed images
     """
-    # Check if current images exist
-    current_original_path = f"temp_images/{image_id}_current.jpg"
-    current_result_path = f"temp_images/{image_id}_current_result.jpg"
-    
-    if not (os.path.exists(current_original_path) and os.path.exists(current_result_path)):
+    # Check if current images exist, rendering the result image now if it hasn't been yet
+    # The original is only on disk when PERSIST_ORIGINALS is enabled
+    if await processed_image_path(image_id, "current") is None:
         raise HTTPException(status_code=404, detail="Current meter images not found")
     
     # Check if previous images exist - modified for manual entry support
@@ -314,96 +910,48 @@ async def view_result(image_id: str):
     previous_reading = None
     
     # Check database for previous reading info
-    conn = sqlite3.connect('meter_readings.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    # Query for previous reading with the same image_id
-    cursor.execute('''
-    SELECT reading_value
-    FROM meter_readings 
-    WHERE image_id = ? AND reading_type = 'previous'
-    LIMIT 1
-    ''', (image_id,))
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        
+        # Query for previous reading with the same image_id
+        cursor.execute('''
+        SELECT reading_value
+        FROM meter_readings 
+        WHERE image_id = ? AND reading_type = 'previous'
+        LIMIT 1
+        ''', (image_id,))
+        
+        previous_reading_row = cursor.fetchone()
     
-    previous_reading_row = cursor.fetchone()
     if previous_reading_row:
         has_previous = True
         previous_reading = previous_reading_row['reading_value']
     
-    conn.close()
-    
-    # Create HTML content based on available reading
-    previous_section = ""
-    if has_previous:
-        # Check if actual images exist
-        has_previous_images = os.path.exists(f"temp_images/{image_id}_previous.jpg") and os.path.exists(f"temp_images/{image_id}_previous_result.jpg")
-        
-        if has_previous_images:
-            previous_section = f"""
-            <h2>Previous Meter Reading</h2>
-            <div class="image-container">
-                <div class="image-box">
-                    <h3>Original Image</h3>
-                    <img src="/image/{image_id}/previous?processed=false" alt="Previous Meter Original Image" />
-                </div>
-                <div class="image-box">
-                    <h3>Processed Image with Detection</h3>
-                    <img src="/image/{image_id}/previous?processed=true" alt="Previous Meter Processed Image" />
-                </div>
-            </div>
-            """
-        else:
-            previous_section = f"""
-            <h2>Previous Meter Reading</h2>
-            <div class="reading-display">
-                <h3>Manually Entered Reading: {previous_reading}</h3>
-            </div>
-            """
-    
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Meter Reading Result</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; margin: 20px; }}
-            .container {{ display: flex; flex-direction: column; gap: 20px; }}
-            .image-container {{ display: flex; gap: 20px; flex-wrap: wrap; }}
-            .image-box {{ border: 1px solid #ddd; padding: 10px; }}
-            .reading-display {{ border: 1px solid #ddd; padding: 15px; background-color: #f9f9f9; border-radius: 4px; }}
-            h2, h3 {{ color: #333; }}
-            .section {{ margin-bottom: 30px; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>Meter Reading Result</h1>
-            
-            <div class="section">
-                <h2>Current Meter Reading</h2>
-                <div class="image-container">
-                    <div class="image-box">
-                        <h3>Original Image</h3>
-                        <img src="/image/{image_id}/current?processed=false" alt="Current Meter Original Image" />
-                    </div>
-                    <div class="image-box">
-                        <h3>Processed Image with Detection</h3>
-                        <img src="/image/{image_id}/current?processed=true" alt="Current Meter Processed Image" />
-                    </div>
-                </div>
-            </div>
-            
-            {previous_section}
-            
-            <p>Image ID: {image_id}</p>
-            <p><a href="/upload">Upload another image</a></p>
-        </div>
-        <script src="/static/bill-calculator.js"></script>
-    </body>
-    </html>
+    # Show the previous images if they exist, else the manually entered reading
+    has_previous_images = has_previous and bool(
+        image_store.resolve(image_id, "previous") and image_store.resolve(image_id, "previous", processed=True)
+    )
+    return HTMLResponse(content=render_view_page(image_id, previous_reading, has_previous_images))
+
+def bill_readings(current, previous, consumption):
     """
-    return HTMLResponse(content=html_content)
+    Current reading, previous reading and units to bill for /generate-bill, or None when they can't be worked out.
+    Without a previous reading it is derived from the consumption; readings that went backwards
+    (a meter reset or misread) are billed on the absolute difference.
+    """
+    try:
+        current_reading = float(current)
+        if previous:
+            previous_reading = float(previous)
+        elif consumption:
+            previous_reading = current_reading - abs(float(consumption))
+        else:
+            return None
+    except ValueError:
+        return None
+    if not (math.isfinite(current_reading) and math.isfinite(previous_reading)):
+        return None
+    return current_reading, previous_reading, abs(current_reading - previous_reading)
 
 @app.get("/generate-bill", response_class=HTMLResponse)
 async def generate_bill(imageId: str, current: str, previous: Optional[str] = None, consumption: Optional[str] = None):
@@ -426,252 +974,39 @@ async def generate_bill(imageId: str, current: str, previous: Optional[str] = No
         consumption_error = True
         bill_comment = "Error: Could not calculate consumption due to invalid numeric values."
     
+    readings = bill_readings(current, previous, consumption)
+    if readings is None:
+        bill_section = '<div class="error-message">Cannot generate bill: Missing or invalid meter readings.</div>'
+    else:
+        current_reading, previous_reading, units = readings
+        with timed("bill_compute"):
+            bill = compute_bill(units)
+        bill_section = render_bill_section(bill, current_reading, previous_reading)
+    
     # Get the current date for the bill
     current_date = datetime.now().strftime("%B %d, %Y")
     
     # Calculate due date using timedelta correctly
     due_date = (datetime.now() + timedelta(days=30)).strftime("%B %d, %Y")
     
-    # Create HTML content
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Electricity Bill</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; margin: 0; padding: 0; background-color: #f5f5f5; }}
-            .container {{ max-width: 800px; margin: 20px auto; background-color: white; box-shadow: 0 0 10px rgba(0,0,0,0.1); padding: 30px; }}
-            .bill-header {{ display: flex; justify-content: space-between; border-bottom: 2px solid #3498db; padding-bottom: 20px; margin-bottom: 20px; }}
-            .company-info {{ flex: 2; }}
-            .bill-info {{ flex: 1; text-align: right; }}
-            .bill-title {{ color: #3498db; margin-top: 0; }}
-            .customer-section {{ margin-bottom: 30px; padding-bottom: 20px; border-bottom: 1px solid #eee; }}
-            .reading-section {{ margin-bottom: 30px; padding-bottom: 20px; border-bottom: 1px solid #eee; }}
-            .reading-container {{ display: flex; justify-content: space-between; margin-bottom: 15px; }}
-            .reading-box {{ flex: 1; padding: 15px; background-color: #f9f9f9; margin: 0 10px; border-radius: 5px; }}
-            .reading-box:first-child {{ margin-left: 0; }}
-            .reading-box:last-child {{ margin-right: 0; }}
-            .charges-section {{ margin-bottom: 30px; }}
-            .charge-row {{ display: flex; justify-content: space-between; margin-bottom: 10px; }}
-            .total-row {{ display: flex; justify-content: space-between; font-weight: bold; font-size: 1.1em; border-top: 1px solid #ddd; padding-top: 10px; margin-top: 10px; }}
-            .error-message {{ background-color: #ffe0e0; border-left: 4px solid #e74c3c; padding: 10px; margin-bottom: 20px; color: #c0392b; }}
-            .actions {{ margin-top: 30px; text-align: center; }}
-            .btn {{ display: inline-block; padding: 10px 20px; background-color: #3498db; color: white; text-decoration: none; border-radius: 5px; margin: 0 10px; }}
-            .btn:hover {{ background-color: #2980b9; }}
-            .btn-print {{ background-color: #2ecc71; }}
-            .btn-print:hover {{ background-color: #27ae60; }}
-            @media print {{
-                .actions {{ display: none; }}
-                body {{ background-color: white; }}
-                .container {{ box-shadow: none; padding: 0; }}
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="bill-header">
-                <div class="company-info">
-                    <h1 class="bill-title">Electricity Bill</h1>
-                    <p>Energy Provider Company</p>
-                    <p>123 Power Street</p>
-                    <p>support@energyprovider.com | (555) 123-4567</p>
-                </div>
-                <div class="bill-info">
-                    <p><strong>Bill Date:</strong> {current_date}</p>
-                    <p><strong>Bill #:</strong> {imageId[:8]}</p>
-                    <p><strong>Due Date:</strong> {due_date}</p>
-                </div>
-            </div>
-
-            <div class="customer-section">
-                <h2>Customer Information</h2>
-                <p><strong>Account #:</strong> DEMO-ACCOUNT</p>
-                <p><strong>Name:</strong> Demo Customer</p>
-                <p><strong>Service Address:</strong> 456 Sample Avenue</p>
-            </div>
-
-            {f'<div class="error-message">{bill_comment}</div>' if consumption_error else ''}
-
-            <div class="reading-section">
-                <h2>Meter Readings</h2>
-                <div class="reading-container">
-                    <div class="reading-box">
-                        <h3>Current Reading</h3>
-                        <p><strong>Value:</strong> <span id="currentReading">{current}</span></p>
-                        <p><strong>Date:</strong> {current_date}</p>
-                    </div>
-                    
-                    {f"""
-                    <div class="reading-box">
-                        <h3>Previous Reading</h3>
-                        <p><strong>Value:</strong> <span id="previousReading">{previous}</span></p>
-                        <p><strong>Date:</strong> {'N/A'}</p>
-                    </div>
-                    """ if previous else ""}
-                    
-                    <div class="reading-box">
-                        <h3>Consumption</h3>
-                        <p><strong>Value:</strong> <span id="consumptionValue">{abs(float(consumption)) if consumption and not consumption_error else 'N/A'}</span> kWh</p>
-                        <p><strong>Period:</strong> Current billing cycle</p>
-                    </div>
-                </div>
-            </div>
-
-            <div id="bill-container">
-                <!-- Bill details will be dynamically inserted here by bill-calculator.js -->
-            </div>
-            
-            <div class="actions">
-                <a href="javascript:window.print()" class="btn btn-print">Print Bill</a>
-                <a href="/upload" class="btn">Return to Upload</a>
-                <a href="/view/{imageId}" class="btn">View Meter Images</a>
-            </div>
-        </div>
-        
-        <!-- Include the bill-calculator.js script -->
-        <script src="/static/bill-calculator.js"></script>
-        <script>
-            // Call the integration function after the page loads
-            window.addEventListener('load', function() {{
-                console.log("Page loaded. Calling integrateBillCalculator...");
-                integrateBillCalculator();
-            }});
-        </script>
-    </body>
-    </html>
-    """
-    
+    html_content = render_bill_page(
+        imageId,
+        current,
+        previous,
+        str(abs(float(consumption))) if consumption and not consumption_error else "N/A",
+        bill_comment if consumption_error else "",
+        bill_section,
+        current_date,
+        due_date,
+    )
     return HTMLResponse(content=html_content)
 
 @app.get("/upload", response_class=HTMLResponse)
-async def upload_form():
-    """
-    HTML form for uploading current meter image and entering previous reading
-    """
-    html_content = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Upload Meter Images</title>
-        <style>
-            body { font-family: Arial, sans-serif; margin: 20px; max-width: 800px; margin: 0 auto; }
-            form { margin: 0 auto; }
-            .form-group { margin-bottom: 20px; }
-            label { display: block; margin-bottom: 5px; font-weight: bold; }
-            .input-description { color: #666; font-size: 0.9em; margin-top: 3px; }
-            button { padding: 10px 20px; background: #4CAF50; color: white; border: none; cursor: pointer; border-radius: 4px; }
-            button:hover { background: #45a049; }
-            .result { margin-top: 30px; display: none; }
-            .result img { max-width: 100%; border: 1px solid #ddd; }
-            .readings { background: #f9f9f9; padding: 15px; border-radius: 4px; margin-bottom: 20px; }
-            .reading-box { margin-bottom: 15px; }
-            .consumption { font-weight: bold; color: #e67e22; font-size: 1.2em; }
-            .image-section { margin-top: 20px; }
-            h3 { border-bottom: 1px solid #eee; padding-bottom: 5px; }
-            .image-container { display: flex; flex-wrap: wrap; gap: 20px; margin-top: 15px; }
-            .image-box { flex: 1; min-width: 300px; }
-            .heading { display: flex; justify-content: space-between; align-items: center; }
-        </style>
-    </head>
-    <body>
-    
-        <div style="display: flex; justify-content: space-between; align-items: center;">
-            <h1>Electricity Meter Reading Analyzer</h1>
-            <a href="/history-page" style="padding: 8px 15px; background: #3498db; color: white; text-decoration: none; border-radius: 4px;">View Reading History</a>
-        </div>
-        
-        <form id="uploadForm">
-            <div class="form-group">
-                <label for="currentImageFile">Current Meter Reading Image (Required):</label>
-                <input type="file" id="currentImageFile" name="current_image" accept="image/*" required>
-                <div class="input-description">Upload a clear photo of your current meter reading</div>
-            </div>
-            
-            <div class="form-group">
-                <label for="previousMeterReading">Previous Meter Reading (Optional):</label>
-                <input type="number" id="previousMeterReading" name="previous_meter_reading" step="0.01" placeholder="Enter previous reading">
-                <div class="input-description">Enter your previous meter reading to calculate consumption</div>
-            </div>
-            
-            <button type="submit">Analyze Meter Readings</button>
-        </form>
-        
-        <div id="result" class="result">
-            <div class="readings">
-                <div class="reading-box">
-                    <h3>Current Reading: <span id="currentMeterValue"></span></h3>
-                </div>
-                
-                <div id="previousReadingBox" class="reading-box" style="display:none;">
-                    <h3>Previous Reading: <span id="previousMeterValue"></span></h3>
-                </div>
-                
-                <div id="consumptionBox" style="display:none;">
-                    <h3 class="consumption">Consumption: <span id="consumptionValue"></span> units</h3>
-                </div>
-            </div>
-            
-            <div class="image-section">
-                <div class="heading">
-                    <h2>Processed Images</h2>
-                    <a id="viewAllLink" href="" target="_blank">View Full Page</a>
-                </div>
-                
-                <div class="image-container">
-                    <div class="image-box">
-                        <h3>Current Meter Reading</h3>
-                        <img id="currentResultImage" src="" alt="Processed current meter image">
-                    </div>
-                </div>
-            </div>
-        </div>
-
-        <script>
-            // Modify the form submission handler in the upload form HTML
-            document.getElementById('uploadForm').addEventListener('submit', async function(e) {
-                e.preventDefault();
-                
-                const currentFileInput = document.getElementById('currentImageFile');
-                const previousReadingInput = document.getElementById('previousMeterReading');
-                
-                const currentFile = currentFileInput.files[0];
-                const previousReading = previousReadingInput.value.trim();
-                
-                if (!currentFile) {
-                    alert('Please select a current meter image file');
-                    return;
-                }
-                
-                const formData = new FormData();
-                formData.append('current_image', currentFile);
-                
-                if (previousReading) {
-                    formData.append('previous_meter_reading', previousReading);
-                }
-                
-                try {
-                    const response = await fetch('/predict', {
-                        method: 'POST',
-                        body: formData
-                    });
-                    
-                    const data = await response.json();
-                    
-                    // Redirect to the bill page with the readings data
-                    window.location.href = `/generate-bill?imageId=${data.image_id}&current=${data.current.meter_reading}${data.previous ? '&previous=' + data.previous.meter_reading : ''}&consumption=${data.consumption}`;
-                    
-                } catch (error) {
-                    console.error('Error:', error);
-                    alert('An error occurred during processing');
-                }
-            });
-        </script>
-        <script src="/static/bill-calculator.js"></script>
-    </body>
-    </html>
+async def upload_form(request: Request):
     """
-    return HTMLResponse(content=html_content)
+    HTML form for uploading current meter image and entering previous reading, pre-rendered at startup
+    """
+    return UPLOAD_PAGE.response(request)
 
 if __name__ == "__main__":
-    init_db()
     uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
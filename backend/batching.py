@@ -0,0 +1,96 @@
+import asyncio
+import os
+
+# Micro-batching configuration. A max batch size of 1 disables batching.
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "1"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "10"))
+
+
+class MicroBatcher:
+    """
+    Collects concurrent inference calls into batches.
+
+    Callers await submit() with a single input. A background task takes the
+    first queued input, waits up to max_wait_ms for more (never more than
+    max_batch_size in total), runs them through predict_batch in one call,
+    and resolves each caller with its own result. While a batch is running,
+    new calls queue up and form the next batch.
+
+    run is the coroutine function the call goes through, as run(predict_batch, items);
+    by default it runs on the event loop's default executor.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, run=None):
+        self.predict_batch = predict_batch
+        self.run = run or self._run_in_default_executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = None
+        self._worker = None
+
+        # Counters for the fill ratio metric
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = self._queue or asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, item):
+        """Queue one input and wait for its prediction"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        """Wait for the first input, then gather more until the batch is full or the wait expires"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run_in_default_executor(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            items = [item for item, _ in batch]
+            self.batches += 1
+            self.items += len(items)
+
+            try:
+                results = await self.run(self.predict_batch, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        """Batch counters and the average fill ratio (items per batch / max batch size)"""
+        fill_ratio = self.items / (self.batches * self.max_batch_size) if self.batches else 0.0
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "average_batch_size": self.items / self.batches if self.batches else 0.0,
+            "fill_ratio": fill_ratio,
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
@@ -0,0 +1,399 @@
+"""
+Load test for the meter service with the fake inference backend.
+
+Replays a corpus of meter images against /predict, then exercises /image,
+/view and /generate-bill for the readings it created, at each concurrency
+level. The app runs in-process (httpx ASGI transport) or under uvicorn, in a
+scratch working directory so the real databases and images are untouched.
+Reports throughput, p50/p95/p99 latency, SQLite write latency (in-process
+only) and memory, and writes everything as JSON so runs from different
+commits can be compared.
+
+    cd backend
+    python benchmarks/load_test.py --concurrency 1 8 32 --requests 200 --output results.json
+    python benchmarks/load_test.py --mode uvicorn --fake-latency-ms 80 --baseline results.json
+
+App settings (BATCH_MAX_SIZE, PIPELINE_EXECUTOR, ...) are taken from the environment as usual.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ["predict", "image", "view", "generate-bill"]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Environment variables recorded with the results, since they change what is being measured
+SETTING_PREFIXES = (
+    "INFERENCE_", "FAKE_", "PIPELINE_", "BATCH_", "RESULT_CACHE_", "PREPROCESS_", "GROUP_COMMIT_", "SQLITE_",
+    "IMAGE_STORE_", "PERSIST_", "MAX_UPLOAD",
+)
+
+
+def synthetic_corpus(count=8, size=(1280, 720)):
+    """Meter-like JPEGs with a row of digits, for when no corpus is given"""
+    import cv2
+    import numpy as np
+
+    images = []
+    rng = random.Random(0)
+    for _ in range(count):
+        img = np.full((size[1], size[0], 3), 235, np.uint8)
+        reading = "".join(rng.choice("0123456789") for _ in range(5))
+        cv2.putText(img, reading, (size[0] // 8, size[1] // 2), cv2.FONT_HERSHEY_SIMPLEX, 6, (20, 20, 20), 12)
+        images.append(cv2.imencode(".jpg", img)[1].tobytes())
+    return images
+
+
+def load_corpus(corpus_dir):
+    if not corpus_dir:
+        return synthetic_corpus()
+    images = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(corpus_dir, name), "rb") as f:
+                images.append(f.read())
+    if not images:
+        sys.exit(f"No images found in {corpus_dir}")
+    return images
+
+
+def process_memory(pid="self"):
+    """(current RSS, peak RSS) in MB from /proc, or (None, None) where it isn't available"""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    values[key] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return values.get("VmRSS"), values.get("VmHWM")
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))]
+
+    return {
+        "mean": statistics.fmean(ordered),
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "max": ordered[-1],
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Workload:
+    """Builds the requests for each endpoint from the corpus and the readings created so far"""
+
+    def __init__(self, corpus, response_mode, unique_uploads):
+        self.corpus = corpus
+        self.response_mode = response_mode
+        self.unique_uploads = unique_uploads
+        self.readings = []
+        self._upload_counter = itertools.count()
+
+    def upload(self, i):
+        image = self.corpus[i % len(self.corpus)]
+        if self.unique_uploads:
+            # Bytes after the JPEG end marker are ignored by decoders but change the
+            # content hash, so every upload misses the result cache
+            image += next(self._upload_counter).to_bytes(8, "big")
+        return image
+
+    async def predict(self, client, i):
+        response = await client.post(
+            f"/predict?response_mode={self.response_mode}",
+            files={"current_image": (f"meter{i}.jpg", self.upload(i), "image/jpeg")},
+            data={"previous_meter_reading": str(random.randint(0, 9999))},
+        )
+        if response.status_code == 200:
+            body = response.json()
+            self.readings.append((body["image_id"], body["current"]["meter_reading"], body["previous"]["meter_reading"]))
+        return response
+
+    async def image(self, client, i):
+        image_id = self.readings[i % len(self.readings)][0]
+        return await client.get(f"/image/{image_id}/current", params={"processed": i % 2 == 0})
+
+    async def view(self, client, i):
+        return await client.get(f"/view/{self.readings[i % len(self.readings)][0]}")
+
+    async def generate_bill(self, client, i):
+        image_id, current, previous = self.readings[i % len(self.readings)]
+        try:
+            consumption = float(current) - float(previous)
+        except ValueError:
+            consumption = 0
+        return await client.get("/generate-bill", params={
+            "imageId": image_id, "current": current, "previous": previous, "consumption": consumption,
+        })
+
+    def request_for(self, endpoint):
+        return getattr(self, endpoint.replace("-", "_"))
+
+
+async def run_scenario(client, make_request, total, concurrency):
+    """Send total requests from concurrency workers; returns latencies in ms, error count and duration"""
+    latencies = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while (i := next(counter)) < total:
+            started = time.perf_counter()
+            try:
+                response = await make_request(client, i)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+class InProcessTarget:
+    """The app imported into this process and called through httpx's ASGI transport"""
+    mode = "in-process"
+
+    def __init__(self, workdir):
+        os.chdir(workdir)
+        sys.path.insert(0, BACKEND_DIR)
+        import app as app_module
+
+        self.app_module = app_module
+        self.write_latencies = []
+
+        # Time every group-committed write from submission to commit
+        writer = app_module.db_writer
+        run = writer.run
+
+        async def timed_run(fn, *args):
+            started = time.perf_counter()
+            try:
+                return await run(fn, *args)
+            finally:
+                self.write_latencies.append((time.perf_counter() - started) * 1000)
+
+        writer.run = timed_run
+
+    async def __aenter__(self):
+        await self.app_module.app.router.startup()
+        transport = httpx.ASGITransport(app=self.app_module.app)
+        self.client = httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+        await self.app_module.app.router.shutdown()
+
+    def memory(self):
+        return process_memory()
+
+    def take_write_latencies(self):
+        latencies, self.write_latencies = self.write_latencies, []
+        return latencies
+
+    def writer_counters(self):
+        writer = self.app_module.db_writer
+        return {"commits": writer.commits, "writes": writer.writes}
+
+
+class UvicornTarget:
+    """The app served by a uvicorn subprocess"""
+    mode = "uvicorn"
+
+    def __init__(self, workdir):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        env = {**os.environ, "PYTHONPATH": BACKEND_DIR}
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--log-level", "warning"],
+            cwd=workdir, env=env,
+        )
+
+    async def __aenter__(self):
+        self.client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{self.port}", timeout=None)
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                if (await self.client.get("/")).status_code == 200:
+                    return self
+            except httpx.TransportError:
+                pass
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("uvicorn did not start")
+            await asyncio.sleep(0.2)
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+        self.process.terminate()
+        self.process.wait(timeout=30)
+
+    def memory(self):
+        return process_memory(self.process.pid)
+
+    def take_write_latencies(self):
+        return []
+
+    def writer_counters(self):
+        return None
+
+
+async def run_benchmark(args, target):
+    workload = Workload(load_corpus(args.corpus), args.response_mode, not args.allow_cache_hits)
+    results = []
+
+    async with target:
+        # Readings for the read-only endpoints, and a warm pipeline
+        await run_scenario(target.client, workload.predict, args.seed, min(args.seed, 4))
+        target.take_write_latencies()
+        if not workload.readings:
+            raise RuntimeError("Seeding predictions failed; is the app configured correctly?")
+
+        for endpoint in args.endpoints:
+            make_request = workload.request_for(endpoint)
+            for concurrency in args.concurrency:
+                counters_before = target.writer_counters()
+                latencies, errors, duration = await run_scenario(target.client, make_request, args.requests, concurrency)
+                rss, peak_rss = target.memory()
+                write_latencies = target.take_write_latencies()
+                counters_after = target.writer_counters()
+
+                result = {
+                    "endpoint": endpoint,
+                    "concurrency": concurrency,
+                    "requests": len(latencies),
+                    "errors": errors,
+                    "duration_s": duration,
+                    "throughput_rps": len(latencies) / duration if duration else 0.0,
+                    "latency_ms": latency_summary(latencies),
+                    "sqlite_write_latency_ms": latency_summary(write_latencies) or None,
+                    "rss_mb": rss,
+                    "peak_rss_mb": peak_rss,
+                }
+                if counters_before and counters_after and counters_after["writes"] > counters_before["writes"]:
+                    writes = counters_after["writes"] - counters_before["writes"]
+                    result["writes_per_commit"] = writes / (counters_after["commits"] - counters_before["commits"])
+                results.append(result)
+                print_result(result)
+    return results
+
+
+def print_result(result):
+    latency = result["latency_ms"]
+    writes = result["sqlite_write_latency_ms"]
+    print(
+        f"{result['endpoint']:<14}c={result['concurrency']:<4}{result['throughput_rps']:>9.1f} req/s"
+        f"  p50 {latency.get('p50', 0):>8.1f}  p95 {latency.get('p95', 0):>8.1f}  p99 {latency.get('p99', 0):>8.1f} ms"
+        f"  errors {result['errors']:<4}"
+        + (f"  db p95 {writes['p95']:.1f} ms" if writes else "")
+        + (f"  rss {result['rss_mb']:.0f} MB" if result["rss_mb"] else ""),
+        flush=True,
+    )
+
+
+def compare(results, baseline_path):
+    """Print throughput and p95 changes against an earlier run"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    earlier = {(r["endpoint"], r["concurrency"]): r for r in baseline["results"]}
+
+    print(f"\nCompared with {baseline['meta'].get('commit') or baseline_path}:")
+    for result in results:
+        before = earlier.get((result["endpoint"], result["concurrency"]))
+        if not before or not before["throughput_rps"] or not before["latency_ms"]:
+            continue
+        throughput = result["throughput_rps"] / before["throughput_rps"] - 1
+        p95 = result["latency_ms"]["p95"] / before["latency_ms"]["p95"] - 1
+        print(f"{result['endpoint']:<14}c={result['concurrency']:<4}throughput {throughput:+7.1%}   p95 {p95:+7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["in-process", "uvicorn"], default="in-process")
+    parser.add_argument("--corpus", help="directory of meter images (default: synthetic images)")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and concurrency level")
+    parser.add_argument("--seed", type=int, default=20, help="untimed predictions made first for the read endpoints")
+    parser.add_argument("--fake-latency-ms", type=float, default=50, help="simulated model latency")
+    parser.add_argument("--response-mode", choices=["full", "urls", "multipart"], default="full")
+    parser.add_argument("--allow-cache-hits", action="store_true",
+                        help="replay corpus images unchanged, so repeats are served from the result cache")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against the results JSON of an earlier run")
+    args = parser.parse_args()
+
+    # The app reads its settings at import, so these must be in place first
+    os.environ["INFERENCE_BACKEND"] = "fake"
+    os.environ["FAKE_LATENCY_MS"] = str(args.fake_latency_ms)
+
+    workdir = tempfile.mkdtemp(prefix="meter-benchmark-")
+    os.symlink(os.path.join(BACKEND_DIR, "static"), os.path.join(workdir, "static"))
+    cwd = os.getcwd()
+    try:
+        target = InProcessTarget(workdir) if args.mode == "in-process" else UvicornTarget(workdir)
+        results = asyncio.run(run_benchmark(args, target))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "mode": args.mode,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "requests": args.requests,
+            "response_mode": args.response_mode,
+            "unique_uploads": not args.allow_cache_hits,
+            "settings": {k: v for k, v in sorted(os.environ.items()) if k.startswith(SETTING_PREFIXES)},
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
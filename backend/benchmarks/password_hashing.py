@@ -0,0 +1,71 @@
+"""
+Login throughput of each password hashing setting.
+
+Times verify_and_update() (the work of one /token login) for each scheme:rounds setting on
+one core, and with --workers, the aggregate rate of that many worker processes. Use it to
+pick PASSWORD_SCHEMES and PASSWORD_ROUNDS for the hardware the auth service runs on.
+
+    cd backend
+    python benchmarks/password_hashing.py
+    python benchmarks/password_hashing.py --settings sha256_crypt:535000 pbkdf2_sha256:29000 --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import build_context  # noqa: E402
+
+DEFAULT_SETTINGS = [
+    "sha256_crypt:535000", "sha256_crypt:200000", "sha256_crypt:80000",
+    "pbkdf2_sha256:29000", "pbkdf2_sha256:100000", "bcrypt:12", "argon2:3",
+]
+PASSWORD = "correct horse battery staple"
+
+
+def parse_setting(setting):
+    scheme, _, rounds = setting.partition(":")
+    return scheme, int(rounds or 0)
+
+
+def verify_rate(setting, seconds):
+    """Verifications per second of one setting on the calling core"""
+    scheme, rounds = parse_setting(setting)
+    context = build_context([scheme], rounds)
+    hashed = context.hash(PASSWORD)
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        context.verify_and_update(PASSWORD, hashed)
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--settings", nargs="+", default=DEFAULT_SETTINGS, help="scheme:rounds (default: %(default)s)")
+    parser.add_argument("--seconds", type=float, default=3.0, help="time spent on each setting")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for the aggregate rate")
+    args = parser.parse_args()
+
+    print(f"{'setting':<24}{'ms/login':>10}{'logins/s/core':>15}{f'logins/s x{args.workers}':>16}")
+    for setting in args.settings:
+        try:
+            per_core = verify_rate(setting, args.seconds)
+        except Exception as e:
+            # bcrypt and argon2 need their optional backends installed
+            print(f"{setting:<24}  skipped: {e}")
+            continue
+
+        aggregate = per_core
+        if args.workers > 1:
+            with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                aggregate = sum(executor.map(verify_rate, [setting] * args.workers, [args.seconds] * args.workers))
+        print(f"{setting:<24}{1000 / per_core:>10.1f}{per_core:>15.1f}{aggregate:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Latency, peak memory and reading accuracy of each preprocessing setting.
+
+Runs decode + inference over a labelled sample set once per setting, each
+setting in a fresh process so peak RSS is comparable. Labels come from a
+labels.csv (filename,reading) in the sample directory, or else from the part
+of each file name before the first underscore (e.g. 04213_meter7.jpg).
+
+    cd backend
+    INFERENCE_BACKEND=onnx python benchmarks/preprocess_scale.py samples/
+    python benchmarks/preprocess_scale.py samples/ --settings full reduce:640 resize:640 --json results.json
+"""
+import argparse
+import csv
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+DEFAULT_SETTINGS = ["full", "reduce:1280", "reduce:640", "resize:1280", "resize:640", "resize:320"]
+
+
+def load_samples(sample_dir):
+    """[(path, expected reading)] for every image in sample_dir"""
+    labels = {}
+    labels_path = os.path.join(sample_dir, "labels.csv")
+    if os.path.exists(labels_path):
+        with open(labels_path, newline="") as f:
+            labels = {row[0]: row[1].strip() for row in csv.reader(f) if len(row) >= 2}
+
+    samples = []
+    for name in sorted(os.listdir(sample_dir)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            samples.append((os.path.join(sample_dir, name), labels.get(name, name.split("_")[0])))
+    return samples
+
+
+def digit_accuracy(expected, actual):
+    """Share of positions where the readings agree, over the longer of the two"""
+    length = max(len(expected), len(actual))
+    if length == 0:
+        return 1.0
+    return sum(a == b for a, b in zip(expected, actual)) / length
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))]
+
+
+def run_setting(setting, sample_dir, repeat):
+    """Measure one setting in this process and return its results"""
+    from inference import get_backend
+    from pipeline import decode_image, read_detections
+
+    mode, _, max_side = setting.partition(":")
+    max_side = int(max_side or 0)
+    samples = [(path, expected, open(path, "rb").read()) for path, expected in load_samples(sample_dir)]
+    backend = get_backend()
+
+    def predict(image_content):
+        img, scale = decode_image(image_content, "current", mode, max_side)
+        return read_detections(backend.predict(img), scale)[0]
+
+    # Peak RSS growth is measured from here, with the model loaded but no image decoded yet
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Warm up the backend before timing
+    predict(samples[0][2])
+
+    latencies = []
+    exact = 0
+    digits = 0.0
+    for path, expected, image_content in samples:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            reading = predict(image_content)
+            latencies.append((time.perf_counter() - started) * 1000)
+        exact += reading == expected
+        digits += digit_accuracy(expected, reading)
+
+    # Python-level allocations (numpy arrays, including decoded images) per image, measured separately
+    # because tracing slows everything down
+    peak_allocations = []
+    for _, _, image_content in samples:
+        tracemalloc.start()
+        predict(image_content)
+        peak_allocations.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        "setting": setting,
+        "images": len(samples),
+        "latency_ms_mean": statistics.fmean(latencies),
+        "latency_ms_p50": percentile(latencies, 50),
+        "latency_ms_p95": percentile(latencies, 95),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_rss_growth_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss) / 1024,
+        "peak_alloc_mb": max(peak_allocations) / 1024 ** 2,
+        "exact_match": exact / len(samples),
+        "digit_accuracy": digits / len(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sample_dir", help="directory of labelled meter images")
+    parser.add_argument("--settings", nargs="+", default=DEFAULT_SETTINGS,
+                        help="full, reduce:<max side> or resize:<max side> (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per image")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_setting(args.run_one, args.sample_dir, args.repeat)))
+        return
+
+    if not load_samples(args.sample_dir):
+        sys.exit(f"No images found in {args.sample_dir}")
+
+    results = []
+    for setting in args.settings:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), args.sample_dir, "--run-one", setting, "--repeat", str(args.repeat)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'setting':<14}{'mean ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'rss MB':>9}{'+rss MB':>9}{'alloc MB':>10}{'exact':>8}{'digits':>8}")
+    for r in results:
+        print(
+            f"{r['setting']:<14}{r['latency_ms_mean']:>9.1f}{r['latency_ms_p50']:>9.1f}{r['latency_ms_p95']:>9.1f}"
+            f"{r['peak_rss_mb']:>9.1f}{r['peak_rss_growth_mb']:>9.1f}{r['peak_alloc_mb']:>10.1f}"
+            f"{r['exact_match']:>8.1%}{r['digit_accuracy']:>8.1%}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"backend": os.environ.get("INFERENCE_BACKEND", "roboflow"), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
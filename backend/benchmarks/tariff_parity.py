@@ -0,0 +1,111 @@
+"""
+Parity of tariff.py with calculateElectricityBill() in static/bill-calculator.js, and bulk throughput.
+
+Runs the browser calculator under node over a grid of consumption values (every
+hundredth of a unit up to --max-units, slab boundaries and their neighbours, random
+values) and checks that tariff.compute_bills() and compute_bill() give the same
+amounts. Exits non-zero on any mismatch. Then times compute_bills() on --size values.
+
+    cd backend
+    python benchmarks/tariff_parity.py
+    python benchmarks/tariff_parity.py --max-units 5000 --size 10000000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from tariff import CC_SUBSIDY, ENTRY_SCHEDULE, UPPER_SCHEDULE, compute_bill, compute_bills  # noqa: E402
+
+# Evaluates the calculator with stand-ins for the browser globals it touches at load time
+NODE_SCRIPT = r"""
+const fs = require("fs");
+const vm = require("vm");
+const context = { window: { addEventListener() {} }, document: {}, console: { log() {}, error() {} } };
+vm.createContext(context);
+vm.runInContext(fs.readFileSync(process.argv[1], "utf8"), context);
+const units = JSON.parse(fs.readFileSync(0, "utf8"));
+const bills = units.map(u => context.calculateElectricityBill(u));
+process.stdout.write(JSON.stringify({
+    energy_charges: bills.map(b => b.energyCharges),
+    cc_subsidy: bills.map(b => b.ccSubsidy),
+    net_current_charges: bills.map(b => b.netCurrentCharges),
+    new_subsidy: bills.map(b => b.newSubsidy),
+    final_bill_amount: bills.map(b => b.finalBillAmount),
+    slab_amounts: bills.map(b => b.slabCharges.map(s => s.amount)),
+}));
+"""
+
+
+def consumption_grid(max_units, random_count, seed):
+    bounds = {0.0, float(max_units)}
+    for schedule in (ENTRY_SCHEDULE, UPPER_SCHEDULE):
+        bounds.update(float(b) for b in schedule[0] if np.isfinite(b))
+    bounds.update(float(b) for b, _ in CC_SUBSIDY if np.isfinite(b))
+    edges = [b + d for b in sorted(bounds) for d in (-1, -0.5, -0.01, 0, 0.01, 0.5, 1)]
+
+    rng = np.random.default_rng(seed)
+    return np.concatenate((
+        np.arange(0, max_units * 100 + 1) / 100,
+        np.array(edges),
+        rng.uniform(0, max_units, random_count),
+        rng.integers(-50, 0, 10).astype(np.float64),
+    ))
+
+
+def run_js(units):
+    output = subprocess.run(
+        ["node", "-e", NODE_SCRIPT, os.path.join(BACKEND_DIR, "static", "bill-calculator.js")],
+        input=json.dumps(units.tolist()), check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-units", type=int, default=2000, help="upper end of the consumption grid")
+    parser.add_argument("--random", type=int, default=100000, help="random consumption values added to the grid")
+    parser.add_argument("--breakdown-every", type=int, default=97, help="check the slab breakdown of every Nth value")
+    parser.add_argument("--size", type=int, default=1000000, help="values priced per call in the throughput run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    units = consumption_grid(args.max_units, args.random, args.seed)
+    expected = run_js(units)
+    actual = compute_bills(units)
+
+    mismatches = 0
+    for field, values in actual.items():
+        wrong = np.flatnonzero(values != np.array(expected[field]))
+        mismatches += len(wrong)
+        for i in wrong[:5]:
+            print(f"{field}: units={units[i]!r} js={expected[field][i]!r} python={values[i]!r}")
+
+    checked = range(0, len(units), args.breakdown_every)
+    for i in checked:
+        amounts = [slab["amount"] for slab in compute_bill(units[i])["slab_charges"]]
+        if amounts != expected["slab_amounts"][i]:
+            mismatches += 1
+            print(f"slab_charges: units={units[i]!r} js={expected['slab_amounts'][i]!r} python={amounts!r}")
+
+    print(f"{len(units)} bills and {len(checked)} breakdowns compared, {mismatches} mismatches")
+
+    bulk = np.random.default_rng(args.seed).uniform(0, args.max_units, args.size)
+    compute_bills(bulk[:1000])
+    started = time.perf_counter()
+    compute_bills(bulk)
+    elapsed = time.perf_counter() - started
+    print(f"compute_bills: {args.size} values in {elapsed * 1000:.1f} ms ({args.size / elapsed / 1e6:.1f} M bills/s)")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import gzip
+import os
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+
+from metrics import timed
+
+try:
+    import brotli
+except ImportError:  # optional; responses are gzip-only without it
+    brotli = None
+
+# Response compression settings
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "512"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "5"))
+
+# Bodies larger than this are compressed in a worker thread instead of on the event loop
+COMPRESSION_THREAD_BYTES = 256 * 1024
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+
+# Preferred first when the client accepts both equally
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+
+def compress(body, encoding, level=None):
+    """body compressed with encoding ("br" or "gzip"); level defaults to the configured one"""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY if level is None else level)
+    # mtime=0 keeps the output, and so any ETag derived from it, stable
+    return gzip.compress(body, compresslevel=GZIP_LEVEL if level is None else level, mtime=0)
+
+
+def precompress(body):
+    """Every supported encoding of body at maximum compression, for content that is compressed once and served often"""
+    levels = {"br": 11, "gzip": 9}
+    return {encoding: compress(body, encoding, levels[encoding]) for encoding in ENCODINGS}
+
+
+def choose_encoding(accept_encoding, available=ENCODINGS):
+    """
+    The encoding in available the client prefers by its Accept-Encoding header,
+    or "identity" when it accepts none of them.
+    """
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        if coding:
+            weights[coding] = weight
+
+    best, best_weight = "identity", 0.0
+    for encoding in available:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def is_compressible(content_type):
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    Compresses complete HTML, JSON and other text responses with brotli or gzip, as negotiated.
+
+    A response whose body arrives in one message is compressed as a whole. Streamed responses
+    (NDJSON batches, server-sent events) pass through untouched so each chunk still reaches the
+    client as soon as it is sent, as do responses that are already encoded.
+    """
+
+    def __init__(self, app, min_bytes=COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.min_bytes = min_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = choose_encoding(accept_encoding)
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                if not is_compressible(headers.get("content-type", "")) or "content-encoding" in headers:
+                    passthrough = True
+                    await send(message)
+                    return
+                # Caches must key compressible responses on Accept-Encoding, whether or not this one is compressed
+                headers.add_vary_header("Accept-Encoding")
+                # Held back until the first body message shows whether the response is streamed
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            passthrough = True
+            body = message.get("body", b"")
+            if message.get("more_body", False) or encoding == "identity" or len(body) < self.min_bytes:
+                await send(start_message)
+                await send(message)
+                return
+
+            with timed("compress"):
+                if len(body) > COMPRESSION_THREAD_BYTES:
+                    body = await run_in_threadpool(compress, body, encoding)
+                else:
+                    body = compress(body, encoding)
+
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            etag = headers.get("etag")
+            if etag and etag.endswith('"') and not etag.startswith("W/"):
+                # A strong validator belongs to one representation, so each encoding gets its own
+                headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
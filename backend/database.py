@@ -0,0 +1,183 @@
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+# Connection settings shared by the meter and auth services
+SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", "8"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get("GROUP_COMMIT_MAX_BATCH", "64"))
+GROUP_COMMIT_MAX_WAIT_MS = float(os.environ.get("GROUP_COMMIT_MAX_WAIT_MS", "2"))
+
+# WAL lets readers run alongside the single writer; NORMAL sync is durable
+# across application crashes and only fsyncs the WAL at checkpoints.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def connect(database, isolation_level=""):
+    """Open a connection with the shared pragmas applied"""
+    conn = sqlite3.connect(
+        database,
+        check_same_thread=False,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        isolation_level=isolation_level,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """
+    Long-lived connections to one database, handed out one thread at a time.
+    Connections are opened on demand, up to size are kept for reuse.
+    """
+
+    def __init__(self, database, size=SQLITE_POOL_SIZE):
+        self.database = database
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = connect(self.database)
+
+        try:
+            yield conn
+        finally:
+            # Never hand out a connection with a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+
+class GroupCommitWriter:
+    """
+    Serialises writes to one database through a background thread.
+
+    Each submitted call runs as fn(cursor, *args) inside its own savepoint.
+    Calls that queue up while a commit is in progress, or within
+    GROUP_COMMIT_MAX_WAIT_MS of the first one, share a single transaction
+    and a single commit. A failing call only rolls back its own savepoint.
+    """
+
+    def __init__(self, database, max_batch=GROUP_COMMIT_MAX_BATCH, max_wait_ms=GROUP_COMMIT_MAX_WAIT_MS):
+        self.database = database
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.commits = 0
+        self.writes = 0
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"group-commit:{self.database}", daemon=True)
+                self._thread.start()
+
+    def submit(self, fn, *args):
+        """Queue fn(cursor, *args) and return a concurrent.futures.Future for its result"""
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((fn, args, future))
+        return future
+
+    async def run(self, fn, *args):
+        """Queue fn(cursor, *args) and await its result once committed"""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = connect(self.database, isolation_level=None)
+        cursor = conn.cursor()
+        while True:
+            batch = self._collect()
+            results = []
+
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                for fn, args, future in batch:
+                    cursor.execute("SAVEPOINT write")
+                    try:
+                        results.append((future, fn(cursor, *args), None))
+                        cursor.execute("RELEASE write")
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO write")
+                        cursor.execute("RELEASE write")
+                        results.append((future, None, e))
+                cursor.execute("COMMIT")
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.commits += 1
+            self.writes += len(batch)
+            for future, result, error in results:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+
+_pools = {}
+_writers = {}
+
+
+def get_pool(database):
+    """Shared connection pool for a database file"""
+    if database not in _pools:
+        _pools[database] = ConnectionPool(database)
+    return _pools[database]
+
+
+def get_writer(database):
+    """Shared group-commit writer for a database file"""
+    if database not in _writers:
+        _writers[database] = GroupCommitWriter(database)
+    return _writers[database]
+
+
+def _reset_after_fork():
+    # SQLite connections must not be used across fork(), and writer threads don't survive it:
+    # a process forked from one that used the database (e.g. a gunicorn worker) starts afresh
+    for pool in _pools.values():
+        pool._idle = queue.LifoQueue(maxsize=pool._idle.maxsize)
+    for writer in _writers.values():
+        writer._queue = queue.Queue()
+        writer._thread = None
+        writer._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
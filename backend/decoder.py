@@ -0,0 +1,126 @@
+import os
+
+import numpy as np
+
+from inference import CONFIDENCE_THRESHOLD, OVERLAP_THRESHOLD
+
+# Digit decoder configuration
+DECODER_MIN_CONFIDENCE = float(os.environ.get("DECODER_MIN_CONFIDENCE", str(CONFIDENCE_THRESHOLD / 100)))
+DECODER_NMS_IOU = float(os.environ.get("DECODER_NMS_IOU", str(OVERLAP_THRESHOLD / 100)))
+# How far, in digit heights, a digit's centre may sit from the row's centre line
+DECODER_ROW_TOLERANCE = float(os.environ.get("DECODER_ROW_TOLERANCE", "0.5"))
+
+# A reading is flagged valid when it has this many digits, each at least this confident
+DECODER_MIN_DIGITS = int(os.environ.get("DECODER_MIN_DIGITS", "4"))
+DECODER_MAX_DIGITS = int(os.environ.get("DECODER_MAX_DIGITS", "8"))
+DECODER_VALID_CONFIDENCE = float(os.environ.get("DECODER_VALID_CONFIDENCE", "0.5"))
+
+
+def reading_valid(meter_reading, digit_confidences):
+    """Whether a decoded reading looks like a whole, legible meter reading rather than garbage"""
+    return (
+        DECODER_MIN_DIGITS <= len(digit_confidences) <= DECODER_MAX_DIGITS
+        and meter_reading.isdigit()
+        and min(digit_confidences) >= DECODER_VALID_CONFIDENCE
+    )
+
+
+def reading_quality(meter_reading, detections):
+    """Per-digit confidences and validity flag of a reading decoded by decode_batch()"""
+    digit_confidences = [d[4] for d in detections]
+    return {"digit_confidences": digit_confidences, "valid": reading_valid(meter_reading, digit_confidences)}
+
+
+def _pad(predictions_list, scales):
+    """Predictions of each image as (images, boxes) arrays padded to the largest count, and the padding mask"""
+    count = max((len(predictions) for predictions in predictions_list), default=0)
+    values = np.zeros((len(predictions_list), count, 5))
+    labels = np.full((len(predictions_list), count), "", dtype=object)
+    present = np.zeros((len(predictions_list), count), dtype=bool)
+    for i, predictions in enumerate(predictions_list):
+        if predictions:
+            values[i, :len(predictions)] = [(p["x"], p["y"], p["width"], p["height"], p["confidence"]) for p in predictions]
+            labels[i, :len(predictions)] = [p["class"] for p in predictions]
+            present[i, :len(predictions)] = True
+
+    # Centres and sizes are in pixels of the image the model saw; scale them to the original
+    scales = np.asarray(scales, dtype=np.float64).reshape(-1, 1, 2)
+    values[..., 0:4] *= np.tile(scales, 2)
+    return values, labels, present
+
+
+def _nms(x1, y1, x2, y2, candidates, iou_threshold):
+    """
+    Class-agnostic greedy NMS over (images, boxes) arrays already ordered by descending confidence.
+    Loops over box ranks, vectorized across images, so a batch costs as many steps as its most crowded image.
+    """
+    width = np.clip(np.minimum(x2[:, :, None], x2[:, None, :]) - np.maximum(x1[:, :, None], x1[:, None, :]), 0, None)
+    height = np.clip(np.minimum(y2[:, :, None], y2[:, None, :]) - np.maximum(y1[:, :, None], y1[:, None, :]), 0, None)
+    intersection = width * height
+    area = (x2 - x1) * (y2 - y1)
+    union = area[:, :, None] + area[:, None, :] - intersection
+    overlaps = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0) > iou_threshold
+
+    keep = np.zeros_like(candidates)
+    for rank in range(candidates.shape[1]):
+        suppressed = (keep[:, :rank] & overlaps[:, :rank, rank]).any(axis=1)
+        keep[:, rank] = candidates[:, rank] & ~suppressed
+    return keep
+
+
+def _main_row(y1, y2, confidence, keep, tolerance):
+    """Mask of the boxes on each image's main row: the row of digits holding the most total confidence"""
+    centre = (y1 + y2) / 2
+    # same_row[b, i, j]: box j sits on the row through box i
+    same_row = np.abs(centre[:, None, :] - centre[:, :, None]) <= tolerance * (y2 - y1)[:, :, None]
+    same_row &= keep[:, :, None] & keep[:, None, :]
+    anchor = np.argmax((same_row * confidence[:, None, :]).sum(axis=2), axis=1)
+    return same_row[np.arange(len(anchor)), anchor]
+
+
+def decode_batch(predictions_list, scales=None, min_confidence=None, iou_threshold=None, row_tolerance=None):
+    """
+    Decode the raw predictions of a batch of images into meter readings.
+
+    predictions_list holds one list of Roboflow-style predictions per image; scales holds the
+    (x, y) factor from each image's pixels to its original, as returned by decode_image().
+    Predictions under min_confidence are dropped, overlapping boxes of any class are reduced
+    to the most confident by NMS, and digits off the main row (stray detections above or below
+    it) are discarded. Returns one dict per image with meter_reading, detections ([x1, y1, x2,
+    y2, confidence, class] lists, left to right, in original pixels), digit_confidences and valid.
+    """
+    min_confidence = DECODER_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    iou_threshold = DECODER_NMS_IOU if iou_threshold is None else iou_threshold
+    row_tolerance = DECODER_ROW_TOLERANCE if row_tolerance is None else row_tolerance
+    if scales is None:
+        scales = [(1.0, 1.0)] * len(predictions_list)
+
+    values, labels, present = _pad(predictions_list, scales)
+    if not values.shape[1]:
+        # No predictions in any image of the batch, so there is nothing to suppress or cluster
+        return [{"meter_reading": "", "detections": [], **reading_quality("", [])} for _ in predictions_list]
+
+    x, y, w, h, confidence = np.moveaxis(values, -1, 0)
+    candidates = present & (confidence >= min_confidence)
+
+    # Most confident first, so NMS keeps the best of each overlapping group
+    order = np.argsort(np.where(candidates, -confidence, np.inf), axis=1, kind="stable")
+    x, y, w, h, confidence, labels, candidates = (
+        np.take_along_axis(a, order, axis=1) for a in (x, y, w, h, confidence, labels, candidates)
+    )
+    x1, y1, x2, y2 = x - w / 2, y - h / 2, x + w / 2, y + h / 2
+
+    keep = _nms(x1, y1, x2, y2, candidates, iou_threshold)
+    digits = _main_row(y1, y2, confidence, keep, row_tolerance)
+
+    # Left to right, with everything that was dropped sorted to the end
+    order = np.argsort(np.where(digits, x1, np.inf), axis=1, kind="stable")
+    boxes = np.take_along_axis(np.stack([x1, y1, x2, y2, confidence], axis=-1), order[..., None], axis=1)
+    labels = np.take_along_axis(labels, order, axis=1)
+
+    decoded = []
+    for image_boxes, image_labels, count in zip(boxes.tolist(), labels, digits.sum(axis=1)):
+        detections = [[*box, label] for box, label in zip(image_boxes[:count], image_labels[:count])]
+        meter_reading = "".join(image_labels[:count])
+        decoded.append({"meter_reading": meter_reading, "detections": detections, **reading_quality(meter_reading, detections)})
+    return decoded
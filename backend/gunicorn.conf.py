@@ -0,0 +1,37 @@
+"""
+Multi-process serving with gunicorn and uvicorn workers.
+
+    cd backend
+    gunicorn -c gunicorn.conf.py app:app
+    gunicorn -c gunicorn.conf.py main:app --bind 127.0.0.1:5000
+
+The app is imported once in the master (preload_app), so the inference backend, compiled
+pages and other read-only state are loaded there and shared copy-on-write by the forked
+workers instead of each worker loading its own copy, as `uvicorn --workers` does. Modules
+holding connections, threads or process pools reset them in the child (os.register_at_fork).
+Each worker runs its startup hooks (migrations, warm-up inference) before accepting requests.
+"""
+import gc
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Workers warm up the model before their first heartbeat, so allow for a slow model host
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+# Objects the collector touches get their reference counts and GC headers written, which
+# copies the page they live on into the worker. Keep the collector off while the app loads,
+# move everything loaded into the permanent generation before forking, and only then let
+# workers collect their own garbage.
+gc.disable()
+
+
+def when_ready(server):
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    gc.enable()
@@ -0,0 +1,264 @@
+import asyncio
+import os
+import shutil
+import time
+
+import cv2
+
+try:
+    import fcntl
+except ImportError:  # Windows runs a single process, so there is no other sweeper to exclude
+    fcntl = None
+
+# Image store configuration
+IMAGE_STORE_ROOT = os.environ.get("IMAGE_STORE_ROOT", "temp_images")
+# Eviction budgets are opt-in: with both at 0 (the default) customer images are never deleted
+IMAGE_STORE_MAX_BYTES = int(os.environ.get("IMAGE_STORE_MAX_BYTES", "0"))  # 0 puts no limit on the total size
+IMAGE_STORE_MAX_AGE_DAYS = float(os.environ.get("IMAGE_STORE_MAX_AGE_DAYS", "0"))  # 0 keeps images forever
+IMAGE_STORE_SWEEP_INTERVAL_SECONDS = float(os.environ.get("IMAGE_STORE_SWEEP_INTERVAL_SECONDS", "600"))
+IMAGE_STORE_ARCHIVE_DIR = os.environ.get("IMAGE_STORE_ARCHIVE_DIR", "")  # empty deletes evicted images
+IMAGE_STORE_COMPACT_AFTER_DAYS = float(os.environ.get("IMAGE_STORE_COMPACT_AFTER_DAYS", "0"))  # 0 disables
+IMAGE_STORE_COMPACT_QUALITY = int(os.environ.get("IMAGE_STORE_COMPACT_QUALITY", "80"))
+
+HEX_DIGITS = set("0123456789abcdef")
+IMAGE_ID_CHARACTERS = HEX_DIGITS | {"-"}
+MEDIA_TYPES = {".jpg": "image/jpeg", ".webp": "image/webp"}
+SWEEP_LOCK_FILENAME = ".sweep.lock"
+
+
+def image_filename(image_id, image_type, processed, extension=".jpg"):
+    return f"{image_id}_{image_type}_result{extension}" if processed else f"{image_id}_{image_type}{extension}"
+
+
+def media_type(path):
+    return MEDIA_TYPES.get(os.path.splitext(path)[1], "application/octet-stream")
+
+
+class ImageStore:
+    """
+    Original and annotated meter images under one root directory.
+
+    Files are fanned out by the first four hex digits of the image id
+    (root/ab/cd/<image_id>_<type>.jpg) so no single directory grows huge.
+    Files written before sharding stay readable at root/<name>.
+
+    When an operator sets a byte or an age budget, a background sweeper keeps
+    the store within it by deleting (or archiving) whole image sets, oldest
+    first; it can also re-encode old originals to WebP. Every move is reported to on_change so stored
+    paths can be kept in sync. Each worker process starts a sweeper, but a lock file in the root
+    lets only one of them sweep at a time.
+    """
+
+    def __init__(self, root=IMAGE_STORE_ROOT):
+        self.root = root
+        self._made_dirs = set()
+        self._sweeper = None
+        self._sweep_lock = None
+        os.makedirs(self.root, exist_ok=True)
+
+    def _shard(self, image_id):
+        return os.path.join(image_id[:2], image_id[2:4])
+
+    def relative_path(self, image_id, image_type, processed=False):
+        return os.path.join(self._shard(image_id), image_filename(image_id, image_type, processed))
+
+    def path(self, image_id, image_type, processed=False):
+        """Where an image is stored; this is the path recorded in meter_readings"""
+        return os.path.join(self.root, self.relative_path(image_id, image_type, processed))
+
+    def writable_path(self, image_id, image_type, processed=False):
+        """path(), creating its shard directory on first use"""
+        shard_dir = os.path.join(self.root, self._shard(image_id))
+        if shard_dir not in self._made_dirs:
+            os.makedirs(shard_dir, exist_ok=True)
+            self._made_dirs.add(shard_dir)
+        return self.path(image_id, image_type, processed)
+
+    def url(self, image_id, image_type, processed=False):
+        """URL of an image under the /images static mount"""
+        return "/images/" + self.relative_path(image_id, image_type, processed).replace(os.sep, "/")
+
+    def resolve(self, image_id, image_type, processed=False):
+        """Path of an existing image, whether sharded, compacted or from before sharding; None if gone"""
+        shard_dir = os.path.join(self.root, self._shard(image_id))
+        candidates = [os.path.join(shard_dir, image_filename(image_id, image_type, processed))]
+        if not processed:
+            candidates.append(os.path.join(shard_dir, image_filename(image_id, image_type, processed, ".webp")))
+        candidates.append(os.path.join(self.root, image_filename(image_id, image_type, processed)))
+
+        for candidate in candidates:
+            if os.path.exists(candidate):
+                return candidate
+        return None
+
+    def resolve_url(self, url_path):
+        """
+        resolve() for the part of a url() after /images/, so URLs handed out before an original
+        was compacted to WebP keep working. None for anything that isn't a stored image's URL.
+        """
+        name, _ = os.path.splitext(url_path.rsplit("/", 1)[-1])
+        image_id, _, image_type = name.partition("_")
+        # Only the id and type are used, and the id must be a UUID, so the path can't leave the store
+        if len(image_id) != 36 or not set(image_id) <= IMAGE_ID_CHARACTERS or not image_type:
+            return None
+        processed = image_type.endswith("_result")
+        if processed:
+            image_type = image_type[:-len("_result")]
+        return self.resolve(image_id, image_type, processed)
+
+    def _image_sets(self):
+        """Group stored files by image id: {image_id: (newest mtime, total bytes, [paths])}"""
+        directories = [self.root]
+        for first in os.listdir(self.root):
+            if len(first) == 2 and set(first) <= HEX_DIGITS:
+                first_dir = os.path.join(self.root, first)
+                try:
+                    seconds = os.listdir(first_dir)
+                except OSError:
+                    continue
+                for second in seconds:
+                    if os.path.isdir(os.path.join(first_dir, second)):
+                        directories.append(os.path.join(first_dir, second))
+
+        image_sets = {}
+        for directory in directories:
+            try:
+                entries = os.scandir(directory)
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    if not entry.is_file() or len(entry.name) < 37 or entry.name[36] != "_":
+                        continue
+                    try:
+                        stat_result = entry.stat()
+                    except OSError:
+                        # Removed since it was listed
+                        continue
+                    mtime, size, paths = image_sets.get(entry.name[:36], (0, 0, []))
+                    paths.append(entry.path)
+                    image_sets[entry.name[:36]] = (max(mtime, stat_result.st_mtime), size + stat_result.st_size, paths)
+        return image_sets
+
+    def _evict(self, paths):
+        """Delete or archive files; returns [(old_path, new_path or None)] for the ones that went"""
+        changes = []
+        for path in paths:
+            try:
+                if IMAGE_STORE_ARCHIVE_DIR:
+                    archived = os.path.join(IMAGE_STORE_ARCHIVE_DIR, os.path.relpath(path, self.root))
+                    os.makedirs(os.path.dirname(archived), exist_ok=True)
+                    shutil.move(path, archived)
+                    changes.append((path, archived))
+                else:
+                    os.remove(path)
+                    changes.append((path, None))
+            except FileNotFoundError:
+                # Already gone, so its stored path is stale either way
+                changes.append((path, None))
+            except OSError as e:
+                print(f"Evicting {path} failed: {e}")
+        return changes
+
+    def _compact(self, path):
+        """Re-encode an original JPEG as WebP; returns the new path, or None if it couldn't be decoded"""
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            return None
+        compacted = os.path.splitext(path)[0] + ".webp"
+        try:
+            if not cv2.imwrite(compacted, img, [cv2.IMWRITE_WEBP_QUALITY, IMAGE_STORE_COMPACT_QUALITY]):
+                return None
+            # Keep the WebP mtime so age-based eviction still sees the original upload time
+            stat_result = os.stat(path)
+            os.utime(compacted, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
+            os.remove(path)
+        except OSError as e:
+            print(f"Compacting {path} failed: {e}")
+            # Keep whichever copy is complete: the original if it is still there
+            if os.path.exists(path) and os.path.exists(compacted):
+                os.remove(compacted)
+            return compacted if os.path.exists(compacted) else None
+        return compacted
+
+    def sweep(self):
+        """
+        Enforce the age and byte budgets and compact cold originals.
+        Returns the [(image_id, old_path, new_path or None)] changes made.
+        """
+        now = time.time()
+        image_sets = self._image_sets()
+        changes = []
+
+        # Oldest image sets first
+        ordered = sorted(image_sets.items(), key=lambda item: item[1][0])
+        total_bytes = sum(size for _, size, _ in image_sets.values())
+        kept = []
+        for image_id, (mtime, size, paths) in ordered:
+            too_old = IMAGE_STORE_MAX_AGE_DAYS and now - mtime > IMAGE_STORE_MAX_AGE_DAYS * 86400
+            if too_old or (IMAGE_STORE_MAX_BYTES and total_bytes > IMAGE_STORE_MAX_BYTES):
+                changes.extend((image_id, old, new) for old, new in self._evict(paths))
+                total_bytes -= size
+            else:
+                kept.append((image_id, mtime, paths))
+
+        if IMAGE_STORE_COMPACT_AFTER_DAYS:
+            for image_id, mtime, paths in kept:
+                if now - mtime <= IMAGE_STORE_COMPACT_AFTER_DAYS * 86400:
+                    continue
+                for path in paths:
+                    if path.endswith(".jpg") and not path.endswith("_result.jpg"):
+                        compacted = self._compact(path)
+                        if compacted:
+                            changes.append((image_id, path, compacted))
+
+        return changes
+
+    def _hold_sweep_lock(self):
+        """Take the store's sweep lock for this process if no other process holds it"""
+        if fcntl is None or self._sweep_lock is not None:
+            return True
+        lock_file = open(os.path.join(self.root, SWEEP_LOCK_FILENAME), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # Held until the process exits, when another worker's sweeper picks it up
+        self._sweep_lock = lock_file
+        return True
+
+    def _release_sweep_lock(self):
+        if self._sweep_lock is not None:
+            self._sweep_lock.close()
+            self._sweep_lock = None
+
+    async def _sweep_forever(self, on_change):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                if self._hold_sweep_lock():
+                    changes = await loop.run_in_executor(None, self.sweep)
+                    if changes and on_change:
+                        await on_change(changes)
+            except Exception as e:
+                print(f"Image store sweep failed: {e}")
+            await asyncio.sleep(IMAGE_STORE_SWEEP_INTERVAL_SECONDS)
+
+    def start_sweeper(self, on_change=None):
+        """Run sweep() every IMAGE_STORE_SWEEP_INTERVAL_SECONDS, awaiting on_change(changes) after each"""
+        # Nothing to enforce unless an operator set a budget or compaction
+        if not (IMAGE_STORE_MAX_BYTES or IMAGE_STORE_MAX_AGE_DAYS or IMAGE_STORE_COMPACT_AFTER_DAYS):
+            return
+        if self._sweeper is None:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_forever(on_change))
+
+    async def stop_sweeper(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+        self._release_sweep_lock()
+
+
+image_store = ImageStore()
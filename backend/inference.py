@@ -0,0 +1,210 @@
+import os
+import time
+import zlib
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+
+# Inference backend configuration
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "roboflow")
+CONFIDENCE_THRESHOLD = 40  # percent, same scale as the Roboflow API
+OVERLAP_THRESHOLD = 30  # percent
+
+# Roboflow hosted model
+ROBOFLOW_API_KEY = os.environ.get("ROBOFLOW_API_KEY", "q9HVBUN26Y1xU5uFjRWl")
+ROBOFLOW_PROJECT = os.environ.get("ROBOFLOW_PROJECT", "electricity-meter-reading")
+ROBOFLOW_VERSION = int(os.environ.get("ROBOFLOW_VERSION", "2"))
+# Longest side of the frame uploaded to the hosted model. The SDK JPEG-encodes an array at
+# whatever size it is given, and the model only sees its own input size. 0 uploads frames as they are.
+ROBOFLOW_MAX_SIDE = int(os.environ.get("ROBOFLOW_MAX_SIDE", "640"))
+
+# Local ONNX export of the same model
+ONNX_MODEL_PATH = os.environ.get("ONNX_MODEL_PATH", "models/meter-reading.onnx")
+ONNX_INPUT_SIZE = int(os.environ.get("ONNX_INPUT_SIZE", "640"))
+ONNX_CLASS_NAMES = os.environ.get("ONNX_CLASS_NAMES", "0,1,2,3,4,5,6,7,8,9").split(",")
+
+# Fake backend for tests
+FAKE_READING = os.environ.get("FAKE_READING", "")
+FAKE_LATENCY_MS = float(os.environ.get("FAKE_LATENCY_MS", "0"))
+
+
+class InferenceBackend(ABC):
+    """
+    Base class for meter digit detectors.
+
+    predict() takes a decoded BGR image (numpy array) and returns a list of
+    predictions in the Roboflow format: dicts with x, y (box centre), width,
+    height, confidence and class, in pixels of that image.
+    """
+    name = "base"
+    model_version = "unknown"
+
+    @abstractmethod
+    def predict(self, image):
+        """Predictions for one image"""
+
+    def predict_batch(self, images):
+        """Run predict() over several images, one at a time"""
+        return [self.predict(image) for image in images]
+
+
+class RoboflowBackend(InferenceBackend):
+    """Hosted Roboflow model, one HTTP round trip per image"""
+    name = "roboflow"
+
+    def __init__(self):
+        # Imported here so the other backends run without the roboflow package
+        from roboflow import Roboflow
+
+        rf = Roboflow(api_key=ROBOFLOW_API_KEY)
+        project = rf.workspace().project(ROBOFLOW_PROJECT)
+        self.model = project.version(ROBOFLOW_VERSION).model
+        self.model_version = f"roboflow/{ROBOFLOW_PROJECT}/{ROBOFLOW_VERSION}"
+
+    def predict(self, image):
+        height, width = image.shape[:2]
+        upload = image
+        if ROBOFLOW_MAX_SIDE and max(height, width) > ROBOFLOW_MAX_SIDE:
+            ratio = ROBOFLOW_MAX_SIDE / max(height, width)
+            upload = cv2.resize(image, (round(width * ratio), round(height * ratio)), interpolation=cv2.INTER_AREA)
+
+        # The SDK accepts the array directly, so nothing is written to or read back from disk
+        result = self.model.predict(upload, confidence=CONFIDENCE_THRESHOLD, overlap=OVERLAP_THRESHOLD)
+        predictions = result.json()["predictions"]
+
+        # Back to pixels of the image we were given
+        scale_x, scale_y = width / upload.shape[1], height / upload.shape[0]
+        if (scale_x, scale_y) != (1.0, 1.0):
+            for prediction in predictions:
+                prediction["x"] *= scale_x
+                prediction["y"] *= scale_y
+                prediction["width"] *= scale_x
+                prediction["height"] *= scale_y
+        return predictions
+
+
+class OnnxBackend(InferenceBackend):
+    """
+    Local YOLO export of the meter model run in-process with cv2.dnn on CPU.
+    The network is loaded once and kept warm for every request.
+    """
+    name = "onnx"
+
+    def __init__(self, model_path=ONNX_MODEL_PATH, input_size=ONNX_INPUT_SIZE, class_names=ONNX_CLASS_NAMES):
+        if not os.path.exists(model_path):
+            raise RuntimeError(f"ONNX model not found at {model_path}")
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.input_size = input_size
+        self.class_names = class_names
+        with open(model_path, "rb") as f:
+            self.model_version = f"onnx/{zlib.crc32(f.read()):08x}"
+
+    def _blob(self, images):
+        return cv2.dnn.blobFromImages(
+            images, 1 / 255.0, (self.input_size, self.input_size), swapRB=True, crop=False
+        )
+
+    def _decode(self, output, image_shape):
+        """Turn one (4 + classes, anchors) YOLO output into Roboflow-style predictions"""
+        output = output.T
+        scores = output[:, 4:]
+        class_ids = np.argmax(scores, axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        keep = confidences >= CONFIDENCE_THRESHOLD / 100
+        if not np.any(keep):
+            return []
+
+        boxes = output[keep, :4]
+        class_ids = class_ids[keep]
+        confidences = confidences[keep]
+
+        # Scale boxes from network input size back to the original image
+        height, width = image_shape[:2]
+        boxes = boxes * np.array([
+            width / self.input_size, height / self.input_size,
+            width / self.input_size, height / self.input_size,
+        ])
+
+        # cv2 NMS expects top-left based boxes
+        nms_boxes = np.column_stack([boxes[:, 0] - boxes[:, 2] / 2, boxes[:, 1] - boxes[:, 3] / 2, boxes[:, 2], boxes[:, 3]])
+        indices = cv2.dnn.NMSBoxes(
+            nms_boxes.tolist(), confidences.tolist(), CONFIDENCE_THRESHOLD / 100, OVERLAP_THRESHOLD / 100
+        )
+
+        predictions = []
+        for i in np.array(indices).flatten():
+            x, y, w, h = boxes[i]
+            predictions.append({
+                "x": float(x),
+                "y": float(y),
+                "width": float(w),
+                "height": float(h),
+                "confidence": float(confidences[i]),
+                "class": self.class_names[class_ids[i]],
+            })
+        return predictions
+
+    def predict(self, image):
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images):
+        self.net.setInput(self._blob(images))
+        outputs = self.net.forward()
+        return [self._decode(output, image.shape) for output, image in zip(outputs, images)]
+
+
+class FakeBackend(InferenceBackend):
+    """
+    Deterministic backend for tests and benchmarks.
+
+    Returns one evenly spaced box per digit of FAKE_READING, or of a reading
+    derived from the image pixels when FAKE_READING is empty.
+    """
+    name = "fake"
+    model_version = "fake/1"
+
+    def __init__(self, reading=FAKE_READING, latency_ms=FAKE_LATENCY_MS):
+        self.reading = reading
+        self.latency_ms = latency_ms
+
+    def predict(self, image):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        reading = self.reading
+        if not reading:
+            reading = f"{zlib.crc32(np.ascontiguousarray(image)) % 100000:05d}"
+
+        predictions = []
+        for i, digit in enumerate(reading):
+            predictions.append({
+                "x": 40.0 + i * 60,
+                "y": 50.0,
+                "width": 50.0,
+                "height": 80.0,
+                "confidence": 0.9,
+                "class": digit,
+            })
+        return predictions
+
+
+BACKENDS = {
+    RoboflowBackend.name: RoboflowBackend,
+    OnnxBackend.name: OnnxBackend,
+    FakeBackend.name: FakeBackend,
+}
+
+_backend = None
+
+
+def get_backend():
+    """Return the configured inference backend, loading it on first use"""
+    global _backend
+    if _backend is None:
+        if INFERENCE_BACKEND not in BACKENDS:
+            raise RuntimeError(f"Unknown inference backend: {INFERENCE_BACKEND}")
+        _backend = BACKENDS[INFERENCE_BACKEND]()
+    return _backend
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from starlette.concurrency import run_in_threadpool
+
+from database import get_pool
+
+# Job queue configuration
+JOB_DATABASE = os.environ.get("JOB_DATABASE", "meter_readings.db")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL_SECONDS = float(os.environ.get("JOB_POLL_INTERVAL_SECONDS", "1"))
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", "600"))
+# Finished jobs, and their results, are deleted this long after they finish
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", "86400"))
+# How often workers requeue stale jobs and delete expired ones
+JOB_MAINTENANCE_INTERVAL_SECONDS = float(os.environ.get("JOB_MAINTENANCE_INTERVAL_SECONDS", "60"))
+# Uploads waiting for a worker; keep this outside the image store, which is served publicly under /images
+JOB_UPLOAD_DIR = os.environ.get("JOB_UPLOAD_DIR", "job_uploads")
+
+
+def create_jobs_table(cursor):
+    """Migration creating the jobs table, part of the readings database's MIGRATIONS in app.py"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS prediction_jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        upload_path TEXT NOT NULL,
+        previous_meter_reading REAL,
+        result TEXT,
+        error TEXT,
+        created_at TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP NOT NULL
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_prediction_jobs_status ON prediction_jobs (status, created_at)")
+
+
+class JobQueue:
+    """
+    Prediction jobs persisted in SQLite so they survive a restart.
+
+    Jobs move from queued to running to done or failed. Workers claim the
+    oldest queued job with a single UPDATE, so several processes can drain
+    the same table. Jobs left running by a crashed process are requeued once
+    they have not been touched for JOB_STALE_SECONDS, and finished jobs are
+    deleted after JOB_RETENTION_SECONDS; workers check for both every
+    JOB_MAINTENANCE_INTERVAL_SECONDS. SQLite and upload file access runs in
+    the threadpool, off the event loop.
+    """
+
+    def __init__(self, database=JOB_DATABASE):
+        self.pool = get_pool(database)
+        self._wakeup = None
+        self._finished = {}
+        self._workers = []
+        self._next_maintenance = 0
+
+    async def enqueue(self, image_content, previous_meter_reading=None):
+        """Save the upload, queue a job for it and return the job id"""
+        job_id = await run_in_threadpool(self._insert, image_content, previous_meter_reading)
+        if self._wakeup:
+            self._wakeup.set()
+        return job_id
+
+    def _insert(self, image_content, previous_meter_reading):
+        job_id = str(uuid.uuid4())
+        os.makedirs(JOB_UPLOAD_DIR, exist_ok=True)
+        upload_path = f"{JOB_UPLOAD_DIR}/{job_id}.upload"
+        with open(upload_path, "wb") as f:
+            f.write(image_content)
+
+        now = datetime.now()
+        with self.pool.connection() as conn:
+            conn.execute('''
+            INSERT INTO prediction_jobs (id, status, upload_path, previous_meter_reading, created_at, updated_at)
+            VALUES (?, 'queued', ?, ?, ?, ?)
+            ''', (job_id, upload_path, previous_meter_reading, now, now))
+            conn.commit()
+        return job_id
+
+    async def get(self, job_id):
+        """Return a job as a dict, or None if it doesn't exist"""
+        return await run_in_threadpool(self._get, job_id)
+
+    def _get(self, job_id):
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT * FROM prediction_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def _claim(self):
+        with self.pool.connection() as conn:
+            row = conn.execute('''
+            UPDATE prediction_jobs SET status = 'running', updated_at = ?
+            WHERE id = (
+                SELECT id FROM prediction_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1
+            )
+            RETURNING id, upload_path, previous_meter_reading
+            ''', (datetime.now(),)).fetchone()
+            conn.commit()
+        return row
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self.pool.connection() as conn:
+            conn.execute('''
+            UPDATE prediction_jobs SET status = ?, result = ?, error = ?, updated_at = ?
+            WHERE id = ?
+            ''', (status, json.dumps(result) if result is not None else None, error, datetime.now(), job_id))
+            conn.commit()
+
+    def _read_upload(self, upload_path):
+        with open(upload_path, "rb") as f:
+            return f.read()
+
+    def _remove_upload(self, upload_path):
+        if os.path.exists(upload_path):
+            os.remove(upload_path)
+
+    def requeue_stale(self):
+        """Put jobs left running by a crashed or restarted process back in the queue"""
+        with self.pool.connection() as conn:
+            conn.execute('''
+            UPDATE prediction_jobs SET status = 'queued', updated_at = ?
+            WHERE status = 'running' AND updated_at < ?
+            ''', (datetime.now(), datetime.now() - timedelta(seconds=JOB_STALE_SECONDS)))
+            conn.commit()
+
+    def delete_expired(self):
+        """Delete done and failed jobs finished more than JOB_RETENTION_SECONDS ago"""
+        with self.pool.connection() as conn:
+            conn.execute('''
+            DELETE FROM prediction_jobs
+            WHERE status IN ('done', 'failed') AND updated_at < ?
+            ''', (datetime.now() - timedelta(seconds=JOB_RETENTION_SECONDS),))
+            conn.commit()
+
+    def _maintain(self):
+        self.requeue_stale()
+        self.delete_expired()
+
+    async def wait(self, job_id, timeout):
+        """Wait up to timeout seconds for a job handled by this process to finish"""
+        finished = self._finished.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(finished.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # Jobs finished by another process never set their event, so don't keep it around;
+            # any other waiter on the same job falls back to its own timeout
+            if self._finished.get(job_id) is finished:
+                del self._finished[job_id]
+
+    async def _work(self, handler):
+        while True:
+            try:
+                await self._work_once(handler)
+            except Exception as e:
+                # Most likely a locked or unavailable database; a job claimed before the error
+                # stays running and is requeued once it goes stale
+                print(f"Job worker failed: {e}")
+                await asyncio.sleep(JOB_POLL_INTERVAL_SECONDS)
+
+    async def _work_once(self, handler):
+        """Run one job, or wait for one when the queue is empty"""
+        if time.monotonic() >= self._next_maintenance:
+            self._next_maintenance = time.monotonic() + JOB_MAINTENANCE_INTERVAL_SECONDS
+            await run_in_threadpool(self._maintain)
+
+        row = await run_in_threadpool(self._claim)
+        if row is None:
+            # Sleep until a job is enqueued here, or poll for jobs from other processes
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            return
+
+        job_id = row["id"]
+        try:
+            image_content = await run_in_threadpool(self._read_upload, row["upload_path"])
+            result = await handler(image_content, row["previous_meter_reading"])
+        except Exception as e:
+            await run_in_threadpool(self._finish, job_id, "failed", None, getattr(e, "detail", None) or str(e))
+        else:
+            await run_in_threadpool(self._finish, job_id, "done", result)
+        # The upload is a customer photo, only kept until its job has finished. A cancelled
+        # worker leaves it in place for the requeued job.
+        await run_in_threadpool(self._remove_upload, row["upload_path"])
+
+        finished = self._finished.pop(job_id, None)
+        if finished:
+            finished.set()
+
+    def start(self, handler, workers=JOB_WORKERS):
+        """Start worker tasks that run handler(image_content, previous_meter_reading) for each job"""
+        self._maintain()
+        self._next_maintenance = time.monotonic() + JOB_MAINTENANCE_INTERVAL_SECONDS
+        self._wakeup = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self._workers = [loop.create_task(self._work(handler)) for _ in range(workers)]
+
+    async def stop(self):
+        """Cancel the worker tasks; their running jobs are requeued once they go stale"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
@@ -5,11 +5,19 @@ from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 import sqlite3
 import os
+import asyncio
+import hashlib
+import time
+import uuid
 import uvicorn
 from contextlib import contextmanager
+from database import get_pool
+from migrations import migrate
+from metrics import Counter, ServerTimingMiddleware, metrics_response, timed
+from passwords import hash_password, shutdown_executor, verify_password
+from user_cache import UserCache
 
 # Initialize FastAPI
 app = FastAPI()
@@ -23,46 +31,70 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-stage timings in a Server-Timing header; added last so it is outermost
+app.add_middleware(ServerTimingMiddleware)
+
 # Database setup
 DATABASE_NAME = "meterease.db"
+db_pool = get_pool(DATABASE_NAME)
 
-def init_db():
-    print("Initializing database...")  # Debug print
-    with sqlite3.connect(DATABASE_NAME) as conn:
-        cursor = conn.cursor()
-        
-        # Drop tables if they exist (for clean initialization)
-        cursor.execute("DROP TABLE IF EXISTS refresh_tokens")
-        cursor.execute("DROP TABLE IF EXISTS users")
-        
-        # Create users table
-        cursor.execute('''
-        CREATE TABLE users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            mobile_number TEXT UNIQUE NOT NULL,
-            service_number TEXT UNIQUE,
-            hashed_password TEXT NOT NULL,
-            is_active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        # Create refresh tokens table
+def create_auth_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        mobile_number TEXT UNIQUE NOT NULL,
+        service_number TEXT UNIQUE,
+        hashed_password TEXT NOT NULL,
+        is_active BOOLEAN DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS refresh_tokens (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        token TEXT NOT NULL,
+        expires_at TIMESTAMP NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+
+def hash_refresh_tokens(cursor):
+    # Tokens are looked up by the SHA-256 of the JWT, never stored in full. A login starts a
+    # family that each rotation extends; revoked_at and replaced_by mark rotated tokens.
+    columns = {row["name"] for row in cursor.execute("PRAGMA table_info(refresh_tokens)")}
+    if "token_hash" not in columns:
+        # Tokens in the old table were issued without a type claim and can't be refreshed anyway
+        cursor.execute("DROP TABLE refresh_tokens")
         cursor.execute('''
         CREATE TABLE refresh_tokens (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
-            token TEXT NOT NULL,
-            expires_at TIMESTAMP NOT NULL,
+            token_hash TEXT UNIQUE NOT NULL,
+            family_id TEXT NOT NULL,
+            expires_at INTEGER NOT NULL,
+            revoked_at INTEGER,
+            replaced_by TEXT,
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
         ''')
-        conn.commit()
-        print("Database initialized successfully")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user_id ON refresh_tokens (user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_refresh_tokens_family_id ON refresh_tokens (family_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires_at ON refresh_tokens (expires_at)")
+
+# Schema history of the auth database; append new versions, never edit applied ones.
+# Version 1 uses IF NOT EXISTS so databases created before migrations adopt it as their baseline.
+MIGRATIONS = [
+    (1, "users and refresh_tokens", create_auth_tables),
+    (2, "refresh_tokens stored by hash, with rotation families", hash_refresh_tokens),
+]
 
-# Initialize database on startup
-init_db()
+def init_db():
+    """Apply any pending schema migrations; users and their tokens survive restarts"""
+    applied = migrate(DATABASE_NAME, MIGRATIONS)
+    if applied:
+        print(f"Migrated {DATABASE_NAME} to schema version {applied[-1]}")
 
 # Security configurations
 SECRET_KEY = "your-secret-key-here"  # Change this in production!
@@ -70,8 +102,18 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
-# Using SHA256 for password hashing
-pwd_context = CryptContext(schemes=["sha256_crypt"], deprecated="auto")
+# Expired refresh tokens are deleted this often, this many rows per transaction
+REFRESH_TOKEN_PURGE_INTERVAL_SECONDS = float(os.environ.get("REFRESH_TOKEN_PURGE_INTERVAL_SECONDS", "3600"))
+REFRESH_TOKEN_PURGE_BATCH_SIZE = int(os.environ.get("REFRESH_TOKEN_PURGE_BATCH_SIZE", "500"))
+
+TOKEN_REFRESHES = Counter("meterease_token_refreshes", "Refresh token exchanges by result", ["result"])
+REFRESH_TOKENS_PURGED = Counter("meterease_refresh_tokens_purged", "Expired refresh tokens deleted")
+
+# Trust the user claims of a valid access token until it expires instead of loading the user;
+# changes to a user then reach requests only with the next token
+AUTH_STATELESS = os.environ.get("AUTH_STATELESS", "0") == "1"
+
+# Password hashing policy and its worker pool are configured in passwords.py
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # Pydantic models
@@ -84,11 +126,13 @@ class UserCreate(UserBase):
     password: str
     confirm_password: str
 
-class UserInDB(UserBase):
+class User(UserBase):
     id: int
-    hashed_password: str
     is_active: bool
 
+class UserInDB(User):
+    hashed_password: str
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -97,15 +141,17 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     mobile_number: Optional[str] = None
 
-# Database connection helper
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+# Database connection helper, borrowing a pooled connection for the request
 @contextmanager
 def get_db():
-    conn = sqlite3.connect(DATABASE_NAME, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    try:
+    with db_pool.connection() as conn:
         yield conn
-    finally:
-        conn.close()
+
+# Users for authenticated requests, so most are served without touching the database
+user_cache = UserCache()
 
 def get_user_by_mobile(conn, mobile_number: str):
     cursor = conn.cursor()
@@ -122,8 +168,20 @@ def get_user_by_mobile(conn, mobile_number: str):
         )
     return None
 
-def create_user(conn, user: UserCreate):
-    hashed_password = pwd_context.hash(user.password)
+def get_cached_user(mobile_number: str):
+    """The user for an authenticated request, from the user cache when possible"""
+    user = user_cache.get(mobile_number)
+    if user is None:
+        with get_db() as conn, timed("user_lookup"):
+            user_in_db = get_user_by_mobile(conn, mobile_number)
+        if user_in_db is None:
+            return None
+        # The password hash has no business in memory between logins
+        user = User(**user_in_db.model_dump(exclude={"hashed_password"}))
+        user_cache.put(mobile_number, user)
+    return user
+
+def create_user(conn, user: UserCreate, hashed_password: str):
     try:
         cursor = conn.cursor()
         cursor.execute(
@@ -152,8 +210,14 @@ def create_user(conn, user: UserCreate):
         )
 
 # Authentication functions
-def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
+def user_claims(user_id: int, user: UserBase):
+    """Access token claims; enough to rebuild the user in AUTH_STATELESS mode"""
+    return {
+        "sub": user.mobile_number,
+        "uid": user_id,
+        "name": user.name,
+        "service_number": user.service_number,
+    }
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -171,50 +235,183 @@ def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(days=7)
-    to_encode.update({"exp": expire})
+    # jti makes every refresh token unique, even two issued to a user in the same second
+    to_encode.update({"exp": expire, "type": "refresh", "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def store_refresh_token(conn, user_id: int, token: str, expires_at: datetime):
+def create_tokens(user_id: int, user: UserBase):
+    """Access token, refresh token and the refresh token's expiry as unix time"""
+    access_token = create_access_token(
+        data=user_claims(user_id, user), expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    refresh_token_expires = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    refresh_token = create_refresh_token(
+        data={"sub": user.mobile_number}, expires_delta=refresh_token_expires
+    )
+    return access_token, refresh_token, int(time.time() + refresh_token_expires.total_seconds())
+
+def refresh_token_hash(token: str):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def store_refresh_token(conn, user_id: int, token: str, expires_at: int, family_id: Optional[str] = None):
+    """Store a refresh token; without family_id it starts a new family, as on login"""
     cursor = conn.cursor()
     cursor.execute(
         """
-        INSERT INTO refresh_tokens (user_id, token, expires_at)
-        VALUES (?, ?, ?)
+        INSERT INTO refresh_tokens (user_id, token_hash, family_id, expires_at)
+        VALUES (?, ?, ?, ?)
         """,
-        (user_id, token, expires_at)
+        (user_id, refresh_token_hash(token), family_id or uuid.uuid4().hex, expires_at)
     )
     conn.commit()
 
-def authenticate_user(conn, mobile_number: str, password: str):
-    user = get_user_by_mobile(conn, mobile_number)
-    if not user:
-        return False
-    if not verify_password(password, user.hashed_password):
-        return False
-    return user
+class RefreshTokenReused(Exception):
+    """A refresh token was presented again after it had been rotated or revoked"""
+
+def rotate_refresh_token(conn, token: str, new_token: str, new_expires_at: int):
+    """
+    Replace token with new_token in its family, in one transaction.
+    Returns the user id, or None when token is unknown or expired. A token that was already
+    rotated is being replayed, possibly by someone who stole it: its whole family is revoked,
+    logging out whoever holds the latest token, and RefreshTokenReused is raised.
+    """
+    now = int(time.time())
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, user_id, family_id, expires_at, revoked_at FROM refresh_tokens WHERE token_hash = ?",
+        (refresh_token_hash(token),)
+    )
+    row = cursor.fetchone()
+    if row is None or row["expires_at"] <= now:
+        return None
+
+    if row["revoked_at"] is None:
+        new_hash = refresh_token_hash(new_token)
+        # Conditional, so only one of two concurrent rotations of the same token wins
+        cursor.execute(
+            "UPDATE refresh_tokens SET revoked_at = ?, replaced_by = ? WHERE id = ? AND revoked_at IS NULL",
+            (now, new_hash, row["id"])
+        )
+        if cursor.rowcount == 1:
+            cursor.execute(
+                """
+                INSERT INTO refresh_tokens (user_id, token_hash, family_id, expires_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (row["user_id"], new_hash, row["family_id"], new_expires_at)
+            )
+            conn.commit()
+            return row["user_id"]
+
+    cursor.execute(
+        "UPDATE refresh_tokens SET revoked_at = ? WHERE family_id = ? AND revoked_at IS NULL",
+        (now, row["family_id"])
+    )
+    conn.commit()
+    raise RefreshTokenReused()
+
+def purge_expired_refresh_tokens(batch_size: int = REFRESH_TOKEN_PURGE_BATCH_SIZE):
+    """Delete expired refresh tokens in transactions of batch_size rows, so logins never wait long on the lock"""
+    deleted = 0
+    with get_db() as conn:
+        while True:
+            cursor = conn.execute(
+                """
+                DELETE FROM refresh_tokens WHERE id IN (
+                    SELECT id FROM refresh_tokens WHERE expires_at <= ? LIMIT ?
+                )
+                """,
+                (int(time.time()), batch_size)
+            )
+            conn.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+    REFRESH_TOKENS_PURGED.inc(deleted)
+    return deleted
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def purge_refresh_tokens_forever():
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, purge_expired_refresh_tokens)
+        except Exception as e:
+            print(f"Refresh token purge failed: {e}")
+        await asyncio.sleep(REFRESH_TOKEN_PURGE_INTERVAL_SECONDS)
+
+def update_password_hash(conn, user: UserInDB, hashed_password: str):
+    cursor = conn.cursor()
+    cursor.execute("UPDATE users SET hashed_password = ? WHERE id = ?", (hashed_password, user.id))
+    conn.commit()
+    # Every change to a user row invalidates its cache entry
+    user_cache.invalidate(user.mobile_number)
+
+async def authenticate_user(conn, mobile_number: str, password: str):
+    with timed("authenticate_user"):
+        with timed("user_lookup"):
+            user = get_user_by_mobile(conn, mobile_number)
+        if not user:
+            return False
+        with timed("password_verify"):
+            verified, new_hash = await verify_password(password, user.hashed_password)
+        if not verified:
+            return False
+        if new_hash:
+            # The stored hash predates the current hashing policy
+            update_password_hash(conn, user, new_hash)
+        return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        mobile_number: str = payload.get("sub")
-        if mobile_number is None:
+    with timed("get_current_user"):
+        try:
+            with timed("jwt_decode"):
+                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            mobile_number: str = payload.get("sub")
+            # A refresh token is only good for /token/refresh
+            if mobile_number is None or payload.get("type") == "refresh":
+                raise credentials_exception
+            token_data = TokenData(mobile_number=mobile_number)
+        except JWTError:
             raise credentials_exception
-        token_data = TokenData(mobile_number=mobile_number)
-    except JWTError:
-        raise credentials_exception
-    
-    with get_db() as conn:
-        user = get_user_by_mobile(conn, mobile_number=token_data.mobile_number)
+        
+        # Stateless mode trusts the signed claims; otherwise the user comes from the cache or database
+        if AUTH_STATELESS and "uid" in payload:
+            return User(
+                id=payload["uid"],
+                name=payload["name"],
+                mobile_number=token_data.mobile_number,
+                service_number=payload.get("service_number"),
+                is_active=True,
+            )
+        
+        # Tokens issued before the user claims were added always load the user
+        user = get_cached_user(token_data.mobile_number)
         if user is None:
             raise credentials_exception
         return user
 
+_purger = None
+
+@app.on_event("startup")
+async def start_background_work():
+    global _purger
+    # A single read when the schema is current; concurrent workers wait for one to migrate
+    init_db()
+    _purger = asyncio.get_running_loop().create_task(purge_refresh_tokens_forever())
+
+@app.on_event("shutdown")
+async def stop_background_work():
+    if _purger is not None:
+        _purger.cancel()
+        await asyncio.gather(_purger, return_exceptions=True)
+    shutdown_executor()
+
 # OPTIONS handlers
 @app.options("/signup")
 async def options_signup():
@@ -224,6 +421,10 @@ async def options_signup():
 async def options_token():
     return {"message": "OK"}
 
+@app.options("/token/refresh")
+async def options_token_refresh():
+    return {"message": "OK"}
+
 @app.options("/users/me")
 async def options_users_me():
     return {"message": "OK"}
@@ -252,33 +453,21 @@ async def signup(user: UserCreate):
             detail="Service number must be 12 digits"
         )
     
+    with timed("password_hash"):
+        hashed_password = await hash_password(user.password)
+    
     with get_db() as conn:
         # Create user
-        user_id = create_user(conn, user)
+        user_id = create_user(conn, user, hashed_password)
         if not user_id:
             raise HTTPException(
                 status_code=400,
                 detail="Registration failed"
             )
         
-        # Generate tokens
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user.mobile_number}, expires_delta=access_token_expires
-        )
-        
-        refresh_token_expires = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-        refresh_token = create_refresh_token(
-            data={"sub": user.mobile_number}, expires_delta=refresh_token_expires
-        )
-        
-        # Store refresh token
-        store_refresh_token(
-            conn, 
-            user_id, 
-            refresh_token, 
-            datetime.utcnow() + refresh_token_expires
-        )
+        # Generate tokens, starting a new refresh token family
+        access_token, refresh_token, refresh_expires_at = create_tokens(user_id, user)
+        store_refresh_token(conn, user_id, refresh_token, refresh_expires_at)
         
         return {
             "access_token": access_token,
@@ -291,7 +480,7 @@ async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends()
 ):
     with get_db() as conn:
-        user = authenticate_user(conn, form_data.username, form_data.password)
+        user = await authenticate_user(conn, form_data.username, form_data.password)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -299,23 +488,8 @@ async def login_for_access_token(
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user.mobile_number}, expires_delta=access_token_expires
-        )
-        
-        refresh_token_expires = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-        refresh_token = create_refresh_token(
-            data={"sub": user.mobile_number}, expires_delta=refresh_token_expires
-        )
-        
-        # Store refresh token
-        store_refresh_token(
-            conn, 
-            user.id, 
-            refresh_token, 
-            datetime.utcnow() + refresh_token_expires
-        )
+        access_token, refresh_token, refresh_expires_at = create_tokens(user.id, user)
+        store_refresh_token(conn, user.id, refresh_token, refresh_expires_at)
         
         return {
             "access_token": access_token,
@@ -323,8 +497,66 @@ async def login_for_access_token(
             "refresh_token": refresh_token
         }
 
+@app.post("/token/refresh", response_model=Token)
+async def refresh_access_token(request: RefreshRequest):
+    """
+    Exchange a refresh token for a new access token and a new refresh token, without the password.
+    Each refresh token works once; presenting a used one revokes every token descended from the same login.
+    """
+    invalid_token = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        with timed("jwt_decode"):
+            payload = jwt.decode(request.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        TOKEN_REFRESHES.inc(result="invalid")
+        raise invalid_token
+    if payload.get("type") != "refresh" or payload.get("sub") is None:
+        TOKEN_REFRESHES.inc(result="invalid")
+        raise invalid_token
+    
+    user = get_cached_user(payload["sub"])
+    if user is None:
+        TOKEN_REFRESHES.inc(result="invalid")
+        raise invalid_token
+    
+    access_token, refresh_token, refresh_expires_at = create_tokens(user.id, user)
+    with get_db() as conn, timed("refresh_token_rotate"):
+        try:
+            user_id = rotate_refresh_token(conn, request.refresh_token, refresh_token, refresh_expires_at)
+        except RefreshTokenReused:
+            TOKEN_REFRESHES.inc(result="reused")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Refresh token already used; please log in again",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+    if user_id != user.id:
+        TOKEN_REFRESHES.inc(result="invalid")
+        raise invalid_token
+    
+    TOKEN_REFRESHES.inc(result="rotated")
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Stage timing histograms in the Prometheus text format"""
+    return metrics_response()
+
+@app.get("/users/cache/stats")
+async def user_cache_stats():
+    """User cache hit/miss counters and size"""
+    return user_cache.stats()
+
 @app.get("/users/me")
-async def read_users_me(current_user: UserInDB = Depends(get_current_user)):
+async def read_users_me(current_user: User = Depends(get_current_user)):
     return {
         "name": current_user.name,
         "mobile_number": current_user.mobile_number,
@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import time
+
+from database import connect
+
+# How long a booting process waits for another one to finish migrating the same database
+MIGRATION_LOCK_TIMEOUT_MS = int(os.environ.get("MIGRATION_LOCK_TIMEOUT_MS", "60000"))
+
+SCHEMA_VERSION_TABLE = "schema_version"
+
+
+def current_version(conn):
+    """Highest migration version applied to a database, 0 for one never migrated"""
+    try:
+        row = conn.execute(f"SELECT MAX(version) FROM {SCHEMA_VERSION_TABLE}").fetchone()
+    except sqlite3.OperationalError:
+        # No version table yet
+        return 0
+    return row[0] or 0
+
+
+def migrate(database, migrations):
+    """
+    Bring a database's schema up to date.
+
+    migrations is a list of (version, description, fn) in ascending version order; fn(cursor)
+    runs once per database, and the versions applied are recorded in the schema_version table.
+    When the schema is already current this is a single read. Otherwise BEGIN IMMEDIATE takes
+    the database's write lock, so when several workers boot at once one applies the pending
+    migrations while the others wait for it, then find nothing left to do. All pending
+    migrations share one transaction: a failing one leaves the schema as it was.
+    Returns the versions applied.
+    """
+    latest = migrations[-1][0] if migrations else 0
+    conn = connect(database, isolation_level=None)
+    try:
+        if current_version(conn) >= latest:
+            return []
+
+        conn.execute(f"PRAGMA busy_timeout={MIGRATION_LOCK_TIMEOUT_MS}")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at INTEGER NOT NULL
+            )
+            ''')
+            # Another process may have migrated while we waited for the lock
+            version = current_version(conn)
+            applied = []
+            for migration_version, description, fn in migrations:
+                if migration_version <= version:
+                    continue
+                fn(cursor)
+                cursor.execute(
+                    f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, description, applied_at) VALUES (?, ?, ?)",
+                    (migration_version, description, int(time.time())),
+                )
+                applied.append(migration_version)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return applied
+    finally:
+        conn.close()
@@ -0,0 +1,568 @@
+import hashlib
+import re
+from html import escape
+
+from starlette.responses import Response
+
+from compression import choose_encoding, precompress
+from image_responses import etag_matches
+from tariff import tariff_slabs
+
+_PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+def _compact(html):
+    """Drop indentation and blank lines; the pages have no whitespace-sensitive content"""
+    return "\n".join(line.strip() for line in html.splitlines() if line.strip())
+
+
+class PageTemplate:
+    """
+    HTML template split once into its static fragments and {{ name }} placeholders,
+    so rendering is a single join. Values are inserted as given; escape user input first.
+    """
+
+    def __init__(self, html):
+        parts = _PLACEHOLDER.split(_compact(html))
+        self.fragments = parts[0::2]
+        self.names = parts[1::2]
+
+    def render(self, **values):
+        parts = [self.fragments[0]]
+        for name, fragment in zip(self.names, self.fragments[1:]):
+            parts.append(str(values[name]))
+            parts.append(fragment)
+        return "".join(parts)
+
+
+class StaticPage:
+    """
+    A page without per-request content, encoded and compressed once and served from memory.
+    Each encoding has its own ETag, so browsers revalidate with If-None-Match and get a 304.
+    """
+
+    def __init__(self, html):
+        body = _compact(html).encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {"identity": body, **precompress(body)}
+        self.etags = {encoding: f'"{digest}-{encoding}"' for encoding in self.variants}
+
+    def response(self, request):
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""), tuple(self.variants)[1:])
+        headers = {"ETag": self.etags[encoding], "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("if-none-match", ""), self.etags[encoding]):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=self.variants[encoding], media_type="text/html", headers=headers)
+
+
+def format_amount(value):
+    """Number as shown on the bill: up to two decimals, without trailing zeros"""
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+UPLOAD_PAGE = StaticPage("""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Upload Meter Images</title>
+        <style>
+            body { font-family: Arial, sans-serif; margin: 20px; max-width: 800px; margin: 0 auto; }
+            form { margin: 0 auto; }
+            .form-group { margin-bottom: 20px; }
+            label { display: block; margin-bottom: 5px; font-weight: bold; }
+            .input-description { color: #666; font-size: 0.9em; margin-top: 3px; }
+            button { padding: 10px 20px; background: #4CAF50; color: white; border: none; cursor: pointer; border-radius: 4px; }
+            button:hover { background: #45a049; }
+            .result { margin-top: 30px; display: none; }
+            .result img { max-width: 100%; border: 1px solid #ddd; }
+            .readings { background: #f9f9f9; padding: 15px; border-radius: 4px; margin-bottom: 20px; }
+            .reading-box { margin-bottom: 15px; }
+            .consumption { font-weight: bold; color: #e67e22; font-size: 1.2em; }
+            .image-section { margin-top: 20px; }
+            h3 { border-bottom: 1px solid #eee; padding-bottom: 5px; }
+            .image-container { display: flex; flex-wrap: wrap; gap: 20px; margin-top: 15px; }
+            .image-box { flex: 1; min-width: 300px; }
+            .heading { display: flex; justify-content: space-between; align-items: center; }
+        </style>
+    </head>
+    <body>
+    
+        <div style="display: flex; justify-content: space-between; align-items: center;">
+            <h1>Electricity Meter Reading Analyzer</h1>
+            <a href="/history-page" style="padding: 8px 15px; background: #3498db; color: white; text-decoration: none; border-radius: 4px;">View Reading History</a>
+        </div>
+        
+        <form id="uploadForm">
+            <div class="form-group">
+                <label for="currentImageFile">Current Meter Reading Image (Required):</label>
+                <input type="file" id="currentImageFile" name="current_image" accept="image/*" required>
+                <div class="input-description">Upload a clear photo of your current meter reading</div>
+            </div>
+            
+            <div class="form-group">
+                <label for="previousMeterReading">Previous Meter Reading (Optional):</label>
+                <input type="number" id="previousMeterReading" name="previous_meter_reading" step="0.01" placeholder="Enter previous reading">
+                <div class="input-description">Enter your previous meter reading to calculate consumption</div>
+            </div>
+            
+            <button type="submit">Analyze Meter Readings</button>
+        </form>
+        
+        <div id="result" class="result">
+            <div class="readings">
+                <div class="reading-box">
+                    <h3>Current Reading: <span id="currentMeterValue"></span></h3>
+                </div>
+                
+                <div id="previousReadingBox" class="reading-box" style="display:none;">
+                    <h3>Previous Reading: <span id="previousMeterValue"></span></h3>
+                </div>
+                
+                <div id="consumptionBox" style="display:none;">
+                    <h3 class="consumption">Consumption: <span id="consumptionValue"></span> units</h3>
+                </div>
+            </div>
+            
+            <div class="image-section">
+                <div class="heading">
+                    <h2>Processed Images</h2>
+                    <a id="viewAllLink" href="" target="_blank">View Full Page</a>
+                </div>
+                
+                <div class="image-container">
+                    <div class="image-box">
+                        <h3>Current Meter Reading</h3>
+                        <img id="currentResultImage" src="" alt="Processed current meter image">
+                    </div>
+                </div>
+            </div>
+        </div>
+
+        <script>
+            // Modify the form submission handler in the upload form HTML
+            document.getElementById('uploadForm').addEventListener('submit', async function(e) {
+                e.preventDefault();
+                
+                const currentFileInput = document.getElementById('currentImageFile');
+                const previousReadingInput = document.getElementById('previousMeterReading');
+                
+                const currentFile = currentFileInput.files[0];
+                const previousReading = previousReadingInput.value.trim();
+                
+                if (!currentFile) {
+                    alert('Please select a current meter image file');
+                    return;
+                }
+                
+                const formData = new FormData();
+                formData.append('current_image', currentFile);
+                
+                if (previousReading) {
+                    formData.append('previous_meter_reading', previousReading);
+                }
+                
+                try {
+                    const response = await fetch('/predict?response_mode=urls', {
+                        method: 'POST',
+                        body: formData
+                    });
+                    
+                    const data = await response.json();
+                    
+                    // Ask for a clearer photo now rather than billing a misread
+                    if (!data.current.valid && !confirm(`The reading "${data.current.meter_reading}" looks incomplete or unclear. Continue to the bill anyway?`)) {
+                        return;
+                    }
+                    
+                    // Redirect to the bill page with the readings data
+                    window.location.href = `/generate-bill?imageId=${data.image_id}&current=${data.current.meter_reading}${data.previous ? '&previous=' + data.previous.meter_reading : ''}&consumption=${data.consumption}`;
+                    
+                } catch (error) {
+                    console.error('Error:', error);
+                    alert('An error occurred during processing');
+                }
+            });
+        </script>
+        <script src="/static/bill-calculator.js"></script>
+    </body>
+    </html>
+    """)
+
+HISTORY_PAGE = StaticPage("""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Reading History</title>
+        <style>
+            body { font-family: Arial, sans-serif; margin: 20px; max-width: 1000px; margin: 0 auto; }
+            .filters { display: flex; gap: 15px; align-items: flex-end; margin-bottom: 20px; }
+            label { display: block; margin-bottom: 5px; font-weight: bold; }
+            button { padding: 8px 15px; background: #3498db; color: white; border: none; cursor: pointer; border-radius: 4px; }
+            button:hover { background: #2980b9; }
+            table { width: 100%; border-collapse: collapse; margin-bottom: 20px; }
+            th, td { border: 1px solid #ddd; padding: 8px; text-align: center; }
+            th { background-color: #f2f2f2; }
+            #loadMore { display: none; }
+        </style>
+    </head>
+    <body>
+        <div style="display: flex; justify-content: space-between; align-items: center;">
+            <h1>Reading History</h1>
+            <a href="/upload" style="padding: 8px 15px; background: #4CAF50; color: white; text-decoration: none; border-radius: 4px;">Upload New Reading</a>
+        </div>
+        
+        <form id="filterForm" class="filters">
+            <div>
+                <label for="startDate">From:</label>
+                <input type="date" id="startDate">
+            </div>
+            <div>
+                <label for="endDate">To:</label>
+                <input type="date" id="endDate">
+            </div>
+            <button type="submit">Filter</button>
+        </form>
+        
+        <table>
+            <thead>
+                <tr>
+                    <th>Date</th>
+                    <th>Reading</th>
+                    <th>Previous Reading</th>
+                    <th>Consumption</th>
+                    <th>Images</th>
+                </tr>
+            </thead>
+            <tbody id="historyRows"></tbody>
+        </table>
+        <p id="emptyMessage" style="display:none;">No readings found.</p>
+        <button id="loadMore">Load More</button>
+
+        <script>
+            let nextCursor = null;
+            
+            function historyUrl() {
+                const params = new URLSearchParams({ limit: 50 });
+                const startDate = document.getElementById('startDate').value;
+                const endDate = document.getElementById('endDate').value;
+                if (startDate) params.append('start_date', startDate);
+                if (endDate) params.append('end_date', endDate);
+                if (nextCursor) params.append('cursor', nextCursor);
+                return '/history?' + params.toString();
+            }
+            
+            async function loadPage(reset) {
+                const rows = document.getElementById('historyRows');
+                if (reset) {
+                    nextCursor = null;
+                    rows.innerHTML = '';
+                }
+                
+                const response = await fetch(historyUrl());
+                const data = await response.json();
+                
+                for (const item of data.items) {
+                    const row = document.createElement('tr');
+                    const cells = [
+                        new Date(item.reading_date).toLocaleString(),
+                        item.reading_value,
+                        item.previous_reading_value ?? 'N/A',
+                        item.consumption_value ?? 'N/A'
+                    ];
+                    for (const value of cells) {
+                        const cell = document.createElement('td');
+                        cell.textContent = value;
+                        row.appendChild(cell);
+                    }
+                    const linkCell = document.createElement('td');
+                    const link = document.createElement('a');
+                    link.href = item.view_url;
+                    link.textContent = 'View';
+                    linkCell.appendChild(link);
+                    row.appendChild(linkCell);
+                    rows.appendChild(row);
+                }
+                
+                nextCursor = data.next_cursor;
+                document.getElementById('loadMore').style.display = nextCursor ? 'inline-block' : 'none';
+                document.getElementById('emptyMessage').style.display = rows.children.length ? 'none' : 'block';
+            }
+            
+            document.getElementById('filterForm').addEventListener('submit', function(e) {
+                e.preventDefault();
+                loadPage(true);
+            });
+            document.getElementById('loadMore').addEventListener('click', function() {
+                loadPage(false);
+            });
+            loadPage(true);
+        </script>
+    </body>
+    </html>
+    """)
+
+VIEW_PAGE = PageTemplate("""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Meter Reading Result</title>
+        <style>
+            body { font-family: Arial, sans-serif; margin: 20px; }
+            .container { display: flex; flex-direction: column; gap: 20px; }
+            .image-container { display: flex; gap: 20px; flex-wrap: wrap; }
+            .image-box { border: 1px solid #ddd; padding: 10px; }
+            .reading-display { border: 1px solid #ddd; padding: 15px; background-color: #f9f9f9; border-radius: 4px; }
+            h2, h3 { color: #333; }
+            .section { margin-bottom: 30px; }
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <h1>Meter Reading Result</h1>
+
+            <div class="section">
+                <h2>Current Meter Reading</h2>
+                <div class="image-container">
+                    <div class="image-box">
+                        <h3>Original Image</h3>
+                        <img src="/image/{{ image_id }}/current?processed=false" alt="Current Meter Original Image" />
+                    </div>
+                    <div class="image-box">
+                        <h3>Processed Image with Detection</h3>
+                        <img src="/image/{{ image_id }}/current?processed=true" alt="Current Meter Processed Image" />
+                    </div>
+                </div>
+            </div>
+
+            {{ previous_section }}
+
+            <p>Image ID: {{ image_id }}</p>
+            <p><a href="/upload">Upload another image</a></p>
+        </div>
+        <script src="/static/bill-calculator.js"></script>
+    </body>
+    </html>
+""")
+
+VIEW_PREVIOUS_IMAGES = PageTemplate("""
+    <h2>Previous Meter Reading</h2>
+    <div class="image-container">
+        <div class="image-box">
+            <h3>Original Image</h3>
+            <img src="/image/{{ image_id }}/previous?processed=false" alt="Previous Meter Original Image" />
+        </div>
+        <div class="image-box">
+            <h3>Processed Image with Detection</h3>
+            <img src="/image/{{ image_id }}/previous?processed=true" alt="Previous Meter Processed Image" />
+        </div>
+    </div>
+""")
+
+VIEW_PREVIOUS_MANUAL = PageTemplate("""
+    <h2>Previous Meter Reading</h2>
+    <div class="reading-display">
+        <h3>Manually Entered Reading: {{ previous_reading }}</h3>
+    </div>
+""")
+
+BILL_PAGE = PageTemplate("""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Electricity Bill</title>
+        <style>
+            body { font-family: Arial, sans-serif; margin: 0; padding: 0; background-color: #f5f5f5; }
+            .container { max-width: 800px; margin: 20px auto; background-color: white; box-shadow: 0 0 10px rgba(0,0,0,0.1); padding: 30px; }
+            .bill-header { display: flex; justify-content: space-between; border-bottom: 2px solid #3498db; padding-bottom: 20px; margin-bottom: 20px; }
+            .company-info { flex: 2; }
+            .bill-info { flex: 1; text-align: right; }
+            .bill-title { color: #3498db; margin-top: 0; }
+            .customer-section { margin-bottom: 30px; padding-bottom: 20px; border-bottom: 1px solid #eee; }
+            .reading-section { margin-bottom: 30px; padding-bottom: 20px; border-bottom: 1px solid #eee; }
+            .reading-container { display: flex; justify-content: space-between; margin-bottom: 15px; }
+            .reading-box { flex: 1; padding: 15px; background-color: #f9f9f9; margin: 0 10px; border-radius: 5px; }
+            .reading-box:first-child { margin-left: 0; }
+            .reading-box:last-child { margin-right: 0; }
+            .charges-section { margin-bottom: 30px; }
+            .charge-row { display: flex; justify-content: space-between; margin-bottom: 10px; }
+            .total-row { display: flex; justify-content: space-between; font-weight: bold; font-size: 1.1em; border-top: 1px solid #ddd; padding-top: 10px; margin-top: 10px; }
+            .error-message { background-color: #ffe0e0; border-left: 4px solid #e74c3c; padding: 10px; margin-bottom: 20px; color: #c0392b; }
+            .actions { margin-top: 30px; text-align: center; }
+            .btn { display: inline-block; padding: 10px 20px; background-color: #3498db; color: white; text-decoration: none; border-radius: 5px; margin: 0 10px; }
+            .btn:hover { background-color: #2980b9; }
+            .btn-print { background-color: #2ecc71; }
+            .btn-print:hover { background-color: #27ae60; }
+            .slabs { width: 100%; border-collapse: collapse; margin: 20px 0; }
+            .slabs th, .slabs td { border: 1px solid #ddd; padding: 8px; text-align: center; }
+            .slabs th { background-color: #f2f2f2; }
+            .slabs .total { font-weight: bold; background-color: #f9f9f9; }
+            .slabs .total td:first-child { text-align: right; }
+            .slabs .total td:last-child { background-color: #ffcf33; }
+            .tariff-info { border: 1px solid #ddd; padding: 15px; margin-top: 20px; background-color: #f9f9f9; }
+            .tariff-info h3 { margin-top: 0; color: #3498db; }
+            .tariff-info ul { padding-left: 20px; }
+            @media print {
+                .actions { display: none; }
+                body { background-color: white; }
+                .container { box-shadow: none; padding: 0; }
+            }
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="bill-header">
+                <div class="company-info">
+                    <h1 class="bill-title">Electricity Bill</h1>
+                    <p>Energy Provider Company</p>
+                    <p>123 Power Street</p>
+                    <p>support@energyprovider.com | (555) 123-4567</p>
+                </div>
+                <div class="bill-info">
+                    <p><strong>Bill Date:</strong> {{ current_date }}</p>
+                    <p><strong>Bill #:</strong> {{ bill_number }}</p>
+                    <p><strong>Due Date:</strong> {{ due_date }}</p>
+                </div>
+            </div>
+
+            <div class="customer-section">
+                <h2>Customer Information</h2>
+                <p><strong>Account #:</strong> DEMO-ACCOUNT</p>
+                <p><strong>Name:</strong> Demo Customer</p>
+                <p><strong>Service Address:</strong> 456 Sample Avenue</p>
+            </div>
+
+            {{ comment }}
+
+            <div class="reading-section">
+                <h2>Meter Readings</h2>
+                <div class="reading-container">
+                    <div class="reading-box">
+                        <h3>Current Reading</h3>
+                        <p><strong>Value:</strong> <span id="currentReading">{{ current }}</span></p>
+                        <p><strong>Date:</strong> {{ current_date }}</p>
+                    </div>
+
+                    {{ previous_box }}
+
+                    <div class="reading-box">
+                        <h3>Consumption</h3>
+                        <p><strong>Value:</strong> <span id="consumptionValue">{{ consumption }}</span> kWh</p>
+                        <p><strong>Period:</strong> Current billing cycle</p>
+                    </div>
+                </div>
+            </div>
+
+            <div id="bill-container">
+                {{ bill }}
+            </div>
+
+            <div class="actions">
+                <a href="javascript:window.print()" class="btn btn-print">Print Bill</a>
+                <a href="/upload" class="btn">Return to Upload</a>
+                <a href="/view/{{ image_id }}" class="btn">View Meter Images</a>
+            </div>
+        </div>
+    </body>
+    </html>
+""")
+
+BILL_PREVIOUS_BOX = PageTemplate("""
+    <div class="reading-box">
+        <h3>Previous Reading</h3>
+        <p><strong>Value:</strong> <span id="previousReading">{{ previous }}</span></p>
+        <p><strong>Date:</strong> N/A</p>
+    </div>
+""")
+
+BILL_SECTION = PageTemplate("""
+    <div class="charges-section">
+        <h2>Bill Calculation</h2>
+        <div class="charge-row"><div><strong>Current Reading:</strong></div><div>{{ current_reading }} kWh</div></div>
+        <div class="charge-row"><div><strong>Previous Reading:</strong></div><div>{{ previous_reading }} kWh</div></div>
+        <div class="charge-row"><div><strong>Units Consumed:</strong></div><div>{{ units_consumed }} kWh</div></div>
+
+        <h3>Slabwise Calculation of CC Charges</h3>
+        <table class="slabs">
+            <thead>
+                <tr><th>From Unit</th><th>To Unit</th><th>Units</th><th>Rate (₹)</th><th>Amount (₹)</th></tr>
+            </thead>
+            <tbody>
+                {{ slab_rows }}
+                <tr class="total"><td colspan="4">Total</td><td>₹{{ energy_charges }}</td></tr>
+            </tbody>
+        </table>
+
+        <div class="charge-row"><div>Energy Charges</div><div>₹{{ energy_charges }}</div></div>
+        <div class="charge-row"><div>CC Subsidy</div><div>- ₹{{ cc_subsidy }}</div></div>
+        <div class="charge-row"><div>Net Current Charges</div><div>₹{{ net_current_charges }}</div></div>
+        <div class="charge-row"><div>New Subsidy</div><div>- ₹{{ new_subsidy }}</div></div>
+        <div class="total-row"><div>Amount Payable</div><div>₹{{ final_bill_amount }}</div></div>
+
+        <div class="tariff-info">
+            <h3>Tariff Information</h3>
+            <p>This bill is calculated based on the following electricity tariff slabs:</p>
+            <ul>{{ tariff_rows }}</ul>
+            <p style="margin-bottom: 0;"><strong>Note:</strong> Subsidies may apply as per current regulations.</p>
+        </div>
+    </div>
+""")
+
+SLAB_ROW = PageTemplate("<tr><td>{{ from_unit }}</td><td>{{ to_unit }}</td><td>{{ units }}</td><td>{{ rate }}</td><td>{{ amount }}</td></tr>")
+
+
+def render_view_page(image_id, previous_reading=None, has_previous_images=False):
+    """/view page; previous_reading is None when there is no previous reading"""
+    image_id = escape(image_id)
+    previous_section = ""
+    if has_previous_images:
+        previous_section = VIEW_PREVIOUS_IMAGES.render(image_id=image_id)
+    elif previous_reading is not None:
+        previous_section = VIEW_PREVIOUS_MANUAL.render(previous_reading=escape(str(previous_reading)))
+    return VIEW_PAGE.render(image_id=image_id, previous_section=previous_section)
+
+
+def render_bill_section(bill, current_reading, previous_reading):
+    """Bill calculation section of /generate-bill: slab-wise charges, subsidies and the amount due"""
+    slab_rows = "".join(
+        SLAB_ROW.render(
+            from_unit=slab["from_unit"],
+            to_unit=slab["to_unit"],
+            units=format_amount(slab["units"]),
+            rate=format_amount(slab["rate"]),
+            amount=format_amount(slab["amount"]),
+        )
+        for slab in bill["slab_charges"]
+    )
+    tariff_rows = "".join(
+        f"<li>{from_unit}-{to_unit} units: ₹{rate:.2f} per unit</li>" if to_unit else f"<li>Above {from_unit - 1} units: ₹{rate:.2f} per unit</li>"
+        for from_unit, to_unit, rate in tariff_slabs(bill["units_consumed"])
+    )
+    return BILL_SECTION.render(
+        current_reading=format_amount(current_reading),
+        previous_reading=format_amount(previous_reading),
+        units_consumed=format_amount(bill["units_consumed"]),
+        slab_rows=slab_rows,
+        energy_charges=format_amount(bill["energy_charges"]),
+        cc_subsidy=format_amount(bill["cc_subsidy"]),
+        net_current_charges=format_amount(bill["net_current_charges"]),
+        new_subsidy=format_amount(bill["new_subsidy"]),
+        final_bill_amount=format_amount(bill["final_bill_amount"]),
+        tariff_rows=tariff_rows,
+    )
+
+
+def render_bill_page(image_id, current, previous, consumption, comment, bill_section, current_date, due_date):
+    """/generate-bill page; current, previous and consumption are shown as given"""
+    return BILL_PAGE.render(
+        image_id=escape(image_id),
+        bill_number=escape(image_id[:8]),
+        current_date=current_date,
+        due_date=due_date,
+        comment=f'<div class="error-message">{escape(comment)}</div>' if comment else "",
+        current=escape(current),
+        previous_box=BILL_PREVIOUS_BOX.render(previous=escape(previous)) if previous else "",
+        consumption=escape(consumption),
+        bill=bill_section,
+    )
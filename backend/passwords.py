@@ -0,0 +1,107 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from passlib.context import CryptContext
+from starlette.exceptions import HTTPException
+
+from metrics import Counter
+
+# Hashing policy. New hashes use the first scheme; hashes in the other schemes, or in the first
+# with a different cost, still verify and are replaced with a policy hash on the next login.
+PASSWORD_SCHEMES = [s.strip() for s in os.environ.get("PASSWORD_SCHEMES", "sha256_crypt").split(",") if s.strip()]
+PASSWORD_ROUNDS = int(os.environ.get("PASSWORD_ROUNDS", "0"))  # 0 keeps the scheme's default cost
+
+# Hashing runs off the event loop: "process" (passlib's builtin hashes are pure Python and hold
+# the GIL), "thread" or "inline". Beyond PASSWORD_HASH_MAX_PENDING hashes waiting for a worker,
+# requests are turned away with a 503 instead of queueing without bound.
+PASSWORD_HASH_EXECUTOR = os.environ.get("PASSWORD_HASH_EXECUTOR", "process")
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", str(4 * PASSWORD_HASH_WORKERS)))
+
+PASSWORD_REHASHES = Counter("meterease_password_rehashes", "Password hashes upgraded to the current policy on login")
+PASSWORD_HASH_REJECTED = Counter("meterease_password_hash_rejected", "Hash requests turned away because the pool was full")
+
+
+def build_context(schemes=PASSWORD_SCHEMES, rounds=PASSWORD_ROUNDS):
+    """CryptContext for a hashing policy; any hash not made with exactly that policy needs an update"""
+    settings = {}
+    if rounds:
+        # Pinning min and max flags hashes of any other cost, whether the policy went up or down
+        for key in ("default_rounds", "min_rounds", "max_rounds"):
+            settings[f"{schemes[0]}__{key}"] = rounds
+    return CryptContext(schemes=schemes, deprecated="auto", **settings)
+
+
+# Built at import, so worker processes get the same policy from the environment
+pwd_context = build_context()
+
+_executor = None
+_pending = 0
+
+
+def _forget_executor():
+    # A pool inherited through fork() belongs to the parent; children create their own on first use
+    global _executor, _pending
+    _executor = None
+    _pending = 0
+
+
+os.register_at_fork(after_in_child=_forget_executor)
+
+
+def get_executor():
+    """Return the configured hashing executor, creating it on first use"""
+    global _executor
+    if _executor is None and PASSWORD_HASH_EXECUTOR == "thread":
+        _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="passwords")
+    elif _executor is None and PASSWORD_HASH_EXECUTOR == "process":
+        _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _hash(password):
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password, hashed_password):
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+async def _run(fn, *args):
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        PASSWORD_HASH_REJECTED.inc()
+        raise HTTPException(status_code=503, detail="Too many sign-ins in progress, try again shortly", headers={"Retry-After": "1"})
+    executor = get_executor()
+    if executor is None:
+        return fn(*args)
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password):
+    """Hash a new password with the current policy"""
+    return await _run(_hash, password)
+
+
+async def verify_password(password, hashed_password):
+    """
+    Check a password against its stored hash.
+    Returns (verified, new_hash); new_hash is a policy hash to store in place of the old one
+    when the stored hash was made with another scheme or cost, and None otherwise.
+    """
+    verified, new_hash = await _run(_verify_and_update, password, hashed_password)
+    if new_hash:
+        PASSWORD_REHASHES.inc()
+    return verified, new_hash
@@ -0,0 +1,324 @@
+import asyncio
+import os
+import struct
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import cv2
+import numpy as np
+import supervision as sv
+
+from decoder import decode_batch
+from image_store import image_store
+from inference import get_backend
+from metrics import timed
+
+# How the CPU-bound image pipeline is run:
+#   inline  - on the event loop (blocks other requests while it runs)
+#   thread  - in a bounded thread pool; cv2 and the backends release the GIL
+#   process - the whole pipeline in a bounded process pool, one warm backend per worker
+PIPELINE_EXECUTOR = os.environ.get("PIPELINE_EXECUTOR", "thread")
+PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", str(os.cpu_count() or 1)))
+
+# Downscaling before inference; the model resizes to its small input size anyway, so
+# decoding a 12 MP phone photo at full resolution mostly costs time and memory:
+#   full   - decode at full resolution (default)
+#   reduce - let the JPEG decoder scale by 1/2, 1/4 or 1/8, as far as the long side stays >= PREPROCESS_MAX_SIDE
+#   resize - reduce, then resize the long side down to exactly PREPROCESS_MAX_SIDE
+PREPROCESS_MODE = os.environ.get("PREPROCESS_MODE", "full")
+PREPROCESS_MAX_SIDE = int(os.environ.get("PREPROCESS_MAX_SIDE", "640"))
+
+REDUCED_DECODE_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+# JPEG start-of-frame markers, which carry the image size
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+_executor = None
+
+
+class ImagePipelineError(Exception):
+    """Pipeline failure carrying the HTTP status to report; safe to send back from a worker process"""
+
+    def __init__(self, status_code, detail):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _init_worker():
+    """Load the inference backend once when a pool process starts"""
+    get_backend()
+
+
+def _forget_executor():
+    # A pool inherited through fork() belongs to the parent; children create their own on first use
+    global _executor
+    _executor = None
+
+
+os.register_at_fork(after_in_child=_forget_executor)
+
+
+def get_executor():
+    """Return the configured pipeline executor, creating it on first use"""
+    global _executor
+    if _executor is None and PIPELINE_EXECUTOR == "thread":
+        _executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+    elif _executor is None and PIPELINE_EXECUTOR == "process":
+        _executor = ProcessPoolExecutor(max_workers=PIPELINE_WORKERS, initializer=_init_worker)
+    return _executor
+
+
+async def run_in_executor(fn, *args):
+    """Run fn(*args) in the pipeline executor and await the result"""
+    executor = get_executor()
+    if executor is None:
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(fn, *args))
+
+
+_pending_writes = set()
+
+
+def image_dimensions(image_content):
+    """(width, height) read from a JPEG or PNG header without decoding, or None for other formats"""
+    if image_content[:8] == b"\x89PNG\r\n\x1a\n" and len(image_content) >= 24:
+        return struct.unpack(">II", image_content[16:24])
+    if image_content[:2] != b"\xff\xd8":
+        return None
+
+    # Walk the JPEG segments up to the start-of-frame
+    i = 2
+    while i + 9 < len(image_content):
+        if image_content[i] != 0xFF:
+            return None
+        marker = image_content[i + 1]
+        if marker == 0xFF:
+            # Fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Markers without a length
+            i += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", image_content[i + 5:i + 9])
+            return width, height
+        i += 2 + struct.unpack(">H", image_content[i + 2:i + 4])[0]
+    return None
+
+
+def decode_image(image_content, image_type, mode=PREPROCESS_MODE, max_side=PREPROCESS_MAX_SIDE):
+    """
+    Decode an uploaded image in memory, downscaled as mode asks; it goes straight to the backend without touching disk.
+    Returns the image and the (x, y) factors that map its pixel coordinates back to the full-size original.
+    """
+    dimensions = image_dimensions(image_content) if mode != "full" else None
+
+    # Largest decoder reduction that keeps the long side at or above max_side
+    factor = 1
+    if dimensions:
+        factor = next((f for f in (8, 4, 2) if max(dimensions) / f >= max_side), 1)
+
+    np_img = np.frombuffer(image_content, np.uint8)
+    img = cv2.imdecode(np_img, REDUCED_DECODE_FLAGS[factor])
+
+    if img is None:
+        raise ImagePipelineError(400, f"Invalid {image_type} image format")
+
+    height, width = img.shape[:2]
+    original_width, original_height = dimensions or (width, height)
+    if (original_width > original_height) != (width > height) and width != height:
+        # The decoder applied an EXIF rotation the header size doesn't reflect
+        original_width, original_height = original_height, original_width
+
+    if mode == "resize" and max(width, height) > max_side:
+        ratio = max_side / max(width, height)
+        img = cv2.resize(img, (round(width * ratio), round(height * ratio)), interpolation=cv2.INTER_AREA)
+        height, width = img.shape[:2]
+
+    return img, (original_width / width, original_height / height)
+
+
+def _write_atomically(path, content):
+    """Write to a temporary file and rename it into place, so readers never see a partial image"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_in_background(path, content):
+    """Write bytes to path on a background thread; the caller does not wait for the write"""
+    future = asyncio.get_running_loop().run_in_executor(None, _write_atomically, path, content)
+
+    # Keep a reference until the write finishes
+    _pending_writes.add(future)
+    future.add_done_callback(_pending_writes.discard)
+    return future
+
+
+def save_original(image_content, image_id, image_type):
+    """Write the uploaded bytes verbatim as the original image, without waiting for it"""
+    return write_in_background(image_store.writable_path(image_id, image_type), image_content)
+
+
+async def discard_original(saved, image_id, image_type):
+    """Remove what save_original() wrote for an upload that turned out to be unusable"""
+    await asyncio.gather(saved, return_exceptions=True)
+    try:
+        os.remove(image_store.path(image_id, image_type))
+    except FileNotFoundError:
+        pass
+
+
+# Annotators hold no per-image state, so one pair serves every render
+BOX_ANNOTATOR = sv.BoundingBoxAnnotator()
+LABEL_ANNOTATOR = sv.LabelAnnotator()
+
+# Size of the annotated result image
+RESULT_WIDTH = 600
+RESULT_HEIGHT = 300
+
+
+def read_detections(result, scale=(1.0, 1.0)):
+    """
+    Turn raw predictions into the meter reading and its detections with decode_batch().
+    Detections are [x1, y1, x2, y2, confidence, class] lists sorted left to right, in pixels
+    of the full-size original (predictions are scaled by scale from a downscaled image);
+    they are what gets persisted and later rendered.
+    """
+    decoded = decode_batch([result], [scale])[0]
+    return decoded["meter_reading"], decoded["detections"]
+
+
+def predict_and_decode_batch(items):
+    """MicroBatcher handler: batched inference and decoding of (image, scale) pairs from decode_image()"""
+    predictions = get_backend().predict_batch([img for img, _ in items])
+    return decode_batch(predictions, [scale for _, scale in items])
+
+
+def annotate_result(img, detections, scale=(1.0, 1.0), timings=None):
+    """
+    Annotate, resize and JPEG-encode the result image and return the encoded bytes.
+    img may be downscaled from the original by scale, as returned by decode_image().
+    Stage durations are added to the timings dict when one is given.
+    """
+    with timed("annotate", timings):
+        if detections:
+            boxes = np.array([d[:4] for d in detections], dtype=float) / np.array([*scale, *scale])
+            confidence_scores = np.array([d[4] for d in detections], dtype=float)
+        else:
+            boxes = np.empty((0, 4))
+            confidence_scores = np.empty(0)
+
+        # Create Supervision Detections object
+        sv_detections = sv.Detections(
+            xyxy=boxes,
+            confidence=confidence_scores,
+            class_id=np.arange(len(detections))
+        )
+
+        # Annotate image
+        labels = [d[5] for d in detections]
+        annotated_image = BOX_ANNOTATOR.annotate(scene=img.copy(), detections=sv_detections)
+        annotated_image = LABEL_ANNOTATOR.annotate(scene=annotated_image, detections=sv_detections, labels=labels)
+
+        # Resize final image
+        resized_image = cv2.resize(annotated_image, (RESULT_WIDTH, RESULT_HEIGHT))
+
+    # Encode once; the same bytes are stored and returned to the caller
+    with timed("encode", timings):
+        _, img_encoded = cv2.imencode('.jpg', resized_image)
+        return img_encoded.tobytes()
+
+
+def render_result(img, detections, image_id, image_type, scale=(1.0, 1.0), timings=None):
+    """annotate_result() once, store the result image and return the encoded bytes"""
+    processed_image = annotate_result(img, detections, scale, timings)
+    with timed("write_result", timings):
+        _write_atomically(image_store.writable_path(image_id, image_type, processed=True), processed_image)
+    return processed_image
+
+
+def render_upload(image_content, detections, image_id, image_type):
+    """render_result() for an upload that is still in memory; returns the JPEG bytes and stage timings"""
+    timings = {}
+    # The result is only RESULT_WIDTH wide, so there is no need to decode at full size
+    with timed("decode", timings):
+        img, scale = decode_image(image_content, image_type, "reduce", RESULT_WIDTH)
+    return render_result(img, detections, image_id, image_type, scale, timings), timings
+
+
+def render_stored(image_id, image_type, detections):
+    """
+    Render the result image from the stored original and persisted detections.
+    Returns the result path, or None when the original is no longer stored, and stage timings.
+    """
+    timings = {}
+    original_path = image_store.resolve(image_id, image_type)
+    if original_path is None:
+        return None, timings
+    with timed("decode", timings):
+        with open(original_path, "rb") as f:
+            image_content = f.read()
+        try:
+            img, scale = decode_image(image_content, image_type, "reduce", RESULT_WIDTH)
+        except ImagePipelineError:
+            return None, timings
+    render_result(img, detections, image_id, image_type, scale, timings)
+    return image_store.path(image_id, image_type, processed=True), timings
+
+
+def run_pipeline(image_content, image_id, image_type, render=False):
+    """
+    Decode and predict in one call, so a worker process does the whole job.
+    The result image is only rendered when render is set; otherwise it is left
+    to render_stored() the first time someone asks for it.
+    Stage durations come back under "timings", since a worker process can't record them itself.
+    """
+    timings = {}
+    with timed("decode", timings):
+        img, scale = decode_image(image_content, image_type)
+
+    try:
+        # Run prediction using the configured backend
+        with timed("inference", timings):
+            result = get_backend().predict(img)
+    except Exception as e:
+        raise ImagePipelineError(500, f"Prediction failed for {image_type} image: {str(e)}")
+
+    try:
+        meter_reading, detections = read_detections(result, scale)
+    except Exception as e:
+        raise ImagePipelineError(500, f"Decoding failed for {image_type} image: {str(e)}")
+    return {
+        "meter_reading": meter_reading,
+        "detections": detections,
+        "processed_image": render_result(img, detections, image_id, image_type, scale, timings) if render else None,
+        "timings": timings,
+    }
+
+
+def warm_up():
+    """
+    Run a synthetic meter image through decoding, inference, digit decoding and annotation,
+    storing nothing, so the backend and libraries have done their lazy setup before the first request.
+    Only the backend loading and running one inference has to succeed: the model may find no
+    digits in the synthetic image, and a failure past inference is logged rather than raised.
+    """
+    img = np.full((480, 640, 3), 255, np.uint8)
+    cv2.putText(img, "01234", (40, 300), cv2.FONT_HERSHEY_SIMPLEX, 4, (0, 0, 0), 10)
+    _, encoded = cv2.imencode(".jpg", img)
+    img, scale = decode_image(encoded.tobytes(), "warm-up")
+    predictions = get_backend().predict_batch([img])
+    try:
+        detections = decode_batch(predictions, [scale])[0]["detections"]
+        annotate_result(img, detections, scale)
+    except Exception as e:
+        print(f"Warm-up past inference failed: {e}")
@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+
+# Result cache configuration
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get("RESULT_CACHE_TTL_SECONDS", "3600"))
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "")  # empty disables the on-disk tier
+RESULT_CACHE_DISK_MAX_BYTES = int(os.environ.get("RESULT_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+RESULT_CACHE_SWEEP_INTERVAL_SECONDS = float(os.environ.get("RESULT_CACHE_SWEEP_INTERVAL_SECONDS", "600"))
+
+
+def content_hasher(model_version):
+    """SHA-256 seeded with the model version; feed it an upload's bytes and hexdigest() is its cache_key()"""
+    return hashlib.sha256(model_version.encode("utf-8"))
+
+
+def cache_key(image_content, model_version):
+    """Content address of an upload: SHA-256 of the model version and the raw bytes"""
+    digest = content_hasher(model_version)
+    digest.update(image_content)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Prediction results keyed by cache_key().
+
+    Entries are the meter reading plus its detections; result images are
+    rendered from those on demand. The memory tier is an LRU bounded by the
+    serialized size of the entries; the optional disk tier keeps one JSON
+    file per entry under cache_dir and is consulted on memory misses. Both
+    tiers expire entries after ttl_seconds.
+
+    A disk file's mtime is when it was written and its atime when it was last
+    read, so sweep_disk() can drop expired and least recently used files
+    without opening them. The sweeper runs it every
+    RESULT_CACHE_SWEEP_INTERVAL_SECONDS to keep the tier under disk_max_bytes.
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES, ttl_seconds=RESULT_CACHE_TTL_SECONDS, cache_dir=RESULT_CACHE_DIR,
+                 disk_max_bytes=RESULT_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.cache_dir = cache_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._sweeper = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _expired(self, created_at):
+        return time.time() - created_at > self.ttl_seconds
+
+    def _store(self, key, entry):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)["size"]
+        self._entries[key] = entry
+        self._bytes += entry["size"]
+
+        # Evict least recently used entries until we are back under budget
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted["size"]
+            self.evictions += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_disk(self, key):
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            entry = json.loads(data)
+            if self._expired(entry["created_at"]):
+                os.remove(path)
+                return None
+            # Record the read for LRU eviction, keeping the write time
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+            entry["size"] = len(data)
+            return entry
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_disk(self, key, data):
+        path = self._disk_path(key)
+        # Write then rename, so a reader never sees a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def sweep_disk(self):
+        """
+        Delete expired disk entries, then the least recently read ones until the
+        tier fits in disk_max_bytes. Returns the number of files deleted.
+        """
+        now = time.time()
+        files = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat_result = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat_result.st_atime, stat_result.st_mtime, stat_result.st_size, entry.path))
+
+        removed = 0
+        kept = []
+        total_bytes = 0
+        for atime, mtime, size, path in files:
+            if now - mtime > self.ttl_seconds:
+                removed += self._remove_disk(path)
+            else:
+                kept.append((atime, size, path))
+                total_bytes += size
+
+        # Least recently read first
+        kept.sort()
+        for _, size, path in kept:
+            if total_bytes <= self.disk_max_bytes:
+                break
+            evicted = self._remove_disk(path)
+            removed += evicted
+            self.disk_evictions += evicted
+            total_bytes -= size
+        return removed
+
+    def _remove_disk(self, path):
+        # Another process sharing the directory may have removed it first
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+    async def _sweep_forever(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.sweep_disk)
+            except Exception as e:
+                print(f"Result cache sweep failed: {e}")
+            await asyncio.sleep(RESULT_CACHE_SWEEP_INTERVAL_SECONDS)
+
+    def start_sweeper(self):
+        """Run sweep_disk() every RESULT_CACHE_SWEEP_INTERVAL_SECONDS while the disk tier is enabled"""
+        if self.cache_dir and self._sweeper is None:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_forever())
+
+    async def stop_sweeper(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+    async def get(self, key):
+        """Return the cached entry for key, or None"""
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry["created_at"]):
+            self._bytes -= self._entries.pop(key)["size"]
+            entry = None
+
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        if self.cache_dir:
+            entry = await asyncio.get_running_loop().run_in_executor(None, self._read_disk, key)
+            if entry is not None:
+                self._store(key, entry)
+                self.hits += 1
+                self.disk_hits += 1
+                return entry
+
+        self.misses += 1
+        return None
+
+    async def put(self, key, meter_reading, detections):
+        """Cache a reading and its detections"""
+        entry = {"meter_reading": meter_reading, "detections": detections, "created_at": time.time()}
+        data = json.dumps(entry).encode("utf-8")
+        self._store(key, {**entry, "size": len(data)})
+        if self.cache_dir:
+            await asyncio.get_running_loop().run_in_executor(None, self._write_disk, key, data)
+
+    def stats(self):
+        """Hit/miss counters and memory tier usage"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "disk_tier": bool(self.cache_dir),
+            "disk_max_bytes": self.disk_max_bytes,
+            "disk_evictions": self.disk_evictions,
+        }
@@ -0,0 +1,120 @@
+import numpy as np
+
+# Slab tariff, from calculateElectricityBill in static/bill-calculator.js. Consumption up to
+# ENTRY_SCHEDULE_MAX_UNITS is billed on the entry schedule; anything above is billed on the
+# upper schedule from the first unit. Each schedule is (slab upper bounds, rate per unit).
+ENTRY_SCHEDULE_MAX_UNITS = 500
+ENTRY_SCHEDULE = ((100, 200, 400, 500), (0.0, 2.35, 4.7, 6.3))
+UPPER_SCHEDULE = ((100, 400, 500, 600, 800, 1000, np.inf), (0.0, 4.7, 6.3, 8.4, 9.45, 10.5, 11.55))
+
+# Open-ended slabs are shown as ending here, as on the printed bill
+LAST_SLAB_DISPLAY_TO_UNIT = 5000
+
+# CC subsidy by consumption: (up to units, subsidy); the last entry applies above all of them
+CC_SUBSIDY = ((300, 255.0), (500, 280.0), (700, 255.0), (np.inf, 80.0))
+
+# Fixed subsidy on every bill
+NEW_SUBSIDY = 480.0
+
+# Far beyond any meter, yet small enough that every bill amount stays finite
+MAX_UNITS = 1e9
+
+
+def _slab_amounts(units, schedule):
+    """Units and amount billed in each slab of schedule, as (n, slabs) arrays"""
+    upper = np.asarray(schedule[0], dtype=np.float64)
+    lower = np.concatenate(([0.0], upper[:-1]))
+    slab_units = np.clip(units[:, None] - lower, 0.0, upper - lower)
+    return slab_units, slab_units * np.asarray(schedule[1], dtype=np.float64)
+
+
+def _sum_in_order(amounts):
+    # Left to right like the JS loop, so float rounding (and with it Math.round) matches exactly
+    total = np.zeros(amounts.shape[0])
+    for column in amounts.T:
+        total += column
+    return total
+
+
+def js_round(values):
+    """Math.round(): halves round towards +infinity"""
+    return np.floor(values + 0.5)
+
+
+def as_units(values):
+    """
+    Consumption values as a flat float64 array.
+    Raises ValueError unless values is a flat sequence of numbers from 0 to MAX_UNITS.
+    """
+    units = np.asarray(values)
+    if units.ndim != 1 or (units.size and units.dtype.kind not in "iuf"):
+        raise ValueError("units must be a flat list of numbers")
+    # numpy turns [True, 5] into integers, so look for booleans among the values themselves
+    if not isinstance(values, np.ndarray) and bool in set(map(type, values)):
+        raise ValueError("units must be a flat list of numbers")
+    units = units.astype(np.float64)
+    if not np.isfinite(units).all() or (units < 0).any() or (units > MAX_UNITS).any():
+        raise ValueError(f"units must be finite, not negative and at most {MAX_UNITS:.0f}")
+    return units
+
+
+def compute_bills(units):
+    """
+    Bill amounts for any number of consumption values at once.
+    Returns a dict of float64 arrays shaped like units: energy_charges, cc_subsidy,
+    net_current_charges, new_subsidy and final_bill_amount.
+    """
+    units = np.asarray(units, dtype=np.float64)
+    flat = units.reshape(-1)
+
+    entry = flat <= ENTRY_SCHEDULE_MAX_UNITS
+    total = np.empty_like(flat)
+    for schedule, selected in ((ENTRY_SCHEDULE, entry), (UPPER_SCHEDULE, ~entry)):
+        if selected.any():
+            total[selected] = _sum_in_order(_slab_amounts(flat[selected], schedule)[1])
+
+    bounds = np.array([bound for bound, _ in CC_SUBSIDY])
+    subsidies = np.array([subsidy for _, subsidy in CC_SUBSIDY])
+    cc_subsidy = subsidies[np.minimum(np.searchsorted(bounds, flat), len(bounds) - 1)]
+
+    energy_charges = js_round(total)
+    net_current_charges = energy_charges - cc_subsidy
+    return {
+        "energy_charges": energy_charges.reshape(units.shape),
+        "cc_subsidy": cc_subsidy.reshape(units.shape),
+        "net_current_charges": net_current_charges.reshape(units.shape),
+        "new_subsidy": np.full(units.shape, NEW_SUBSIDY),
+        "final_bill_amount": (net_current_charges - NEW_SUBSIDY).reshape(units.shape),
+    }
+
+
+def tariff_slabs(units):
+    """(from unit, to unit, rate) of each slab of the schedule units are billed on; to unit is None for the open-ended slab"""
+    bounds, rates = ENTRY_SCHEDULE if units <= ENTRY_SCHEDULE_MAX_UNITS else UPPER_SCHEDULE
+    lowers = (0,) + bounds[:-1]
+    return [(lower + 1, None if upper == np.inf else upper, rate) for lower, upper, rate in zip(lowers, bounds, rates)]
+
+
+def compute_bill(units):
+    """
+    Bill for a single consumption value, with the slab-wise breakdown shown on the bill.
+    Same fields as calculateElectricityBill() in static/bill-calculator.js, in snake_case.
+    """
+    schedule = ENTRY_SCHEDULE if units <= ENTRY_SCHEDULE_MAX_UNITS else UPPER_SCHEDULE
+    slab_units, amounts = _slab_amounts(np.array([units], dtype=np.float64), schedule)
+
+    slab_charges = []
+    for (from_unit, to_unit, rate), slab_unit, amount in zip(tariff_slabs(units), slab_units[0], amounts[0]):
+        slab_charges.append({
+            "from_unit": from_unit,
+            "to_unit": LAST_SLAB_DISPLAY_TO_UNIT if to_unit is None else to_unit,
+            "rate": rate,
+            "units": float(slab_unit),
+            "amount": float(amount),
+        })
+        # Slabs past the one the consumption ends in are left off
+        if to_unit is None or units <= to_unit:
+            break
+
+    bill = {name: float(value) for name, value in compute_bills(units).items()}
+    return {"units_consumed": float(units), "slab_charges": slab_charges, **bill}
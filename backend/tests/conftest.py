@@ -0,0 +1,81 @@
+import atexit
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The backend is a flat set of modules run from its own directory
+sys.path.insert(0, BACKEND_DIR)
+
+# Databases, the image store and uploads live at paths relative to the working directory;
+# run from a scratch directory so tests never touch the checked-in databases
+os.environ.setdefault("INFERENCE_BACKEND", "fake")
+_workdir = tempfile.mkdtemp(prefix="meterease-tests-")
+os.symlink(os.path.join(BACKEND_DIR, "static"), os.path.join(_workdir, "static"))
+os.chdir(_workdir)
+atexit.register(shutil.rmtree, _workdir, ignore_errors=True)
+
+
+@pytest.fixture(scope="module")
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture(scope="module")
+def client(app_module):
+    """The meter service, started once per test module"""
+    with TestClient(app_module.app) as client:
+        yield client
+
+
+_photo_numbers = itertools.count()
+
+
+@pytest.fixture
+def meter_photo():
+    """Make a JPEG no other test uploads, so none is answered from the result cache"""
+    def meter_photo(shade=100):
+        img = np.full((240, 320, 3), shade, np.uint8)
+        number = next(_photo_numbers)
+        img[:8, :8] = (number % 256, number // 256 % 256, 255)
+        _, encoded = cv2.imencode(".jpg", img)
+        return encoded.tobytes()
+    return meter_photo
+
+
+@pytest.fixture
+def auth_client(monkeypatch):
+    """The auth service with a cheap, inline password policy and an empty user cache"""
+    import main
+    import passwords
+
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_EXECUTOR", "inline")
+    monkeypatch.setattr(passwords, "pwd_context", passwords.build_context(["sha256_crypt"], 1000))
+    main.user_cache.clear()
+    with TestClient(main.app) as client:
+        yield client
+
+
+_mobile_numbers = itertools.count(9000000000)
+
+
+@pytest.fixture
+def signup(auth_client):
+    """Sign up a new user; returns (mobile number, password, token response)"""
+    def signup():
+        mobile_number, password = str(next(_mobile_numbers)), "correct horse"
+        response = auth_client.post("/signup", json={
+            "name": "Test User", "mobile_number": mobile_number, "password": password, "confirm_password": password,
+        })
+        assert response.status_code == 200, response.text
+        return mobile_number, password, response.json()
+    return signup
@@ -0,0 +1,80 @@
+import io
+import json
+import zipfile
+
+
+def stream_lines(response):
+    return {line["filename"]: line for line in map(json.loads, response.text.splitlines())}
+
+
+def saved_readings(app_module, image_id):
+    # Rows left at the end of a stream are queued after the response; wait for the writer to drain
+    app_module.db_writer.submit(lambda cursor: None).result(timeout=10)
+    with app_module.get_pool(app_module.DATABASE_NAME).connection() as conn:
+        rows = conn.execute(
+            "SELECT reading_type, reading_value FROM meter_readings WHERE image_id = ?", (image_id,)
+        ).fetchall()
+    return sorted(tuple(row) for row in rows)
+
+
+def archive_with_bad_member(good, bad):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        archive.writestr("good.jpg", good)
+        archive.writestr("bad.jpg", bad)
+    data = bytearray(buffer.getvalue())
+    # Corrupt one byte of the second member's data, so reading it fails its CRC check
+    offset = data.index(bad, data.index(b"bad.jpg"))
+    data[offset + len(bad) // 2] ^= 0xFF
+    return bytes(data)
+
+
+def test_batch_streams_a_line_per_image_and_saves_rows(client, app_module, meter_photo, monkeypatch):
+    monkeypatch.setattr(app_module.backend, "reading", "01500")
+
+    response = client.post(
+        "/predict/batch",
+        files=[("images", ("a.jpg", meter_photo(), "image/jpeg")), ("images", ("b.jpg", meter_photo(), "image/jpeg"))],
+        data={"previous_readings": json.dumps({"a.jpg": 1200, "b.jpg": None})},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = stream_lines(response)
+    assert lines["a.jpg"]["status_code"] == 200
+    assert lines["a.jpg"]["consumption"] == 300
+    assert lines["b.jpg"]["previous"] is None
+    assert saved_readings(app_module, lines["a.jpg"]["image_id"]) == [("current", "01500"), ("previous", "1200")]
+    assert saved_readings(app_module, lines["b.jpg"]["image_id"]) == [("current", "01500")]
+
+
+def test_batch_reports_an_unreadable_archive_member_and_goes_on(client, meter_photo):
+    archive = archive_with_bad_member(meter_photo(), meter_photo())
+
+    response = client.post("/predict/batch", files={"archive": ("photos.zip", archive, "application/zip")})
+
+    assert response.status_code == 200
+    lines = stream_lines(response)
+    assert lines["good.jpg"]["status_code"] == 200
+    assert lines["bad.jpg"]["status_code"] == 400
+    assert "Could not read archive member" in lines["bad.jpg"]["error"]
+
+
+def test_batch_rejects_a_bad_previous_reading_before_streaming(client, meter_photo):
+    for reading in ([1, 2], "1200", True, "NaN"):
+        previous_readings = '{"a.jpg": NaN}' if reading == "NaN" else json.dumps({"a.jpg": reading})
+
+        response = client.post(
+            "/predict/batch",
+            files={"images": ("a.jpg", meter_photo(), "image/jpeg")},
+            data={"previous_readings": previous_readings},
+        )
+
+        assert response.status_code == 400, reading
+        assert "must be a finite number or null" in response.json()["detail"]
+
+
+def test_batch_rejects_a_request_without_images(client):
+    response = client.post("/predict/batch", data={"previous_readings": "{}"})
+
+    assert response.status_code == 400
@@ -0,0 +1,34 @@
+import asyncio
+
+from batching import MicroBatcher
+
+
+def test_concurrent_calls_share_one_batch_through_run():
+    calls = []
+
+    async def run(fn, *args):
+        calls.append(fn)
+        return fn(*args)
+
+    def predict_batch(items):
+        return [item * 10 for item in items]
+
+    async def scenario():
+        batcher = MicroBatcher(predict_batch, max_batch_size=4, max_wait_ms=50, run=run)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(4))), batcher
+
+    results, batcher = asyncio.run(scenario())
+    assert results == [0, 10, 20, 30]
+    assert calls == [predict_batch]
+    assert (batcher.batches, batcher.items) == (1, 4)
+
+
+def test_failed_batch_fails_each_caller():
+    def predict_batch(items):
+        raise RuntimeError("backend down")
+
+    async def scenario():
+        batcher = MicroBatcher(predict_batch, max_batch_size=2, max_wait_ms=10)
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+    assert [str(e) for e in asyncio.run(scenario())] == ["backend down", "backend down"]
@@ -0,0 +1,44 @@
+from decoder import decode_batch
+
+
+def digit(cls, x, y=50.0, confidence=0.9):
+    return {"x": x, "y": y, "width": 50.0, "height": 80.0, "confidence": confidence, "class": cls}
+
+
+def test_no_predictions_in_batch():
+    assert decode_batch([[], []]) == [
+        {"meter_reading": "", "detections": [], "digit_confidences": [], "valid": False},
+        {"meter_reading": "", "detections": [], "digit_confidences": [], "valid": False},
+    ]
+
+
+def test_image_without_predictions_next_to_one_with():
+    empty, decoded = decode_batch([[], [digit("1", 40.0), digit("2", 100.0)]])
+    assert empty["meter_reading"] == "" and empty["detections"] == []
+    assert decoded["meter_reading"] == "12"
+
+
+def test_reading_reads_left_to_right():
+    decoded = decode_batch([[digit(c, x) for c, x in (("3", 160.0), ("1", 40.0), ("4", 220.0), ("2", 100.0))]])[0]
+    assert decoded["meter_reading"] == "1234"
+    assert decoded["valid"]
+
+
+def test_overlapping_duplicate_keeps_most_confident():
+    decoded = decode_batch([[digit("7", 40.0, confidence=0.6), digit("1", 42.0, confidence=0.95), digit("2", 100.0)]])[0]
+    assert decoded["meter_reading"] == "12"
+
+
+def test_stray_detection_off_the_row_is_dropped():
+    decoded = decode_batch([[digit("1", 40.0), digit("2", 100.0), digit("9", 70.0, y=400.0)]])[0]
+    assert decoded["meter_reading"] == "12"
+
+
+def test_low_confidence_is_dropped():
+    decoded = decode_batch([[digit("1", 40.0), digit("2", 100.0, confidence=0.1)]])[0]
+    assert decoded["meter_reading"] == "1"
+
+
+def test_scales_map_back_to_original_pixels():
+    decoded = decode_batch([[digit("1", 40.0)]], scales=[(2.0, 4.0)])[0]
+    assert decoded["detections"][0][:4] == [30.0, 40.0, 130.0, 360.0]
@@ -0,0 +1,43 @@
+import uuid
+from datetime import datetime
+
+
+def add_current_readings(app_module, reading_date, count):
+    with app_module.get_pool(app_module.DATABASE_NAME).connection() as conn:
+        ids = []
+        for n in range(count):
+            cursor = conn.execute('''
+            INSERT INTO meter_readings
+            (image_id, reading_value, reading_type, reading_date, original_image_path, processed_image_path)
+            VALUES (?, ?, 'current', ?, 'None', 'None')
+            ''', (str(uuid.uuid4()), f"{n:05d}", reading_date))
+            ids.append(cursor.lastrowid)
+        conn.commit()
+    return ids
+
+
+def test_pages_split_readings_with_the_same_timestamp(client, app_module):
+    # A day no other test writes to, with every reading at the same instant
+    ids = add_current_readings(app_module, datetime(2001, 1, 1, 12), 5)
+    day = {"start_date": "2001-01-01", "end_date": "2001-01-01", "limit": 2}
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        response = client.get("/history", params={**day, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        body = response.json()
+        seen.extend(item["id"] for item in body["items"])
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == sorted(ids, reverse=True)
+    assert pages == 3
+
+
+def test_history_rejects_a_bad_cursor(client):
+    response = client.get("/history", params={"cursor": "not a cursor"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
@@ -0,0 +1,86 @@
+import os
+import time
+import uuid
+
+import cv2
+import numpy as np
+import pytest
+
+import image_store as image_store_module
+from image_store import ImageStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ImageStore(str(tmp_path / "images"))
+
+
+def write_original(store, image_id):
+    path = store.writable_path(image_id, "current")
+    cv2.imwrite(path, np.full((20, 20, 3), 128, np.uint8))
+    return path
+
+
+def test_sweep_deletes_nothing_by_default(store):
+    image_id = str(uuid.uuid4())
+    path = write_original(store, image_id)
+    old = time.time() - 10 * 365 * 86400
+    os.utime(path, (old, old))
+
+    assert store.sweep() == []
+    assert os.path.exists(path)
+
+
+def test_url_still_resolves_after_compaction(store, monkeypatch):
+    monkeypatch.setattr(image_store_module, "IMAGE_STORE_COMPACT_AFTER_DAYS", 1)
+    image_id = str(uuid.uuid4())
+    path = write_original(store, image_id)
+    old = time.time() - 2 * 86400
+    os.utime(path, (old, old))
+    url = store.url(image_id, "current")
+
+    [(_, old_path, new_path)] = store.sweep()
+    assert (old_path, new_path) == (path, os.path.splitext(path)[0] + ".webp")
+    assert store.resolve_url(url.removeprefix("/images/")) == new_path
+
+
+def test_resolve_url_of_result_image(store):
+    image_id = str(uuid.uuid4())
+    path = store.writable_path(image_id, "current", processed=True)
+    open(path, "wb").close()
+    assert store.resolve_url(store.url(image_id, "current", processed=True).removeprefix("/images/")) == path
+
+
+@pytest.mark.parametrize("url_path", ["../../etc/passwd", "ab/cd/../../x_current.jpg", "not-an-image.jpg", ""])
+def test_resolve_url_rejects_other_paths(store, url_path):
+    assert store.resolve_url(url_path) is None
+
+
+def test_sweep_keeps_going_past_a_file_it_cannot_remove(store, monkeypatch):
+    monkeypatch.setattr(image_store_module, "IMAGE_STORE_MAX_AGE_DAYS", 1)
+    old = time.time() - 2 * 86400
+    stuck, evicted = str(uuid.uuid4()), str(uuid.uuid4())
+    for image_id in (stuck, evicted):
+        os.utime(write_original(store, image_id), (old, old))
+    stuck_path = store.path(stuck, "current")
+    remove = os.remove
+
+    def flaky_remove(path):
+        if path == stuck_path:
+            raise PermissionError(13, "Permission denied", path)
+        remove(path)
+    monkeypatch.setattr(image_store_module.os, "remove", flaky_remove)
+
+    assert store.sweep() == [(evicted, store.path(evicted, "current"), None)]
+    assert os.path.exists(stuck_path)
+
+
+@pytest.mark.skipif(image_store_module.fcntl is None, reason="no flock on this platform")
+def test_only_one_store_on_a_root_holds_the_sweep_lock(store):
+    other = ImageStore(store.root)
+
+    assert store._hold_sweep_lock()
+    assert not other._hold_sweep_lock()
+    store._release_sweep_lock()
+    assert other._hold_sweep_lock()
+    other._release_sweep_lock()
@@ -0,0 +1,79 @@
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def upload(client, meter_photo):
+    """A fresh upload's bytes and /predict body"""
+    content = meter_photo()
+    response = client.post(
+        "/predict", params={"response_mode": "urls"},
+        files={"current_image": ("meter.jpg", content, "image/jpeg")},
+    )
+    assert response.status_code == 200
+    return content, response.json()
+
+
+def test_original_is_served_with_validators_and_cache_headers(client, upload):
+    content, body = upload
+
+    response = client.get(body["current"]["original_image_url"])
+
+    assert response.status_code == 200
+    assert response.content == content
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["etag"]
+
+
+def test_matching_etag_gets_a_304(client, upload):
+    _, body = upload
+    url = body["current"]["processed_image_url"]
+    etag = client.get(url).headers["etag"]
+
+    for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = client.get(url, headers={"If-None-Match": header})
+        assert response.status_code == 304, header
+        assert response.content == b""
+
+    assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_ranges_are_served_as_206(client, upload):
+    content, body = upload
+    url = body["current"]["original_image_url"]
+
+    response = client.get(url, headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.content == content[:10]
+    assert response.headers["content-range"] == f"bytes 0-9/{len(content)}"
+
+    response = client.get(url, headers={"Range": "bytes=-5"})
+    assert response.status_code == 206
+    assert response.content == content[-5:]
+
+
+def test_range_past_the_end_gets_a_416(client, upload):
+    content, body = upload
+
+    response = client.get(body["current"]["original_image_url"], headers={"Range": f"bytes={len(content)}-"})
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(content)}"
+
+
+def test_stale_if_range_gets_the_whole_image(client, upload):
+    content, body = upload
+
+    response = client.get(
+        body["current"]["original_image_url"], headers={"Range": "bytes=0-9", "If-Range": '"stale"'}
+    )
+
+    assert response.status_code == 200
+    assert response.content == content
+
+
+def test_unknown_image_is_a_404(client):
+    assert client.get(f"/image/{uuid.uuid4()}/current").status_code == 404
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import inference
+from inference import RoboflowBackend
+
+
+class HostedModel:
+    """Stands in for the Roboflow SDK model, recording what was uploaded"""
+
+    def __init__(self, predictions):
+        self.predictions = predictions
+        self.uploaded = []
+
+    def predict(self, image, confidence, overlap):
+        self.uploaded.append(image.shape)
+        predictions = [dict(p) for p in self.predictions]
+        return type("Result", (), {"json": lambda _: {"predictions": predictions}})()
+
+
+def hosted_backend(predictions):
+    backend = RoboflowBackend.__new__(RoboflowBackend)
+    backend.model = HostedModel(predictions)
+    return backend
+
+
+def test_large_frames_are_downscaled_before_upload(monkeypatch):
+    monkeypatch.setattr(inference, "ROBOFLOW_MAX_SIDE", 640)
+    backend = hosted_backend([{"x": 320.0, "y": 120.0, "width": 32.0, "height": 48.0, "confidence": 0.9, "class": "1"}])
+
+    [prediction] = backend.predict(np.zeros((3000, 4000, 3), np.uint8))
+
+    assert backend.model.uploaded == [(480, 640, 3)]
+    assert prediction["x"] == 2000.0 and prediction["y"] == 750.0
+    assert prediction["width"] == 200.0 and prediction["height"] == 300.0
+
+
+def test_small_frames_are_uploaded_as_they_are(monkeypatch):
+    monkeypatch.setattr(inference, "ROBOFLOW_MAX_SIDE", 640)
+    prediction = {"x": 10.0, "y": 20.0, "width": 5.0, "height": 8.0, "confidence": 0.9, "class": "1"}
+    backend = hosted_backend([prediction])
+
+    assert backend.predict(np.zeros((300, 400, 3), np.uint8)) == [prediction]
+    assert backend.model.uploaded == [(300, 400, 3)]
+
+
+def test_a_backend_must_implement_predict():
+    class NoPredict(inference.InferenceBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        NoPredict()
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from jobs import JobQueue, create_jobs_table
+from migrations import migrate
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_UPLOAD_DIR", str(tmp_path / "uploads"))
+    database = str(tmp_path / "jobs.db")
+    migrate(database, [(1, "prediction_jobs", create_jobs_table)])
+    return JobQueue(database)
+
+
+async def run_one(queue, handler, job_id):
+    queue.start(handler, workers=1)
+    try:
+        for _ in range(100):
+            job = await queue.get(job_id)
+            if job["status"] in ("done", "failed"):
+                return job
+            await queue.wait(job_id, 0.05)
+    finally:
+        await queue.stop()
+
+
+def test_job_runs_and_its_upload_is_removed(queue):
+    async def scenario():
+        job_id = await queue.enqueue(b"image", 12.5)
+        upload_path = os.path.join(jobs.JOB_UPLOAD_DIR, f"{job_id}.upload")
+        assert os.path.exists(upload_path)
+
+        async def handler(image_content, previous_meter_reading):
+            return {"content": image_content.decode(), "previous": previous_meter_reading}
+
+        job = await run_one(queue, handler, job_id)
+        return job, upload_path
+
+    job, upload_path = asyncio.run(scenario())
+    assert job["status"] == "done"
+    assert job["result"] == {"content": "image", "previous": 12.5}
+    assert not os.path.exists(upload_path)
+    assert queue._finished == {}
+
+
+def test_failed_job_records_the_error(queue):
+    async def scenario():
+        job_id = await queue.enqueue(b"image")
+
+        async def handler(image_content, previous_meter_reading):
+            raise RuntimeError("no digits")
+
+        return await run_one(queue, handler, job_id)
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "failed"
+    assert job["error"] == "no digits"
+
+
+def test_wait_forgets_jobs_finished_elsewhere(queue):
+    async def scenario():
+        # Nothing in this process finishes the job, so the wait times out
+        await queue.wait("finished-by-another-process", 0.01)
+
+    asyncio.run(scenario())
+    assert queue._finished == {}
+
+
+def test_uploads_are_not_spooled_under_the_public_image_store():
+    from image_store import IMAGE_STORE_ROOT
+
+    root = os.path.abspath(IMAGE_STORE_ROOT) + os.sep
+    assert not os.path.abspath(jobs.JOB_UPLOAD_DIR).startswith(root)
+
+
+def test_worker_outlives_a_database_error(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_POLL_INTERVAL_SECONDS", 0.01)
+    claim = queue._claim
+    failures = [sqlite3.OperationalError("database is locked")]
+
+    def flaky_claim():
+        if failures:
+            raise failures.pop()
+        return claim()
+    monkeypatch.setattr(queue, "_claim", flaky_claim)
+
+    async def scenario():
+        job_id = await queue.enqueue(b"image")
+
+        async def handler(image_content, previous_meter_reading):
+            return {"ok": True}
+
+        return await run_one(queue, handler, job_id)
+
+    assert asyncio.run(scenario())["status"] == "done"
+
+
+def test_maintenance_requeues_stale_jobs_and_deletes_expired_ones(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_STALE_SECONDS", 60)
+    monkeypatch.setattr(jobs, "JOB_RETENTION_SECONDS", 3600)
+    stale, expired, recent = (asyncio.run(queue.enqueue(b"image")) for _ in range(3))
+    long_ago = datetime.now() - timedelta(hours=2)
+    with queue.pool.connection() as conn:
+        conn.execute("UPDATE prediction_jobs SET status = 'running', updated_at = ? WHERE id = ?", (long_ago, stale))
+        conn.execute("UPDATE prediction_jobs SET status = 'done', updated_at = ? WHERE id = ?", (long_ago, expired))
+        conn.execute("UPDATE prediction_jobs SET status = 'failed' WHERE id = ?", (recent,))
+        conn.commit()
+
+    queue._maintain()
+
+    assert queue._get(stale)["status"] == "queued"
+    assert queue._get(expired) is None
+    assert queue._get(recent)["status"] == "failed"
@@ -0,0 +1,41 @@
+import re
+
+
+def server_timing(response):
+    """Server-Timing header as {stage: milliseconds}"""
+    entries = (entry.split(";dur=") for entry in response.headers["server-timing"].split(", "))
+    return {stage: float(duration) for stage, duration in entries}
+
+
+def sample(metrics_text, name, **labels):
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf"^{name}\{{{re.escape(label_text)}\}} (\S+)$", metrics_text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def test_prediction_stages_show_in_server_timing_and_metrics(client, meter_photo):
+    before = sample(client.get("/metrics").text, "meterease_stage_duration_seconds_count", stage="upload_read") or 0
+
+    response = client.post("/predict", files={"current_image": ("meter.jpg", meter_photo(), "image/jpeg")})
+
+    timings = server_timing(response)
+    assert {"upload_read", "cache_lookup", "total"} <= timings.keys()
+    assert timings["total"] >= timings["upload_read"]
+
+    metrics = client.get("/metrics")
+    assert metrics.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE meterease_stage_duration_seconds histogram" in metrics.text
+    assert sample(metrics.text, "meterease_stage_duration_seconds_count", stage="upload_read") == before + 1
+    assert sample(metrics.text, "meterease_stage_duration_seconds_bucket", stage="upload_read", le="+Inf") >= before + 1
+
+
+def test_login_stages_show_in_server_timing_and_metrics(auth_client, signup):
+    mobile_number, password, _ = signup()
+
+    response = auth_client.post("/token", data={"username": mobile_number, "password": password})
+
+    assert response.status_code == 200
+    assert {"authenticate_user", "user_lookup", "password_verify", "total"} <= server_timing(response).keys()
+    metrics = auth_client.get("/metrics").text
+    assert sample(metrics, "meterease_stage_duration_seconds_count", stage="password_verify") >= 1
+    assert "# TYPE meterease_token_refreshes counter" in metrics
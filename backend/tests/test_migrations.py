@@ -0,0 +1,102 @@
+import multiprocessing
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from database import connect
+from migrations import current_version, migrate
+
+
+def create_readings(cursor):
+    # Not idempotent on purpose: applying it twice fails
+    cursor.execute("CREATE TABLE readings (id INTEGER PRIMARY KEY, value TEXT)")
+
+
+def add_unit(cursor):
+    cursor.execute("ALTER TABLE readings ADD COLUMN unit TEXT")
+
+
+MIGRATIONS = [(1, "readings", create_readings), (2, "readings.unit", add_unit)]
+
+
+def versions(database):
+    with sqlite3.connect(database) as conn:
+        return [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+
+
+def columns(database, table):
+    with sqlite3.connect(database) as conn:
+        return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def test_applies_pending_migrations_once(tmp_path):
+    database = str(tmp_path / "test.db")
+
+    assert migrate(database, MIGRATIONS[:1]) == [1]
+    assert migrate(database, MIGRATIONS) == [2]
+    assert migrate(database, MIGRATIONS) == []
+    assert versions(database) == [1, 2]
+    assert columns(database, "readings") == ["id", "value", "unit"]
+
+
+def test_failing_migration_leaves_the_schema_as_it_was(tmp_path):
+    database = str(tmp_path / "test.db")
+
+    def broken(cursor):
+        raise sqlite3.OperationalError("broken migration")
+
+    with pytest.raises(sqlite3.OperationalError):
+        migrate(database, MIGRATIONS + [(3, "broken", broken)])
+
+    conn = connect(database)
+    assert current_version(conn) == 0
+    conn.close()
+    assert columns(database, "readings") == []
+
+
+def test_rechecks_the_version_once_it_has_the_lock(tmp_path):
+    database = str(tmp_path / "test.db")
+    holder = connect(database, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+
+    # Sees version 0 without the lock, then waits for it
+    result = {}
+    waiter = threading.Thread(target=lambda: result.update(applied=migrate(database, MIGRATIONS)))
+    waiter.start()
+    time.sleep(0.3)
+
+    # Meanwhile another process brings the schema up to date
+    holder.execute("CREATE TABLE schema_version (version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at INTEGER NOT NULL)")
+    for version, description, fn in MIGRATIONS:
+        fn(holder.cursor())
+        holder.execute("INSERT INTO schema_version VALUES (?, ?, ?)", (version, description, int(time.time())))
+    holder.execute("COMMIT")
+    holder.close()
+
+    waiter.join(10)
+    assert result == {"applied": []}
+    assert versions(database) == [1, 2]
+
+
+def boot(database, barrier, results):
+    barrier.wait()
+    results.put(migrate(database, MIGRATIONS))
+
+
+def test_concurrent_workers_migrate_once(tmp_path):
+    database = str(tmp_path / "test.db")
+    context = multiprocessing.get_context("fork")
+    workers = 6
+    barrier, results = context.Barrier(workers), context.Queue()
+
+    processes = [context.Process(target=boot, args=(database, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    applied = sorted(results.get(timeout=30) for _ in processes)
+    for process in processes:
+        process.join()
+
+    assert applied == [[]] * (workers - 1) + [[1, 2]]
+    assert versions(database) == [1, 2]
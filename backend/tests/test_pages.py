@@ -0,0 +1,36 @@
+import pytest
+
+from pages import HISTORY_PAGE, UPLOAD_PAGE
+
+
+@pytest.mark.parametrize("path, page", [("/upload", UPLOAD_PAGE), ("/history-page", HISTORY_PAGE)])
+def test_static_pages_are_served_precompressed(client, path, page):
+    response = client.get(path, headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == page.etags["gzip"]
+    assert "Accept-Encoding" in response.headers["vary"]
+    # Compressed once, by the page rather than again by CompressionMiddleware
+    assert response.content == page.variants["identity"]
+
+
+def test_static_page_revalidates_with_a_304(client):
+    etag = client.get("/upload", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+
+    response = client.get("/upload", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_each_encoding_has_its_own_etag(client):
+    gzip_etag = client.get("/upload", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+
+    response = client.get("/upload", headers={"Accept-Encoding": "identity", "If-None-Match": gzip_etag})
+
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == UPLOAD_PAGE.etags["identity"]
+    assert response.content == UPLOAD_PAGE.variants["identity"]
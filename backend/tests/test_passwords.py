@@ -0,0 +1,61 @@
+import asyncio
+import threading
+
+import pytest
+from starlette.exceptions import HTTPException
+
+import passwords
+from passwords import build_context, hash_password, verify_password
+
+
+@pytest.fixture
+def thread_pool(monkeypatch):
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_EXECUTOR", "thread")
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_WORKERS", 1)
+    monkeypatch.setattr(passwords, "_executor", None)
+    monkeypatch.setattr(passwords, "_pending", 0)
+    yield
+    passwords.shutdown_executor()
+
+
+@pytest.fixture
+def cheap_policy(monkeypatch):
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_EXECUTOR", "inline")
+    monkeypatch.setattr(passwords, "pwd_context", build_context(["sha256_crypt"], 1000))
+
+
+def test_full_hash_queue_turns_requests_away(thread_pool, monkeypatch):
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_MAX_PENDING", 1)
+    release = threading.Event()
+    monkeypatch.setattr(passwords, "_hash", lambda password: release.wait(5) and "hashed")
+
+    async def scenario():
+        first = asyncio.ensure_future(hash_password("first"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as rejected:
+            await hash_password("second")
+        release.set()
+        return rejected.value, await first
+
+    rejected, first = asyncio.run(scenario())
+    assert rejected.status_code == 503
+    assert rejected.headers == {"Retry-After": "1"}
+    assert first == "hashed"
+    assert passwords._pending == 0
+
+
+def test_hash_and_verify(cheap_policy):
+    hashed = asyncio.run(hash_password("secret"))
+    assert asyncio.run(verify_password("secret", hashed)) == (True, None)
+    assert asyncio.run(verify_password("wrong", hashed)) == (False, None)
+
+
+def test_hash_from_an_older_policy_is_replaced_on_login(cheap_policy):
+    old_hash = build_context(["sha256_crypt"], 2000).hash("secret")
+
+    verified, new_hash = asyncio.run(verify_password("secret", old_hash))
+
+    assert verified
+    assert new_hash is not None and new_hash != old_hash
+    assert passwords.pwd_context.verify("secret", new_hash)
+    assert not passwords.pwd_context.needs_update(new_hash)
@@ -0,0 +1,31 @@
+import pytest
+
+import pipeline
+
+
+class NoDigitsBackend:
+    model_version = "test/none"
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict_batch(self, images):
+        self.calls += 1
+        return [[] for _ in images]
+
+
+def test_warm_up_accepts_a_model_that_finds_nothing(monkeypatch):
+    backend = NoDigitsBackend()
+    monkeypatch.setattr(pipeline, "get_backend", lambda: backend)
+    pipeline.warm_up()
+    assert backend.calls == 1
+
+
+def test_warm_up_fails_when_inference_fails(monkeypatch):
+    class BrokenBackend:
+        def predict_batch(self, images):
+            raise RuntimeError("model host unreachable")
+
+    monkeypatch.setattr(pipeline, "get_backend", BrokenBackend)
+    with pytest.raises(RuntimeError, match="model host unreachable"):
+        pipeline.warm_up()
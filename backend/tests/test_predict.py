@@ -0,0 +1,112 @@
+import base64
+import email
+import json
+import os
+import time
+
+
+def predict(client, content, params=None, **data):
+    return client.post(
+        "/predict", params=params, files={"current_image": ("meter.jpg", content, "image/jpeg")}, data=data
+    )
+
+
+def test_predict_reads_the_meter(client, app_module, meter_photo, monkeypatch):
+    monkeypatch.setattr(app_module.backend, "reading", "01234")
+
+    response = predict(client, meter_photo(100), previous_meter_reading="1200")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["current"]["meter_reading"] == "01234"
+    assert body["current"]["valid"] is True
+    assert body["current"]["digit_confidences"] == [0.9] * 5
+    assert body["current"]["processed_image_base64"]
+    assert body["consumption"] == 1234 - 1200
+    assert client.get(body["current"]["original_image_url"]).status_code == 200
+
+
+def test_predict_without_detections_returns_an_empty_reading(client, app_module, meter_photo, monkeypatch):
+    monkeypatch.setattr(app_module.backend, "predict", lambda image: [])
+
+    response = predict(client, meter_photo(150))
+
+    assert response.status_code == 200
+    current = response.json()["current"]
+    assert current["meter_reading"] == ""
+    assert current["digit_confidences"] == []
+    assert current["valid"] is False
+
+
+def stored_files(root):
+    return {os.path.join(directory, name) for directory, _, names in os.walk(root) for name in names}
+
+
+def test_predict_rejects_an_invalid_image(client, app_module):
+    before = stored_files(app_module.image_store.root)
+
+    response = predict(client, b"not an image")
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid current image format"
+    # The rejected upload isn't left behind in the public image store
+    assert stored_files(app_module.image_store.root) == before
+
+
+def test_urls_mode_leaves_the_image_out_of_the_body(client, meter_photo):
+    response = predict(client, meter_photo(), params={"response_mode": "urls"})
+
+    assert response.status_code == 200
+    current = response.json()["current"]
+    assert "processed_image_base64" not in current
+    image = client.get(current["processed_image_url"])
+    assert image.status_code == 200
+    assert image.headers["content-type"] == "image/jpeg"
+
+
+def test_full_mode_inlines_the_annotated_jpeg(client, meter_photo):
+    response = predict(client, meter_photo(), params={"response_mode": "full"})
+
+    assert response.status_code == 200
+    assert base64.b64decode(response.json()["current"]["processed_image_base64"]).startswith(b"\xff\xd8")
+
+
+def test_multipart_mode_sends_the_json_then_the_jpeg(client, meter_photo):
+    # Asking for multipart/mixed in Accept selects it without response_mode
+    response = client.post(
+        "/predict",
+        files={"current_image": ("meter.jpg", meter_photo(), "image/jpeg")},
+        headers={"Accept": "multipart/mixed"},
+    )
+
+    assert response.status_code == 200
+    message = email.message_from_bytes(
+        f"Content-Type: {response.headers['content-type']}\r\n\r\n".encode("ascii") + response.content
+    )
+    result, image = message.get_payload()
+    body = json.loads(result.get_payload(decode=True))
+    assert "processed_image_base64" not in body["current"]
+    assert image.get_content_type() == "image/jpeg"
+    assert image.get_filename() == f"{body['image_id']}_current_result.jpg"
+    assert image.get_payload(decode=True).startswith(b"\xff\xd8")
+
+
+def test_async_mode_queues_a_job_with_a_urls_result(client, meter_photo):
+    response = predict(client, meter_photo(), params={"async_mode": "true"}, previous_meter_reading="10")
+
+    assert response.status_code == 202
+    status_url = response.json()["status_url"]
+    for _ in range(100):
+        job = client.get(status_url).json()
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "done", job
+    assert job["result"]["previous"]["meter_reading"] == 10.0
+    assert "processed_image_base64" not in job["result"]["current"]
+
+
+def test_predict_rejects_an_unknown_response_mode(client, meter_photo):
+    response = predict(client, meter_photo(), params={"response_mode": "xml"})
+
+    assert response.status_code == 400
@@ -0,0 +1,65 @@
+import time
+
+import main
+
+
+def refresh(client, refresh_token):
+    return client.post("/token/refresh", json={"refresh_token": refresh_token})
+
+
+def test_refresh_rotates_the_token(auth_client, signup):
+    _, _, tokens = signup()
+
+    response = refresh(auth_client, tokens["refresh_token"])
+
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    assert auth_client.get("/users/me", headers={"Authorization": f"Bearer {rotated['access_token']}"}).status_code == 200
+    assert refresh(auth_client, rotated["refresh_token"]).status_code == 200
+
+
+def test_reusing_a_rotated_token_revokes_its_family(auth_client, signup):
+    mobile_number, password, tokens = signup()
+    other_login = auth_client.post("/token", data={"username": mobile_number, "password": password}).json()
+    latest = refresh(auth_client, tokens["refresh_token"]).json()["refresh_token"]
+
+    # The first token is replayed, e.g. by someone who stole it before it was rotated
+    reused = refresh(auth_client, tokens["refresh_token"])
+    assert reused.status_code == 401
+    assert reused.json()["detail"] == "Refresh token already used; please log in again"
+
+    # Which also logs out whoever holds the latest token of that login
+    assert refresh(auth_client, latest).status_code == 401
+    # Tokens from other logins are unaffected
+    assert refresh(auth_client, other_login["refresh_token"]).status_code == 200
+
+
+def test_tokens_are_only_good_for_their_own_use(auth_client, signup):
+    _, _, tokens = signup()
+    assert refresh(auth_client, tokens["access_token"]).status_code == 401
+    assert auth_client.get("/users/me", headers={"Authorization": f"Bearer {tokens['refresh_token']}"}).status_code == 401
+    assert refresh(auth_client, "not a token").status_code == 401
+
+
+def test_only_token_hashes_are_stored(auth_client, signup):
+    _, _, tokens = signup()
+    with main.get_db() as conn:
+        stored = [row["token_hash"] for row in conn.execute("SELECT token_hash FROM refresh_tokens")]
+    assert main.refresh_token_hash(tokens["refresh_token"]) in stored
+    assert tokens["refresh_token"] not in stored
+
+
+def test_expired_token_cannot_be_rotated_and_is_purged(auth_client, signup):
+    _, _, tokens = signup()
+    with main.get_db() as conn:
+        conn.execute(
+            "UPDATE refresh_tokens SET expires_at = ? WHERE token_hash = ?",
+            (int(time.time()) - 1, main.refresh_token_hash(tokens["refresh_token"]))
+        )
+        conn.commit()
+
+    assert refresh(auth_client, tokens["refresh_token"]).status_code == 401
+    assert main.purge_expired_refresh_tokens(batch_size=1) >= 1
+    with main.get_db() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM refresh_tokens WHERE expires_at <= ?", (int(time.time()),)).fetchone()[0] == 0
@@ -0,0 +1,40 @@
+import asyncio
+import os
+import time
+
+from result_cache import ResultCache
+
+
+def cache_file(cache, key, written, read=None):
+    path = os.path.join(cache.cache_dir, f"{key}.json")
+    with open(path, "w") as f:
+        f.write('{"meter_reading": "01234", "detections": [], "created_at": %f}' % written)
+    os.utime(path, (read or written, written))
+    return path
+
+
+def test_sweep_removes_expired_then_least_recently_read_files(tmp_path):
+    cache = ResultCache(ttl_seconds=3600, cache_dir=str(tmp_path), disk_max_bytes=0)
+    now = time.time()
+    expired = cache_file(cache, "expired", now - 7200)
+    read_long_ago = cache_file(cache, "read-long-ago", now - 60, now - 50)
+    read_recently = cache_file(cache, "read-recently", now - 120, now - 5)
+    cache.disk_max_bytes = os.path.getsize(read_recently)
+
+    assert cache.sweep_disk() == 2
+    assert not os.path.exists(expired)
+    assert not os.path.exists(read_long_ago)
+    assert os.path.exists(read_recently)
+    assert cache.stats()["disk_evictions"] == 1
+
+
+def test_disk_hit_counts_as_a_read_for_eviction(tmp_path):
+    cache = ResultCache(ttl_seconds=3600, cache_dir=str(tmp_path))
+    written = time.time() - 60
+    path = cache_file(cache, "key", written)
+
+    entry = asyncio.run(cache.get("key"))
+
+    assert entry["meter_reading"] == "01234"
+    assert os.stat(path).st_atime > written + 30
+    assert abs(os.stat(path).st_mtime - written) < 1
@@ -0,0 +1,68 @@
+import pytest
+
+from tariff import NEW_SUBSIDY, as_units, compute_bill, compute_bills
+
+# (units, energy charges, CC subsidy, net current charges, amount payable), as calculated by
+# calculateElectricityBill() in static/bill-calculator.js: both sides of every slab edge, of the
+# switch to the upper schedule above 500 units and of every CC subsidy tier
+BILLS = [
+    (0, 0, 255, -255, -735),
+    (100, 0, 255, -255, -735),
+    (100.5, 1, 255, -254, -734),
+    (101, 2, 255, -253, -733),
+    (200, 235, 255, -20, -500),
+    (201, 240, 255, -15, -495),
+    (300, 705, 255, 450, -30),
+    (301, 710, 280, 430, -50),
+    (400, 1175, 280, 895, 415),
+    (401, 1181, 280, 901, 421),
+    (500, 1805, 280, 1525, 1045),
+    (501, 2048, 255, 1793, 1313),
+    (600, 2880, 255, 2625, 2145),
+    (601, 2889, 255, 2634, 2154),
+    (700, 3825, 255, 3570, 3090),
+    (701, 3834, 80, 3754, 3274),
+    (800, 4770, 80, 4690, 4210),
+    (801, 4781, 80, 4701, 4221),
+    (1000, 6870, 80, 6790, 6310),
+    (1001, 6882, 80, 6802, 6322),
+    (1500, 12645, 80, 12565, 12085),
+]
+
+
+@pytest.mark.parametrize("units, energy_charges, cc_subsidy, net_current_charges, final_bill_amount", BILLS)
+def test_compute_bill_matches_the_js_calculator(units, energy_charges, cc_subsidy, net_current_charges, final_bill_amount):
+    bill = compute_bill(units)
+    assert bill["energy_charges"] == energy_charges
+    assert bill["cc_subsidy"] == cc_subsidy
+    assert bill["net_current_charges"] == net_current_charges
+    assert bill["new_subsidy"] == NEW_SUBSIDY == 480
+    assert bill["final_bill_amount"] == final_bill_amount
+
+
+def test_compute_bills_matches_compute_bill():
+    bills = compute_bills([units for units, *_ in BILLS])
+    assert bills["energy_charges"].tolist() == [row[1] for row in BILLS]
+    assert bills["cc_subsidy"].tolist() == [row[2] for row in BILLS]
+    assert bills["net_current_charges"].tolist() == [row[3] for row in BILLS]
+    assert bills["new_subsidy"].tolist() == [NEW_SUBSIDY] * len(BILLS)
+    assert bills["final_bill_amount"].tolist() == [row[4] for row in BILLS]
+
+
+def test_slab_breakdown_on_the_entry_schedule():
+    slabs = [(s["from_unit"], s["to_unit"], s["rate"], s["units"]) for s in compute_bill(250)["slab_charges"]]
+    assert slabs == [(1, 100, 0.0, 100.0), (101, 200, 2.35, 100.0), (201, 400, 4.7, 50.0)]
+
+
+def test_slab_breakdown_on_the_upper_schedule():
+    slabs = [(s["from_unit"], s["to_unit"], s["rate"], s["units"]) for s in compute_bill(1200)["slab_charges"]]
+    assert slabs == [
+        (1, 100, 0.0, 100.0), (101, 400, 4.7, 300.0), (401, 500, 6.3, 100.0), (501, 600, 8.4, 100.0),
+        (601, 800, 9.45, 200.0), (801, 1000, 10.5, 200.0), (1001, 5000, 11.55, 200.0),
+    ]
+
+
+@pytest.mark.parametrize("values", [[-1], [float("nan")], [[1, 2]], ["100"], [True, 5], [False], [1e308]])
+def test_as_units_rejects_bad_values(values):
+    with pytest.raises(ValueError):
+        as_units(values)
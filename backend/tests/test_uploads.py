@@ -0,0 +1,48 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from uploads import MAX_UPLOAD_BYTES, MULTIPART_OVERHEAD_BYTES, UploadLimitMiddleware
+
+
+def test_declared_oversized_upload_is_refused_before_reading(client):
+    limit = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+
+    # Only the declared length is over the limit; the body itself is never read
+    response = client.post("/predict", content=b"x" * 16, headers={
+        "Content-Type": "multipart/form-data; boundary=x",
+        "Content-Length": str(limit + 1),
+        "Origin": "http://localhost:3000",
+    })
+
+    assert response.status_code == 413
+    assert response.json()["detail"] == f"Request body exceeds the {limit} byte limit"
+    # Added before CORSMiddleware, so browsers can still read the 413
+    assert response.headers["access-control-allow-origin"]
+
+
+def test_streamed_body_is_cut_off_at_the_limit():
+    small = FastAPI()
+    small.add_middleware(UploadLimitMiddleware, max_bytes=100)
+
+    @small.post("/echo")
+    async def echo(request: Request):
+        return {"size": len(await request.body())}
+
+    with TestClient(small) as client:
+        def chunks(count):
+            for _ in range(count):
+                yield b"x" * 30
+
+        # A generator body has no Content-Length, so only the running count can catch it
+        assert client.post("/echo", content=chunks(3)).json() == {"size": 90}
+        assert client.post("/echo", content=chunks(4)).status_code == 413
+
+
+def test_file_over_the_per_image_limit_is_a_413(client, app_module, meter_photo, monkeypatch):
+    content = meter_photo()
+    monkeypatch.setattr(app_module, "MAX_UPLOAD_BYTES", len(content) - 1)
+
+    response = client.post("/predict", files={"current_image": ("meter.jpg", content, "image/jpeg")})
+
+    assert response.status_code == 413
+    assert response.json()["detail"] == f"Upload exceeds the {len(content) - 1} byte limit"
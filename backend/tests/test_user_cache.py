@@ -0,0 +1,64 @@
+import main
+import passwords
+from user_cache import UserCache
+
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("user_cache.time.monotonic", lambda: clock[0])
+    cache = UserCache(max_entries=10, ttl_seconds=60)
+    cache.put("9000000000", "user")
+
+    clock[0] += 59
+    assert cache.get("9000000000") == "user"
+    clock[0] += 2
+    assert cache.get("9000000000") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = UserCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.evictions == 1
+
+
+def test_invalidate_forgets_the_user():
+    cache = UserCache()
+    cache.put("a", 1)
+    cache.invalidate("a")
+    cache.invalidate("never cached")
+    assert cache.get("a") is None
+
+
+def test_authenticated_requests_are_served_from_the_cache(auth_client, signup):
+    mobile_number, _, tokens = signup()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    hits, misses = main.user_cache.hits, main.user_cache.misses
+
+    assert auth_client.get("/users/me", headers=headers).status_code == 200
+    assert auth_client.get("/users/me", headers=headers).status_code == 200
+    assert (main.user_cache.hits - hits, main.user_cache.misses - misses) == (1, 1)
+
+    assert main.user_cache._entries.get(mobile_number)
+
+
+def test_changing_a_user_row_invalidates_its_cache_entry(auth_client, signup, monkeypatch):
+    mobile_number, password, tokens = signup()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert auth_client.get("/users/me", headers=headers).status_code == 200
+    assert main.user_cache._entries.get(mobile_number)
+
+    # A new hashing policy makes the next login rewrite the stored hash
+    monkeypatch.setattr(passwords, "pwd_context", passwords.build_context(["sha256_crypt"], 2000))
+    assert auth_client.post("/token", data={"username": mobile_number, "password": password}).status_code == 200
+
+    assert mobile_number not in main.user_cache._entries
+    misses = main.user_cache.misses
+    assert auth_client.get("/users/me", headers=headers).status_code == 200
+    assert main.user_cache.misses == misses + 1
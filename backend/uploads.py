@@ -0,0 +1,94 @@
+import os
+
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+# Upload limits
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_BATCH_UPLOAD_BYTES = int(os.environ.get("MAX_BATCH_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Allowance for multipart boundaries, part headers and small form fields around a file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+BODY_METHODS = {"POST", "PUT", "PATCH"}
+
+
+def _too_large(max_bytes, what="Upload"):
+    return HTTPException(status_code=413, detail=f"{what} exceeds the {max_bytes} byte limit")
+
+
+class UploadLimitMiddleware:
+    """
+    Rejects oversized request bodies before they are buffered.
+
+    A declared Content-Length over the limit is answered with 413 without
+    reading the body. Otherwise the body is counted as it arrives and the
+    request fails with 413 as soon as it passes the limit, so a chunked or
+    lying client can't make the form parser spool more than max_bytes.
+    limits maps paths to their own limit.
+    """
+
+    def __init__(self, app, max_bytes=MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES, limits=None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.limits = limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in BODY_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.limits.get(scope["path"], self.max_bytes)
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > max_bytes:
+                response = JSONResponse(status_code=413, content={"detail": _too_large(max_bytes, "Request body").detail})
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    # Raised into the body parser; FastAPI passes HTTPExceptions through as responses
+                    raise _too_large(max_bytes, "Request body")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _read_into_buffer(file, max_bytes, hasher):
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    if size > max_bytes:
+        raise _too_large(max_bytes)
+
+    # One buffer of the final size, filled in place chunk by chunk
+    buffer = bytearray(size)
+    with memoryview(buffer) as view:
+        offset = 0
+        while offset < size:
+            count = file.readinto(view[offset:offset + UPLOAD_CHUNK_SIZE])
+            if not count:
+                break
+            if hasher is not None:
+                hasher.update(view[offset:offset + count])
+            offset += count
+
+    return buffer if offset == size else buffer[:offset]
+
+
+async def read_upload(upload, max_bytes=MAX_UPLOAD_BYTES, hasher=None):
+    """
+    Read an UploadFile into a single bytearray, UPLOAD_CHUNK_SIZE at a time, feeding each chunk
+    to hasher when one is given. Raises a 413 HTTPException for files over max_bytes.
+    The buffer can go to np.frombuffer() as is, without another copy.
+    """
+    # The spooled file may be on disk, so read it off the event loop in one go
+    return await run_in_threadpool(_read_into_buffer, upload.file, max_bytes, hasher)
@@ -0,0 +1,76 @@
+import os
+import time
+from collections import OrderedDict
+
+from metrics import Counter
+
+# User cache configuration
+USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", "60"))
+
+USER_CACHE_LOOKUPS = Counter("meterease_user_cache_lookups", "User cache lookups by result", ["result"])
+USER_CACHE_EVICTIONS = Counter("meterease_user_cache_evictions", "Users evicted from the cache to stay under its size limit")
+
+
+class UserCache:
+    """
+    Users keyed by mobile number, so authenticated requests don't need a database round trip.
+
+    An LRU of at most max_entries users, each kept for ttl_seconds. Code that changes a user row
+    must call invalidate(); the TTL bounds how stale other worker processes, which keep their
+    own cache, can be.
+    """
+
+    def __init__(self, max_entries=USER_CACHE_MAX_ENTRIES, ttl_seconds=USER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, mobile_number):
+        """Return the cached user, or None"""
+        entry = self._entries.get(mobile_number)
+        if entry is not None and time.monotonic() - entry[1] > self.ttl_seconds:
+            del self._entries[mobile_number]
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            USER_CACHE_LOOKUPS.inc(result="miss")
+            return None
+
+        self._entries.move_to_end(mobile_number)
+        self.hits += 1
+        USER_CACHE_LOOKUPS.inc(result="hit")
+        return entry[0]
+
+    def put(self, mobile_number, user):
+        self._entries[mobile_number] = (user, time.monotonic())
+        self._entries.move_to_end(mobile_number)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            USER_CACHE_EVICTIONS.inc()
+
+    def invalidate(self, mobile_number):
+        """Forget a user whose row changed"""
+        self._entries.pop(mobile_number, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters and size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
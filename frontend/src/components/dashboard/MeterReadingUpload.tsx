@@ -126,7 +126,7 @@ const MeterReadingUpload = ({ onReadingSuccess }: MeterReadingUploadProps) => {
         formData.append("current_image", imageFileOrData);
       }
 
-      const response = await fetch("http://127.0.0.1:8000/predict", {
+      const response = await fetch("http://127.0.0.1:8000/predict?response_mode=urls", {
         method: "POST",
         body: formData,
       });